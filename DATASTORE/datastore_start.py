@@ -0,0 +1,79 @@
+import json
+import logging
+import os
+import signal
+import sys
+import time
+from threading import Timer
+import paho.mqtt.client as mqtt
+from ts_store import READING_FIELDS, TimeSeriesStore, message_readings
+from query_api import QueryEngine, start_http_server
+
+
+def on_connect(mqtt_client, userdata, flags, rc):
+    if rc == 0:
+        # Subscribe here so the subscriptions are renewed on reconnection.
+        for topic in userdata['topics']:
+            mqtt_client.subscribe(topic, 1)
+    else:
+        logging.info("MQTT Connection failed")
+
+
+def on_message(mqtt_client, userdata, msg):
+    arrival = time.time()
+    try:
+        data = json.loads(msg.payload)
+    except ValueError:
+        return
+    if not isinstance(data, dict):
+        return
+    timestamp = data.get('time', arrival)
+    for field, value in message_readings(data, userdata['fields']):
+        userdata['store'].append(msg.topic, field, timestamp, value)
+
+
+def flush_loop(store, interval):
+    try:
+        store.flush()
+    except OSError as error:
+        logging.warning('Store flush failed: %s', error)
+    timer = Timer(interval, flush_loop, [store, interval])
+    timer.daemon = True
+    timer.start()
+
+
+def shutdown(signum, frame):
+    store.flush(force=True)
+    sys.exit(0)
+
+
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO'))
+
+if os.getenv('STORE_ENABLE', 'false') == 'true':
+    budget = float(os.getenv('STORE_DISK_BUDGET_MB', 0))
+    store = TimeSeriesStore(
+        os.getenv('STORE_DIR', '/data/store'),
+        block_samples=int(os.getenv('STORE_BLOCK_SAMPLES', 600)),
+        flush_interval=float(os.getenv('STORE_FLUSH_INTERVAL', 600)),
+        disk_budget=int(budget * 1024 * 1024) or None)
+    signal.signal(signal.SIGTERM, shutdown)
+    query_port = int(os.getenv('QUERY_PORT', 8081))
+    if query_port:
+        start_http_server(query_port, QueryEngine(store))
+
+    time.sleep(15)  # allow time for networking to be established
+    userdata = {'store': store,
+                'topics': os.getenv('STORE_TOPICS', '#').split(','),
+                # e.g. the readings of sensors added through entry points.
+                'fields': READING_FIELDS.union(
+                    field.strip() for field in
+                    os.getenv('STORE_FIELDS', '').split(',') if field.strip())}
+    client = mqtt.Client(client_id='datastore', userdata=userdata)
+    client.on_connect = on_connect  # attach function to callback
+    client.on_message = on_message  # attach function to callback
+    client.connect(os.getenv('MQTT_BROKER', 'localhost'))  # connect to broker
+    client.loop_start()  # start the loop
+    flush_loop(store, 60)
+
+    while True:
+        time.sleep(1)
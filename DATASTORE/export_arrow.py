@@ -0,0 +1,271 @@
+"""Bulk export of the stored readings to partitioned Parquet or Arrow files.
+
+Reads the raw day partitions of the store, or decoded messages one JSON
+object per line (e.g. a capture replayed with replay.py --echo), and writes
+a file per UTC day:
+
+<out>/date=<YYYY-MM-DD>/readings.parquet
+
+Each file holds one table with a row per sensor and reading time: 'time'
+(timestamp in ms, UTC), 'sensor' (the MQTT topic, dictionary encoded) and a
+column per reading field, null where the sensor has no such reading. Wind
+directions are int16 and the other readings float32, half the size of the
+float64 values in the store and well within the sensors' resolution. Each
+day is read from the store's compressed blocks into arrays and written as
+one table, so a month of 1 Hz data exports in seconds, e.g.
+
+python export_arrow.py /data/export --start 2026-09-01 --end 2026-09-30
+python replay.py /data/capture/ttyUSB0.cap --sensor ptu300 --speed 0 \\
+    --echo --start 1760000000 | \\
+    python export_arrow.py /data/export --messages - --sensor metpod/ptu300
+
+pyarrow is only needed by this tool, so it is not installed in the
+container; install it where the export is run.
+"""
+import argparse
+import array
+import json
+import os
+import sys
+import time
+import ts_store
+
+try:
+    import pyarrow
+    import pyarrow.compute
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    # Checked by main(), so the readers can be used without it.
+    pyarrow = None
+
+# Reading fields exported as int16, the others are float32.
+INT16_FIELDS = ('winddir', 'winddir10m')
+FORMATS = ('parquet', 'arrow')
+DAY_MS = 86400000
+
+
+def store_days(root, start=None, end=None):
+    """Return the days of the raw partitions of a store.
+    :param root: The store directory.
+    :param start: First day as YYYY-MM-DD, or None for the oldest.
+    :param end: Last day as YYYY-MM-DD, or None for the newest.
+    :return: The days in ascending order.
+    """
+    directory = os.path.join(root, ts_store.RAW)
+    if not os.path.isdir(directory):
+        return []
+    return [day for day in sorted(os.listdir(directory))
+            if (start is None or day >= start) and
+            (end is None or day <= end)]
+
+
+def read_store_day(root, day, topics=None):
+    """Read the raw readings of one day partition of a store.
+    :param root: The store directory.
+    :param day: The day as YYYY-MM-DD.
+    :param topics: Topics to read, or None for all.
+    :return: A {topic: {field: (times, values)}} dict, the times being an
+    array of UNIX times in ms and the values an array of floats.
+    """
+    readings = {}
+    directory = os.path.join(root, ts_store.RAW, day)
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith('.blk'):
+            continue
+        topic, field = ts_store.parse_series_name(name)
+        if topics and topic not in topics:
+            continue
+        with open(os.path.join(directory, name), 'rb') as series_file:
+            content = series_file.read()
+        times = array.array('q')
+        values = array.array('d')
+        for first, last, offsets, columns in \
+                ts_store.decode_block_arrays(content):
+            base = int(round(first * 1000))
+            times.extend([base + milliseconds for milliseconds in offsets])
+            values.extend(columns[0])
+        readings.setdefault(topic, {})[field] = (times, values)
+    return readings
+
+
+def read_messages(lines, sensor):
+    """Read decoded messages, one JSON object per line, a day at a time.
+    Lines that are not messages with a 'time' are skipped.
+    :param lines: An iterable of lines.
+    :param sensor: The sensor id (topic) of the messages.
+    :return: A generator of (day, {sensor: {field: (times, values)}}) as
+    read_store_day, each time the day of the messages changes.
+    """
+    day = None
+    day_start = day_end = 0
+    readings = {}
+    for line in lines:
+        try:
+            data = json.loads(line)
+        except ValueError:
+            continue
+        if not isinstance(data, dict) or \
+                not isinstance(data.get('time'), (int, float)):
+            continue
+        milliseconds = int(round(data['time'] * 1000))
+        if not day_start <= milliseconds < day_end:
+            if readings:
+                yield day, {sensor: readings}
+            day = ts_store.day_partition(data['time'])
+            day_start = milliseconds - milliseconds % DAY_MS
+            day_end = day_start + DAY_MS
+            readings = {}
+        for field, value in ts_store.message_readings(data):
+            series = readings.get(field)
+            if series is None:
+                series = readings[field] = (array.array('q'),
+                                            array.array('d'))
+            series[0].append(milliseconds)
+            series[1].append(value)
+    if readings:
+        yield day, {sensor: readings}
+
+
+def column_type(field):
+    return pyarrow.int16() if field in INT16_FIELDS else pyarrow.float32()
+
+
+def arrow_array(values, arrow_type):
+    """Return an Arrow array sharing the memory of an array.array."""
+    return pyarrow.Array.from_buffers(
+        arrow_type, len(values), [None, pyarrow.py_buffer(values)])
+
+
+def sensor_table(fields):
+    """Return a table of one sensor's readings, with a row per time.
+    :param fields: A {field: (times, values)} dict.
+    :return: The table with a 'time' column and a float64 column per field.
+    """
+    table = None
+    for field, (times, values) in sorted(fields.items()):
+        column = pyarrow.table(
+            {'time': arrow_array(times, pyarrow.int64()),
+             field: arrow_array(values, pyarrow.float64())})
+        if table is None:
+            table = column
+        elif column.column('time').equals(table.column('time')):
+            # The fields of one message share its time, so this is usual.
+            table = table.append_column(field, column.column(field))
+        else:
+            table = table.join(column, 'time', join_type='full outer')
+    return table.sort_by('time')
+
+
+def day_table(readings):
+    """Return the table of a day's readings of all sensors.
+    :param readings: A {sensor: {field: (times, values)}} dict.
+    :return: The table, sorted by sensor and time.
+    """
+    sensors = sorted(readings)
+    fields = sorted(set(field for sensor in sensors
+                        for field in readings[sensor]))
+    schema = pyarrow.schema(
+        [('time', pyarrow.timestamp('ms', tz='UTC')),
+         ('sensor', pyarrow.dictionary(pyarrow.int16(), pyarrow.string()))] +
+        [(field, column_type(field)) for field in fields])
+    dictionary = pyarrow.array(sensors, pyarrow.string())
+    tables = []
+    for index, sensor in enumerate(sensors):
+        table = sensor_table(readings[sensor])
+        rows = len(table)
+        columns = [table.column('time').cast(schema.field('time').type),
+                   pyarrow.DictionaryArray.from_arrays(
+                       pyarrow.repeat(pyarrow.scalar(index, pyarrow.int16()),
+                                      rows), dictionary)]
+        for field in fields:
+            arrow_type = column_type(field)
+            if field not in table.column_names:
+                columns.append(pyarrow.nulls(rows, arrow_type))
+            elif arrow_type == pyarrow.int16():
+                columns.append(pyarrow.compute.round(
+                    table.column(field)).cast(arrow_type))
+            else:
+                columns.append(table.column(field).cast(arrow_type))
+        tables.append(pyarrow.Table.from_arrays(columns, schema=schema))
+    return pyarrow.concat_tables(tables)
+
+
+def write_day(table, out, day, file_format='parquet', compression='zstd',
+              part=0):
+    """Write a day's table to its partition of the output directory.
+    :param table: The day_table.
+    :param out: The output directory.
+    :param day: The day as YYYY-MM-DD.
+    :param file_format: 'parquet' or 'arrow' (Arrow IPC file).
+    :param compression: e.g. 'zstd', 'lz4' or 'none'.
+    :param part: Part number, for a day written in more than one part.
+    :return: The path written.
+    """
+    directory = os.path.join(out, 'date=' + day)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, 'readings%s.%s' % (
+        '-' + str(part) if part else '', file_format))
+    if file_format == 'parquet':
+        pyarrow.parquet.write_table(table, path, compression=compression,
+                                    row_group_size=1048576)
+    else:
+        options = pyarrow.ipc.IpcWriteOptions(
+            compression=None if compression == 'none' else compression)
+        with pyarrow.ipc.new_file(path, table.schema,
+                                  options=options) as writer:
+            writer.write_table(table)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('out', help='output directory')
+    parser.add_argument('--store', default=os.getenv('STORE_DIR',
+                                                     '/data/store'))
+    parser.add_argument('--messages',
+                        help="file of decoded messages, one JSON object per "
+                             "line, or '-' for stdin, instead of the store")
+    parser.add_argument('--sensor', default='replay',
+                        help='sensor id of the messages')
+    parser.add_argument('--start', help='first day to export, YYYY-MM-DD')
+    parser.add_argument('--end', help='last day to export, YYYY-MM-DD')
+    parser.add_argument('--topics',
+                        help='comma separated topics to export, default all')
+    parser.add_argument('--format', choices=FORMATS, default='parquet')
+    parser.add_argument('--compression', default='zstd')
+    args = parser.parse_args()
+    if pyarrow is None:
+        sys.exit('pyarrow is required to export, e.g. pip install pyarrow')
+
+    start = time.monotonic()
+    stats = {'files': 0, 'rows': 0}
+    parts = {}
+
+    def export(day, readings):
+        if (args.start and day < args.start) or \
+                (args.end and day > args.end) or not readings:
+            return
+        table = day_table(readings)
+        write_day(table, args.out, day, args.format, args.compression,
+                  parts.get(day, 0))
+        # A day seen again in unordered messages is written as a new part.
+        parts[day] = parts.get(day, 0) + 1
+        stats['files'] += 1
+        stats['rows'] += len(table)
+
+    if args.messages:
+        lines = sys.stdin if args.messages == '-' else open(args.messages)
+        with lines:
+            for day, readings in read_messages(lines, args.sensor):
+                export(day, readings)
+    else:
+        topics = args.topics.split(',') if args.topics else None
+        for day in store_days(args.store, args.start, args.end):
+            export(day, read_store_day(args.store, day, topics))
+    stats['seconds'] = round(time.monotonic() - start, 1)
+    print(json.dumps(stats))
+
+
+if __name__ == '__main__':
+    main()
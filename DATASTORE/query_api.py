@@ -0,0 +1,269 @@
+"""HTTP/JSON range queries over the time series store.
+
+GET /series
+    {"raw": [[topic, field], ...], "1m": [...], ...}
+GET /query?topic=metpod/windsonic&field=windspd&start=-86400&resolution=10m
+    start and end are UNIX times, or seconds relative to now if negative
+    (end defaults to now). resolution is raw, 1m, 10m, 1h or auto (the
+    default), which picks the finest resolution giving at most max_points
+    (default 1500) points. Rollups return count, mean, min, max, last and
+    sum columns, e.g. the sum of 1h rain amounts for totals.
+
+Only the block headers of a series file are read to index it, and only the
+blocks overlapping the query are decompressed. As the files are append
+only, the index of a file is extended rather than rebuilt when it grows.
+The on-disk part of each result is cached, and the cache invalidated when
+the store writes or deletes data; the samples not yet written (and the
+rollup period in progress) are added from memory to every response.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import ts_store
+
+RESOLUTIONS = [ts_store.RAW] + list(ts_store.ROLLUPS)
+PERIODS = dict(ts_store.ROLLUPS, raw=1)
+# Reads of the disk and buffers, should the store write in between.
+READ_ATTEMPTS = 5
+
+
+class SeriesIndex:
+    """Offsets and time ranges of the blocks in one series file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.size = 0
+        # (first time, last time, offset) of each complete block
+        self.blocks = []
+
+    def update(self):
+        """Index any blocks appended since the last update."""
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return False
+        if size <= self.size:
+            return True
+        with open(self.path, 'rb') as series_file:
+            series_file.seek(self.size)
+            offset = self.size
+            while offset + ts_store.BLOCK_HEADER.size <= size:
+                header = series_file.read(ts_store.BLOCK_HEADER.size)
+                magic, count, width, first, last, length = \
+                    ts_store.BLOCK_HEADER.unpack(header)
+                if magic != ts_store.MAGIC or \
+                        offset + len(header) + length > size:
+                    break
+                self.blocks.append((first, last, offset))
+                offset += len(header) + length
+                series_file.seek(offset)
+        self.size = offset
+        return True
+
+    def read(self, start, end):
+        """Return the (times, columns) of samples in [start, end)."""
+        times = []
+        columns = None
+        wanted = [block for block in self.blocks
+                  if block[1] >= start and block[0] < end]
+        if not wanted:
+            return times, []
+        with open(self.path, 'rb') as series_file:
+            for first, last, offset in wanted:
+                series_file.seek(offset)
+                header = series_file.read(ts_store.BLOCK_HEADER.size)
+                length = ts_store.BLOCK_HEADER.unpack(header)[5]
+                block = header + series_file.read(length)
+                for _, _, block_times, block_columns in \
+                        ts_store.decode_blocks(block):
+                    if columns is None:
+                        columns = [[] for _ in block_columns]
+                    for index, timestamp in enumerate(block_times):
+                        if start <= timestamp < end:
+                            times.append(timestamp)
+                            for column, values in zip(columns,
+                                                      block_columns):
+                                column.append(values[index])
+        return times, columns or []
+
+
+class QueryEngine:
+    """Answers range queries from the store's files and memory."""
+
+    def __init__(self, store, cache_size=256):
+        self.store = store
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.indexes = {}
+        self.lock = threading.Lock()
+
+    def index(self, resolution, day, topic, field):
+        path = os.path.join(self.store.root, resolution, day,
+                            ts_store.series_name(topic, field))
+        index = self.indexes.get(path)
+        if index is None:
+            index = self.indexes[path] = SeriesIndex(path)
+        if not index.update():
+            # The partition has been deleted by the retention policy.
+            del self.indexes[path]
+            return None
+        return index
+
+    def series(self):
+        """Return the stored (topic, field) pairs of each resolution."""
+        found = {resolution: set() for resolution in RESOLUTIONS}
+        for day, resolution, directory in self.store.partitions():
+            for name in os.listdir(directory):
+                found[resolution].add(ts_store.parse_series_name(name))
+        return {resolution: sorted(pairs)
+                for resolution, pairs in found.items()}
+
+    def stored(self, resolution, topic, field, start, end=None):
+        """Return the on-disk (times, columns) of a range (to the latest
+        data if end is None), cached until the store next writes."""
+        key = (resolution, topic, field, start, end)
+        generation = self.store.generation
+        with self.lock:
+            cached = self.cache.get(key)
+            if cached is not None and cached[0] == generation:
+                self.cache.move_to_end(key)
+                return cached[1]
+            times = []
+            columns = []
+            if end is None:
+                end = float('inf')
+                last_day = time.time()
+            else:
+                last_day = end
+            day = start - start % 86400
+            while day <= last_day:
+                index = self.index(resolution, ts_store.day_partition(day),
+                                   topic, field)
+                if index is not None:
+                    day_times, day_columns = index.read(start, end)
+                    times += day_times
+                    if not columns:
+                        columns = day_columns
+                    else:
+                        for column, values in zip(columns, day_columns):
+                            column += values
+                day += 86400
+            self.cache[key] = (generation, (times, columns))
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return times, columns
+
+    def query(self, topic, field, start, end=None, resolution='auto',
+              max_points=1500):
+        """Return the readings of a series between start and end.
+        :param topic: The MQTT topic.
+        :param field: The reading name.
+        :param start: UNIX time, or seconds before now if negative.
+        :param end: UNIX time, seconds before now if negative, or None.
+        :param resolution: raw, 1m, 10m, 1h or auto.
+        :param max_points: Point limit used to choose an auto resolution.
+        :return: A dict of the resolution and the time and value columns.
+        """
+        now = time.time()
+        start = now + start if start < 0 else start
+        end = now if end is None else (now + end if end < 0 else end)
+        if resolution == 'auto':
+            resolution = RESOLUTIONS[-1]
+            for candidate in RESOLUTIONS:
+                if (end - start) / PERIODS[candidate] <= max_points:
+                    resolution = candidate
+                    break
+        if resolution not in PERIODS:
+            raise ValueError('Unknown resolution ' + str(resolution))
+        # Include the rollup period containing start.
+        start -= start % PERIODS[resolution]
+        # Read from disk on a 10 minute grid, and up to now without an end
+        # time, so that repeated relative queries share cache entries.
+        stored_start = start - start % 600
+        stored_end = None if end >= now else end
+        for attempt in range(READ_ATTEMPTS):
+            # A block written between reading the disk and the buffers
+            # would be in neither, or both, so read again if one was.
+            generation = self.store.generation
+            stored = self.stored(resolution, topic, field, stored_start,
+                                 stored_end)
+            pending = self.store.pending(resolution, topic, field)
+            if self.store.generation == generation:
+                break
+        times = []
+        columns = None
+        for source in (stored, pending):
+            source_times, source_columns = source
+            if columns is None and source_columns:
+                columns = [[] for _ in source_columns]
+            for index, timestamp in enumerate(source_times):
+                if start <= timestamp < end:
+                    times.append(timestamp)
+                    for column, values in zip(columns, source_columns):
+                        column.append(values[index])
+        if resolution == ts_store.RAW:
+            if columns:
+                times, columns = ts_store.sort_rows(times, columns)
+            result = {'time': times, 'value': columns[0] if columns else []}
+        else:
+            if columns:
+                times, columns = ts_store.merge_rows(times, columns)
+            else:
+                columns = [[] for _ in ts_store.ROLLUP_COLUMNS]
+            count, total, low, high, last = columns
+            result = {'time': times, 'count': count,
+                      'mean': [value / number if number else None
+                               for value, number in zip(total, count)],
+                      'min': low, 'max': high, 'last': last, 'sum': total}
+        result.update(topic=topic, field=field, resolution=resolution)
+        return result
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    engine = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {name: values[0]
+                  for name, values in parse_qs(url.query).items()}
+        try:
+            if url.path == '/series':
+                body = self.engine.series()
+            elif url.path == '/query':
+                end = params.get('end')
+                body = self.engine.query(
+                    params['topic'], params['field'],
+                    float(params.get('start', -86400)),
+                    float(end) if end is not None else None,
+                    params.get('resolution', 'auto'),
+                    int(params.get('max_points', 1500)))
+            else:
+                self.send_error(404)
+                return
+        except (KeyError, ValueError) as error:
+            self.send_error(400, str(error))
+            return
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port, engine):
+    """Serve queries at http://<host>:<port>/ from a daemon thread."""
+    handler = type('Handler', (QueryHandler,), {'engine': engine})
+    server = ThreadingHTTPServer(('', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logging.info('Query API on port %s', port)
+    return server
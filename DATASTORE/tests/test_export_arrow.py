@@ -0,0 +1,101 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import export_arrow
+import ts_store
+
+
+class ExportArrowTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.store = ts_store.TimeSeriesStore(
+            os.path.join(self.root, 'store'), block_samples=100)
+        # Midnight UTC, recent enough to be within the retention period.
+        self.day = time.time() // 86400 * 86400 - 86400
+        self.name = ts_store.day_partition(self.day)
+        for second in range(250):
+            timestamp = self.day + second
+            self.store.append('metpod/ptu300', 'pressure', timestamp,
+                              1000 + second / 10)
+            self.store.append('metpod/windsonic', 'winddir', timestamp,
+                              second % 360)
+            # The 10 minute mean only starts after a while.
+            if second >= 50:
+                self.store.append('metpod/windsonic', 'winddir10m',
+                                  timestamp, 180)
+        self.store.flush(force=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_read_store_day(self):
+        """Test that a day of the store is read into time and value arrays
+        per sensor and field."""
+        store = os.path.join(self.root, 'store')
+        self.assertEqual(export_arrow.store_days(store), [self.name])
+        self.assertEqual(export_arrow.store_days(store, end='2000-01-01'),
+                         [])
+        readings = export_arrow.read_store_day(store, self.name)
+        self.assertEqual(sorted(readings), ['metpod/ptu300',
+                                            'metpod/windsonic'])
+        times, values = readings['metpod/ptu300']['pressure']
+        self.assertEqual(len(times), 250)
+        self.assertEqual(times[1] - times[0], 1000)
+        self.assertEqual(times[-1], int(self.day * 1000) + 249000)
+        self.assertAlmostEqual(values[-1], 1024.9)
+        self.assertEqual(len(readings['metpod/windsonic']['winddir10m'][0]),
+                         200)
+
+    def test_read_messages(self):
+        """Test that decoded messages are grouped by UTC day, skipping
+        lines that are not readings."""
+        lines = [json.dumps({'pressure': 1000.5, 'temperature': 10.0,
+                             'time': self.day - 1}),
+                 '{"lines": 3, "published": 3}',
+                 'not json',
+                 json.dumps({'pressure': 1001.0, 'temperature': None,
+                             'time': self.day + 0.25})]
+        days = list(export_arrow.read_messages(lines, 'metpod/ptu300'))
+        self.assertEqual([day for day, readings in days],
+                         [ts_store.day_partition(self.day - 1), self.name])
+        fields = days[1][1]['metpod/ptu300']
+        self.assertEqual(list(fields), ['pressure'])
+        self.assertEqual(list(fields['pressure'][0]),
+                         [int(self.day * 1000) + 250])
+
+    @unittest.skipIf(export_arrow.pyarrow is None, 'pyarrow not installed')
+    def test_export_parquet(self):
+        """Test that a day is written as one typed table with a row per
+        sensor and time, and nulls for readings a sensor does not have."""
+        import pyarrow.parquet
+        store = os.path.join(self.root, 'store')
+        out = os.path.join(self.root, 'export')
+        table = export_arrow.day_table(
+            export_arrow.read_store_day(store, self.name))
+        path = export_arrow.write_day(table, out, self.name)
+        self.assertEqual(path, os.path.join(out, 'date=' + self.name,
+                                            'readings.parquet'))
+        table = pyarrow.parquet.read_table(path)
+        self.assertEqual(table.num_rows, 500)
+        schema = table.schema
+        self.assertEqual(schema.field('pressure').type, pyarrow.float32())
+        self.assertEqual(schema.field('winddir').type, pyarrow.int16())
+        self.assertTrue(pyarrow.types.is_dictionary(
+            schema.field('sensor').type))
+        self.assertTrue(pyarrow.types.is_timestamp(
+            schema.field('time').type))
+        rows = table.to_pylist()
+        self.assertEqual(rows[0]['sensor'], 'metpod/ptu300')
+        self.assertIsNone(rows[0]['winddir'])
+        self.assertEqual(rows[250]['sensor'], 'metpod/windsonic')
+        self.assertIsNone(rows[250]['winddir10m'])
+        self.assertEqual(rows[300]['winddir10m'], 180)
+        self.assertEqual(rows[-1]['winddir'], 249)
+
+
+if __name__ == '__main__':
+    unittest.main()
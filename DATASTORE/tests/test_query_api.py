@@ -0,0 +1,109 @@
+import shutil
+import tempfile
+import time
+import unittest
+import ts_store
+from query_api import QueryEngine
+
+
+class QueryEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.store = ts_store.TimeSeriesStore(self.root, block_samples=100)
+        self.engine = QueryEngine(self.store)
+        self.hour = time.time() // 3600 * 3600 - 2 * 3600
+        for second in range(3600):
+            self.store.append('metpod/windsonic', 'windspd',
+                              self.hour + second, second % 10)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_raw_range(self):
+        """Test that a raw query returns exactly the samples in range,
+        from disk and from the unwritten buffer."""
+        result = self.engine.query('metpod/windsonic', 'windspd',
+                                   self.hour + 50, self.hour + 3600, 'raw')
+        self.assertEqual(len(result['time']), 3550)
+        self.assertEqual(result['time'][0], self.hour + 50)
+        self.assertEqual(result['value'][:3], [0, 1, 2])
+
+    def test_rollup_and_auto_resolution(self):
+        """Test that rollup queries return means and pick a resolution
+        from the point limit."""
+        result = self.engine.query('metpod/windsonic', 'windspd',
+                                   self.hour, self.hour + 3600, '10m')
+        self.assertEqual(len(result['time']), 6)
+        self.assertEqual(result['mean'], [4.5] * 6)
+        self.assertEqual(result['count'], [600] * 6)
+        result = self.engine.query('metpod/windsonic', 'windspd',
+                                   self.hour, self.hour + 3600,
+                                   max_points=100)
+        self.assertEqual(result['resolution'], '1m')
+
+    def test_out_of_order_samples(self):
+        """Test that a sample arriving after later ones is returned in time
+        order and counted once in the rollup of its own period."""
+        start = self.hour + 3600
+        for second in range(150):
+            self.store.append('metpod/ptu300', 'pressure', start + second,
+                              1000)
+            if second == 100:
+                self.store.append('metpod/ptu300', 'pressure', start + 30,
+                                  1010)
+        self.store.flush(force=True)
+        result = self.engine.query('metpod/ptu300', 'pressure', start,
+                                   start + 150, 'raw')
+        self.assertEqual(result['time'], sorted(result['time']))
+        self.assertEqual(len(result['time']), 151)
+        result = self.engine.query('metpod/ptu300', 'pressure', start,
+                                   start + 180, '1m')
+        self.assertEqual(result['time'], [start, start + 60, start + 120])
+        self.assertEqual(result['count'], [61, 60, 30])
+        self.assertEqual(result['max'], [1010, 1000, 1000])
+
+    def test_cache_invalidation(self):
+        """Test that cached results are reused until new data is written."""
+        self.engine.query('metpod/windsonic', 'windspd', -86400,
+                          resolution='raw')
+        cached = dict(self.engine.cache)
+        self.engine.query('metpod/windsonic', 'windspd', -86400,
+                          resolution='raw')
+        self.assertEqual(self.engine.cache, cached)
+        self.store.append('metpod/windsonic', 'windspd',
+                          self.hour + 3600, 1)
+        self.store.flush(force=True)
+        result = self.engine.query('metpod/windsonic', 'windspd', -86400,
+                                   resolution='raw')
+        self.assertEqual(len(result['time']), 3601)
+        self.assertEqual(self.engine.series()['raw'],
+                         [('metpod/windsonic', 'windspd')])
+
+    def test_flush_during_query(self):
+        """Test that a block written between reading the disk and the
+        buffers is neither missed nor returned twice."""
+        # Samples still in the buffer.
+        for second in range(3600, 3650):
+            self.store.append('metpod/windsonic', 'windspd',
+                              self.hour + second, 1)
+        stored = self.engine.stored
+        flushes = []
+
+        def stored_then_flush(*args):
+            result = stored(*args)
+            if not flushes:
+                flushes.append(True)
+                self.store.flush(force=True)
+            return result
+
+        self.engine.stored = stored_then_flush
+        result = self.engine.query('metpod/windsonic', 'windspd',
+                                   self.hour, self.hour + 3650, 'raw')
+        self.assertEqual(flushes, [True])
+        self.assertEqual(result['time'],
+                         [self.hour + second for second in range(3650)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import ts_store
+
+
+class TimeSeriesStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.store = ts_store.TimeSeriesStore(self.root, block_samples=100)
+        # A whole hour, recent enough to be within the retention period.
+        self.hour = time.time() // 3600 * 3600 - 86400
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def series(self, resolution, timestamp, topic='metpod/ptu300',
+               field='pressure'):
+        return os.path.join(self.root, resolution,
+                            ts_store.day_partition(timestamp),
+                            ts_store.series_name(topic, field))
+
+    def test_message_readings(self):
+        """Test that only reading fields are taken from messages, and none
+        from summaries or messages about the system."""
+        self.assertEqual(ts_store.message_readings(
+            {'rainrate': 12, 'raintip': 0.3, 'units': 'mm/hr',
+             'time': 1760000000.1, 'tip_time': 1760000000.0, 'seq': 4}),
+            [('rainrate', 12), ('raintip', 0.3)])
+        self.assertEqual(ts_store.message_readings(
+            {'probe_time': 1760000000.0, 'rtt_ms': 12.5, 'time': 1.0}), [])
+        self.assertEqual(ts_store.message_readings(
+            {'time': 1760000060, 'period': 60, 'temperature': 13.4}), [])
+        self.assertEqual(ts_store.message_readings(
+            {'visibility': 9000.0}, ts_store.READING_FIELDS | {'visibility'}),
+            [('visibility', 9000.0)])
+
+    def test_raw_round_trip(self):
+        """Test that samples are written in blocks and read back."""
+        start = self.hour
+        for second in range(250):
+            self.store.append('metpod/ptu300', 'pressure', start + second,
+                              1000 + second / 10)
+        self.store.flush(force=True)
+        times, values = [], []
+        for first, last, block_times, columns in ts_store.read_blocks(
+                self.series('raw', start)):
+            times += block_times
+            values += columns[0]
+        self.assertEqual(len(times), 250)
+        self.assertAlmostEqual(times[-1], start + 249)
+        self.assertAlmostEqual(values[-1], 1024.9)
+        self.assertEqual(ts_store.parse_series_name(
+            ts_store.series_name('metpod/ptu300', 'pressure')),
+            ('metpod/ptu300', 'pressure'))
+
+    def test_rollups(self):
+        """Test that 1 minute rollups hold count, sum, min, max and last,
+        and that a period written on shutdown merges with its remainder."""
+        start = self.hour
+        for second in range(150):
+            self.store.append('metpod/ptu300', 'pressure', start + second,
+                              second)
+        self.store.flush(force=True)
+        for second in range(150, 180):
+            self.store.append('metpod/ptu300', 'pressure', start + second,
+                              second)
+        self.store.flush(force=True)
+        times, columns = [], [[] for _ in ts_store.ROLLUP_COLUMNS]
+        for first, last, block_times, block_columns in ts_store.read_blocks(
+                self.series('1m', start)):
+            times += block_times
+            for column, values in zip(columns, block_columns):
+                column += values
+        times, columns = ts_store.merge_rows(times, columns)
+        self.assertEqual(times, [start, start + 60, start + 120])
+        count, total, low, high, last = [column[2] for column in columns]
+        self.assertEqual((count, low, high, last), (60, 120, 179, 179))
+        self.assertEqual(total, sum(range(120, 180)))
+
+    def test_torn_block(self):
+        """Test that a block cut short by power loss is ignored."""
+        start = self.hour
+        for second in range(200):
+            self.store.append('metpod/ptu300', 'pressure', start + second, 1)
+        path = self.series('raw', start)
+        with open(path, 'ab') as series_file:
+            series_file.write(ts_store.encode_block([start], [[1.0]])[:-3])
+        self.assertEqual(len(list(ts_store.read_blocks(path))), 2)
+
+    def test_retention(self):
+        """Test that old partitions are deleted and the disk budget is
+        met by deleting raw data first."""
+        old = time.time() - 40 * 86400
+        recent = time.time() - 2 * 86400
+        for timestamp in (old, recent):
+            for second in range(100):
+                self.store.append('metpod/ptu300', 'pressure',
+                                  timestamp + second, second)
+        self.store.flush(force=True)
+        self.assertFalse(os.path.exists(self.series('raw', old)))
+        self.assertTrue(os.path.exists(self.series('1m', old)))
+        self.assertTrue(os.path.exists(self.series('raw', recent)))
+
+        self.store.disk_budget = 1
+        self.store.apply_retention()
+        self.assertFalse(os.path.exists(self.series('raw', recent)))
+
+
+if __name__ == '__main__':
+    unittest.main()
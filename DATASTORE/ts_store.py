@@ -0,0 +1,404 @@
+"""Append-only, columnar time series store for the published readings.
+
+Each series (MQTT topic and reading field, e.g. 'metpod/ptu300' and
+'pressure') is buffered in memory and written out as compressed blocks,
+appended to one file per series per UTC day:
+
+<root>/<resolution>/<YYYY-MM-DD>/<series>.blk
+
+A block holds a header followed by zlib compressed columns: the sample
+times as millisecond offsets from the first time, then one float64 column
+per value. Writing whole blocks, by default every 600 samples or 10
+minutes, keeps writes (and SD card wear) to a few appends per series per
+hour, at the cost of losing at most one unwritten block on power failure.
+
+As samples arrive they are also rolled up into 1 minute, 10 minute and 1
+hour count/sum/min/max/last aggregates, stored the same way. Mean values
+are sum / count and totals (e.g. rain amounts) the sum. Old day partitions
+are deleted by age per resolution, and oldest first (raw data first) to
+keep the store within a disk budget.
+"""
+import array
+import datetime
+import os
+import shutil
+import struct
+import threading
+import time
+import zlib
+from urllib.parse import quote, unquote
+
+MAGIC = b'MPTS'
+# magic, sample count, value columns, first time, last time, data length
+BLOCK_HEADER = struct.Struct('<4sIIddI')
+
+RAW = 'raw'
+ROLLUPS = {'1m': 60, '10m': 600, '1h': 3600}
+ROLLUP_COLUMNS = ('count', 'sum', 'min', 'max', 'last')
+
+# Days of data kept for each resolution.
+RETENTION_DAYS = {RAW: 31, '1m': 92, '10m': 366, '1h': 3660}
+
+# Fields of the published messages that are readings: those of the serial
+# sensors, the rain gauge and the derived products. Messages about the
+# system, e.g. port and link health and metrics snapshots, carry none.
+READING_FIELDS = frozenset((
+    'pressure', 'temperature', 'dew_point', 'humidity',
+    'winddir', 'windspd', 'windgust', 'winddir10m', 'windspd10m',
+    'rainrate', 'raintip',
+    'vapour_pressure', 'wet_bulb', 'qfe', 'qnh', 'mslp'))
+
+
+def message_readings(data, fields=READING_FIELDS):
+    """Return the readings of a decoded message.
+    :param data: The message dict.
+    :param fields: The names of the reading fields.
+    :return: (field, value) tuples of the numeric reading fields, none for
+    summaries (messages with a 'period'), which the rollups already cover.
+    """
+    if 'period' in data:
+        return []
+    return [(field, value) for field, value in data.items()
+            if field in fields and not isinstance(value, bool) and
+            isinstance(value, (int, float))]
+
+
+def series_name(topic, field):
+    """Return the file name used for a series."""
+    return quote(topic, safe='') + '.' + quote(field, safe='') + '.blk'
+
+
+def parse_series_name(name):
+    """Return the (topic, field) of a series file name."""
+    topic, field = name[:-len('.blk')].rsplit('.', 1)
+    return unquote(topic), unquote(field)
+
+
+def day_partition(timestamp):
+    return datetime.datetime.utcfromtimestamp(timestamp).strftime('%Y-%m-%d')
+
+
+def encode_block(times, columns):
+    """Encode sample times and value columns as a block.
+    :param times: UNIX times in ascending order.
+    :param columns: Lists of float values, each the same length as times.
+    :return: The block bytes.
+    """
+    first = times[0]
+    offsets = array.array('I', [int(round((t - first) * 1000))
+                                for t in times])
+    payload = offsets.tobytes()
+    for column in columns:
+        payload += array.array('d', column).tobytes()
+    data = zlib.compress(payload, 6)
+    return BLOCK_HEADER.pack(MAGIC, len(times), len(columns), first,
+                             times[-1], len(data)) + data
+
+
+def read_blocks(path):
+    """Read every block of a series file.
+    :param path: The series file.
+    :return: A generator of (first time, last time, times, columns) tuples.
+    """
+    with open(path, 'rb') as series_file:
+        content = series_file.read()
+    return decode_blocks(content)
+
+
+def decode_blocks(content):
+    """Decode a sequence of blocks.
+    :param content: The block bytes.
+    :return: A generator of (first time, last time, times, columns) tuples.
+    """
+    for first, last, offsets, columns in decode_block_arrays(content):
+        times = [first + milliseconds / 1000 for milliseconds in offsets]
+        yield first, last, times, [values.tolist() for values in columns]
+
+
+def decode_block_arrays(content):
+    """Decode a sequence of blocks to arrays, without converting each
+    sample to Python objects.
+    :param content: The block bytes.
+    :return: A generator of (first time, last time, offsets, columns)
+    tuples, the offsets being an array of millisecond offsets from the first
+    time and the columns arrays of floats.
+    """
+    offset = 0
+    while offset + BLOCK_HEADER.size <= len(content):
+        magic, count, width, first, last, length = \
+            BLOCK_HEADER.unpack_from(content, offset)
+        offset += BLOCK_HEADER.size
+        if magic != MAGIC or offset + length > len(content):
+            # A block cut short by power loss ends the readable data.
+            break
+        payload = zlib.decompress(content[offset:offset + length])
+        offset += length
+        offsets = array.array('I')
+        offsets.frombytes(payload[:count * 4])
+        columns = []
+        for column in range(width):
+            values = array.array('d')
+            start = count * 4 + column * count * 8
+            values.frombytes(payload[start:start + count * 8])
+            columns.append(values)
+        yield first, last, offsets, columns
+
+
+class Rollup:
+    """Incremental count/sum/min/max/last aggregate of one series over
+    fixed, clock aligned periods."""
+
+    def __init__(self, period):
+        self.period = period
+        self.start = None
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+        self.last = None
+
+    def add(self, timestamp, value):
+        """Add a sample, returning the completed (start, values) aggregate
+        if the sample falls in a new period, or the sample's own if it is
+        late for its period, otherwise None."""
+        start = timestamp - timestamp % self.period
+        if self.count and start < self.start:
+            # A late sample, for a period already completed, is returned as
+            # a row of its own, which merge_rows combines with the rest of
+            # its period, rather than ending the period in progress.
+            return start, (1, value, value, value, value)
+        completed = None
+        if start != self.start or not self.count:
+            if self.count:
+                completed = self.row()
+            self.start = start
+            self.count = 0
+            self.sum = 0.0
+            self.min = self.max = value
+        self.count += 1
+        self.sum += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.last = value
+        return completed
+
+    def row(self):
+        return self.start, (self.count, self.sum, self.min, self.max,
+                            self.last)
+
+
+def sort_rows(times, columns):
+    """Return rows in time order, e.g. once a late sample has been written
+    after later ones. Rows with equal times keep their order.
+    :param times: The row times.
+    :param columns: Lists of values, each the same length as times.
+    :return: The sorted (times, columns).
+    """
+    if all(earlier <= later for earlier, later in zip(times, times[1:])):
+        return times, columns
+    order = sorted(range(len(times)), key=times.__getitem__)
+    return ([times[index] for index in order],
+            [[column[index] for index in order] for column in columns])
+
+
+def merge_rows(times, columns):
+    """Combine rollup rows with the same period start, in period order.
+    :param times: Period start times, in the order the rows were written.
+    :param columns: The count, sum, min, max and last columns.
+    :return: The merged (times, columns), 'last' being that of the row of
+    each period written last.
+    """
+    times, columns = sort_rows(times, columns)
+    merged_times = []
+    merged = [[] for _ in ROLLUP_COLUMNS]
+    for index, start in enumerate(times):
+        row = [column[index] for column in columns]
+        if merged_times and merged_times[-1] == start:
+            merged[0][-1] += row[0]
+            merged[1][-1] += row[1]
+            merged[2][-1] = min(merged[2][-1], row[2])
+            merged[3][-1] = max(merged[3][-1], row[3])
+            merged[4][-1] = row[4]
+        else:
+            merged_times.append(start)
+            for column, value in zip(merged, row):
+                column.append(value)
+    return merged_times, merged
+
+
+class SeriesBuffer:
+    """Samples waiting to be written as a block."""
+
+    def __init__(self):
+        self.times = []
+        self.columns = None
+        self.started = time.monotonic()
+
+    def add(self, timestamp, values):
+        if self.columns is None:
+            self.columns = [[] for _ in values]
+        self.times.append(timestamp)
+        for column, value in zip(self.columns, values):
+            column.append(value)
+
+
+class TimeSeriesStore:
+    """Writes samples, rollups and retention for all series under root."""
+
+    def __init__(self, root, block_samples=600, flush_interval=600,
+                 disk_budget=None, retention_days=None):
+        self.root = root
+        self.block_samples = block_samples
+        self.flush_interval = flush_interval
+        self.disk_budget = disk_budget
+        self.retention_days = dict(RETENTION_DAYS)
+        self.retention_days.update(retention_days or {})
+        self.buffers = {}
+        self.rollups = {}
+        self.lock = threading.Lock()
+        # Incremented whenever data is written, to invalidate query caches.
+        self.generation = 0
+
+    def append(self, topic, field, timestamp, value):
+        """Add one reading to the store.
+        :param topic: The MQTT topic the reading was published on.
+        :param field: The reading name e.g. 'pressure'.
+        :param timestamp: UNIX time of the reading.
+        :param value: The numeric value.
+        """
+        value = float(value)
+        with self.lock:
+            self.add(RAW, topic, field, timestamp, (value,))
+            for resolution, period in ROLLUPS.items():
+                key = (resolution, topic, field)
+                rollup = self.rollups.get(key)
+                if rollup is None:
+                    rollup = self.rollups[key] = Rollup(period)
+                completed = rollup.add(timestamp, value)
+                if completed is not None:
+                    self.add(resolution, topic, field, *completed)
+
+    def add(self, resolution, topic, field, timestamp, values):
+        key = (resolution, topic, field)
+        buffer = self.buffers.get(key)
+        if buffer is None:
+            buffer = self.buffers[key] = SeriesBuffer()
+        elif buffer.times and timestamp < buffer.times[-1]:
+            # Times must ascend within a block; start a new one.
+            self.write(key, buffer)
+            buffer = self.buffers[key] = SeriesBuffer()
+        buffer.add(timestamp, values)
+        if len(buffer.times) >= self.block_samples:
+            self.write(key, buffer)
+            del self.buffers[key]
+
+    def write(self, key, buffer):
+        """Append a buffer to its series file, splitting at day
+        boundaries so each block lies within one partition."""
+        resolution, topic, field = key
+        start = 0
+        times = buffer.times
+        while start < len(times):
+            day = day_partition(times[start])
+            end = start
+            while end < len(times) and day_partition(times[end]) == day:
+                end += 1
+            directory = os.path.join(self.root, resolution, day)
+            os.makedirs(directory, exist_ok=True)
+            with open(os.path.join(directory, series_name(topic, field)),
+                      'ab') as series_file:
+                series_file.write(encode_block(
+                    times[start:end],
+                    [column[start:end] for column in buffer.columns]))
+            start = end
+        self.generation += 1
+
+    def flush(self, force=False):
+        """Write out buffers older than the flush interval (or all of them
+        if forced), then apply the retention policy."""
+        now = time.monotonic()
+        with self.lock:
+            for key, buffer in list(self.buffers.items()):
+                if force or now - buffer.started >= self.flush_interval:
+                    if buffer.times:
+                        self.write(key, buffer)
+                    del self.buffers[key]
+            if force:
+                # Write the periods in progress, e.g. on shutdown. Any
+                # later samples in the same period form a second row,
+                # which merge_rows combines when the series is read.
+                for (resolution, topic, field), rollup in \
+                        self.rollups.items():
+                    if rollup.count:
+                        start, values = rollup.row()
+                        buffer = SeriesBuffer()
+                        buffer.add(start, values)
+                        self.write((resolution, topic, field), buffer)
+                        rollup.count = 0
+            self.apply_retention()
+
+    def pending(self, resolution, topic, field):
+        """Return the unwritten (times, columns) of a series, including
+        the rollup period in progress, for queries of the latest data."""
+        with self.lock:
+            buffer = self.buffers.get((resolution, topic, field))
+            times = list(buffer.times) if buffer else []
+            columns = [list(column) for column in buffer.columns] \
+                if buffer and buffer.columns else None
+            rollup = self.rollups.get((resolution, topic, field))
+            if rollup is not None and rollup.count:
+                start, values = rollup.row()
+                times.append(start)
+                if columns is None:
+                    columns = [[] for _ in values]
+                for column, value in zip(columns, values):
+                    column.append(value)
+        return times, columns or []
+
+    def partitions(self):
+        """Return (day, resolution, directory) for every partition."""
+        found = []
+        for resolution in [RAW] + list(ROLLUPS):
+            directory = os.path.join(self.root, resolution)
+            if os.path.isdir(directory):
+                for day in sorted(os.listdir(directory)):
+                    found.append((day, resolution,
+                                  os.path.join(directory, day)))
+        return found
+
+    def apply_retention(self):
+        """Delete partitions older than their resolution's retention, then
+        the oldest partitions, finest resolution first, while the store is
+        over its disk budget."""
+        today = datetime.datetime.utcnow().date()
+        removed = False
+        for day, resolution, directory in self.partitions():
+            age = (today - datetime.date.fromisoformat(day)).days
+            if age > self.retention_days[resolution]:
+                shutil.rmtree(directory, ignore_errors=True)
+                removed = True
+        if self.disk_budget:
+            order = {RAW: 0, '1m': 1, '10m': 2, '1h': 3}
+            partitions = sorted(self.partitions(),
+                                key=lambda part: (order[part[1]], part[0]))
+            sizes = {part[2]: directory_size(part[2])
+                     for part in partitions}
+            total = sum(sizes.values())
+            current_day = today.isoformat()
+            for day, resolution, directory in partitions:
+                if total <= self.disk_budget:
+                    break
+                if day == current_day:
+                    continue
+                total -= sizes[directory]
+                shutil.rmtree(directory, ignore_errors=True)
+                removed = True
+        if removed:
+            self.generation += 1
+
+
+def directory_size(directory):
+    return sum(entry.stat().st_size for entry in os.scandir(directory)
+               if entry.is_file())
@@ -0,0 +1,111 @@
+"""Derived products computed from the pressure, temperature and humidity
+streams.
+
+Samples from different sensors arrive at different times, so each input
+keeps its recent samples and, when a new sample arrives, the other inputs
+are taken from their samples nearest in time, if within the alignment
+tolerance. Each product is memoized on its input values and only
+recomputed when one of them changes.
+"""
+from collections import deque
+import meteo
+
+INPUTS = ('pressure', 'temperature', 'humidity')
+
+
+class AlignedInput:
+    """Recent (time, value) samples of one input."""
+
+    def __init__(self, size=32):
+        self.samples = deque(maxlen=size)
+
+    def add(self, timestamp, value):
+        self.samples.append((timestamp, value))
+
+    def nearest(self, timestamp, tolerance):
+        """Return the value of the sample nearest to timestamp, or None if
+        there is none within tolerance seconds."""
+        best = None
+        for sample_time, value in self.samples:
+            difference = abs(sample_time - timestamp)
+            if difference <= tolerance and \
+                    (best is None or difference < best[0]):
+                best = (difference, value)
+        return best[1] if best is not None else None
+
+
+class Memo:
+    """The last result of a function, reused while its arguments are
+    unchanged."""
+
+    def __init__(self, function):
+        self.function = function
+        self.arguments = None
+        self.result = None
+        self.calls = 0
+
+    def __call__(self, *arguments):
+        if arguments != self.arguments:
+            self.arguments = arguments
+            self.calls += 1
+            self.result = self.function(*arguments)
+        return self.result
+
+
+class ProductEngine:
+    """Aligns the inputs and computes the products."""
+
+    def __init__(self, elevation, barometer_height=0.0, tolerance=5.0):
+        """
+        :param elevation: Site elevation above mean sea level (m).
+        :param barometer_height: Barometer height above the site elevation.
+        :param tolerance: Maximum seconds between aligned samples.
+        """
+        self.elevation = elevation
+        self.barometer_height = barometer_height
+        self.tolerance = tolerance
+        self.inputs = {name: AlignedInput() for name in INPUTS}
+        self.memos = {
+            'vapour_pressure': Memo(meteo.vapour_pressure),
+            'dew_point': Memo(meteo.dew_point),
+            'wet_bulb': Memo(meteo.wet_bulb),
+            'qfe': Memo(meteo.qfe),
+            'qnh': Memo(meteo.qnh),
+            'mslp': Memo(meteo.mslp),
+        }
+
+    def add(self, name, timestamp, value):
+        """Add an input sample and return the products at its time.
+        :param name: 'pressure', 'temperature' or 'humidity'.
+        :param timestamp: UNIX time of the sample.
+        :param value: The sample value, or None if missing.
+        :return: A dict of the products that can be computed.
+        """
+        if value is not None:
+            self.inputs[name].add(timestamp, value)
+        return self.products(timestamp)
+
+    def products(self, timestamp):
+        pressure, temperature, humidity = [
+            self.inputs[name].nearest(timestamp, self.tolerance)
+            for name in INPUTS]
+        memos = self.memos
+        products = {}
+        if temperature is not None and humidity:
+            products['vapour_pressure'] = round(
+                memos['vapour_pressure'](temperature, humidity), 2)
+            products['dew_point'] = round(
+                memos['dew_point'](temperature, humidity), 1)
+            if pressure is not None:
+                products['wet_bulb'] = round(
+                    memos['wet_bulb'](temperature, humidity, pressure), 1)
+        if pressure is not None:
+            site_pressure = memos['qfe'](pressure, self.barometer_height)
+            products['qfe'] = round(site_pressure, 1)
+            products['qnh'] = round(
+                memos['qnh'](site_pressure, self.elevation), 1)
+            if temperature is not None:
+                products['mslp'] = round(memos['mslp'](
+                    site_pressure, temperature, self.elevation,
+                    humidity or None), 1)
+        return products
@@ -0,0 +1,157 @@
+"""Health of the link to the upstream broker.
+
+Combines the internet connectivity probe of the wifi-connect container,
+which writes {"time": <UNIX time>, "online": true|false} to LINK_STATE_FILE
+(default /data/link_state) every CHECK_CONN_FREQ seconds, with the upstream
+client's connection state, the round trip time of QoS 1 and 2 publishes
+(from publish to broker acknowledgement) and the number of publishes still
+waiting for acknowledgement.
+
+good   connected, with RTT and in flight publishes below their limits
+poor   connected, but slow to acknowledge or with too many in flight
+down   the probe failed, or the client is not connected
+
+wifi-connect blocks while its access point is up after a failed probe, so
+no new probe may follow for a long time. A failed probe is ignored once it
+is older than probe_max_age, or once the broker has acknowledged a publish
+since, as the link then evidently works.
+"""
+import json
+import threading
+import time
+
+GOOD = 'good'
+POOR = 'poor'
+DOWN = 'down'
+
+
+class LinkHealth:
+
+    def __init__(self, state_file=None, rtt_poor=2.0, in_flight_poor=20,
+                 ack_timeout=30.0, probe_max_age=240.0):
+        """
+        :param state_file: The probe state file, or None to ignore probes.
+        :param rtt_poor: RTT (seconds) above which the link is poor.
+        :param in_flight_poor: Unacknowledged publishes above which the
+        link is poor.
+        :param ack_timeout: Seconds after which an unacknowledged publish
+        counts as a round trip of that length.
+        :param probe_max_age: Seconds after which a failed probe is
+        ignored, about twice CHECK_CONN_FREQ.
+        """
+        self.state_file = state_file
+        self.rtt_poor = rtt_poor
+        self.in_flight_poor = in_flight_poor
+        self.ack_timeout = ack_timeout
+        self.probe_max_age = probe_max_age
+        self.connected = False
+        self.rtt = None
+        self.sent_times = {}
+        # mid -> time of acknowledgements received before sent() could
+        # record the publish.
+        self.early = {}
+        # mid -> time of QoS 0 publishes, whose on_publish is not an
+        # acknowledgement.
+        self.unacknowledged = {}
+        self.lock = threading.Lock()
+        self.probe_time = None
+        self.online = None
+        self.offline = False
+        # UNIX time of the latest acknowledgement.
+        self.ack_time = None
+
+    def on_connect(self, mqtt_client, userdata, flags, rc, *args):
+        self.connected = rc == 0
+        # Measure the new connection afresh.
+        self.rtt = None
+
+    def on_disconnect(self, mqtt_client, userdata, rc, *args):
+        self.connected = False
+
+    def on_publish(self, mqtt_client, userdata, mid, *args):
+        self.acknowledged(mid)
+
+    def sent(self, mid, qos=1, now=None):
+        """Record a publish. QoS 1 and 2 publishes wait for
+        acknowledgement, QoS 0 ones are only recorded so that their
+        on_publish is ignored."""
+        if mid is None:
+            return
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            if self.early.pop(mid, None) is not None:
+                if qos:
+                    self.add_rtt(0.0)
+                    self.ack_time = time.time()
+            elif qos:
+                self.sent_times[mid] = now
+            else:
+                self.unacknowledged[mid] = now
+
+    def acknowledged(self, mid, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            if self.unacknowledged.pop(mid, None) is not None:
+                return
+            sent_time = self.sent_times.pop(mid, None)
+            if sent_time is None:
+                self.early[mid] = now
+                return
+            self.ack_time = time.time()
+        self.add_rtt(now - sent_time)
+
+    def add_rtt(self, rtt):
+        # Exponentially weighted, so a recovered link is seen within a few
+        # acknowledgements.
+        self.rtt = rtt if self.rtt is None else 0.8 * self.rtt + 0.2 * rtt
+
+    def read_probe(self, now=None):
+        """Read the latest connectivity probe result, if any.
+        :param now: UNIX time, for the age of the probe.
+        """
+        if not self.state_file:
+            return
+        try:
+            with open(self.state_file) as state_file:
+                probe = json.load(state_file)
+            self.probe_time = float(probe['time'])
+            self.online = bool(probe['online'])
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        now = time.time() if now is None else now
+        self.offline = self.online is False and \
+            now - self.probe_time <= self.probe_max_age
+
+    def state(self, now=None):
+        """Return 'good', 'poor' or 'down'."""
+        now = time.monotonic() if now is None else now
+        if not self.connected:
+            return DOWN
+        if self.offline and (self.ack_time is None or
+                             self.ack_time <= self.probe_time):
+            return DOWN
+        with self.lock:
+            for mids in (self.early, self.unacknowledged):
+                if mids:
+                    for mid in [mid for mid, seen in mids.items()
+                                if now - seen > self.ack_timeout]:
+                        del mids[mid]
+            oldest = min(self.sent_times.values(), default=now)
+            if now - oldest > self.ack_timeout:
+                self.add_rtt(now - oldest)
+                self.sent_times = {mid: sent for mid, sent
+                                   in self.sent_times.items()
+                                   if now - sent <= self.ack_timeout}
+            in_flight = len(self.sent_times)
+        if in_flight > self.in_flight_poor or \
+                (self.rtt is not None and self.rtt > self.rtt_poor):
+            return POOR
+        return GOOD
+
+    def snapshot(self):
+        """Return the link health as a dict, for publishing."""
+        return {'state': self.state(), 'online': self.online,
+                'probe_time': self.probe_time, 'connected': self.connected,
+                'rtt_ms': round(self.rtt * 1000, 1)
+                if self.rtt is not None else None,
+                'in_flight': len(self.sent_times)}
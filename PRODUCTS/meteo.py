@@ -0,0 +1,101 @@
+"""Meteorological formulas for the derived products.
+
+Temperatures are in degrees C, pressures in hPa, humidity in % and heights
+in metres.
+"""
+import math
+
+# Magnus formula coefficients over water (Alduchov and Eskridge 1996).
+MAGNUS_A = 6.1094
+MAGNUS_B = 17.625
+MAGNUS_C = 243.04
+
+G = 9.80665        # gravity (m/s2)
+RD = 287.05        # gas constant for dry air (J/kg/K)
+LAPSE_RATE = 0.0065  # standard atmosphere lapse rate (K/m)
+# Exponent and constant of the standard atmosphere pressure/height relation.
+ISA_EXPONENT = 0.190263
+ISA_CONSTANT = 8.417286e-5
+
+
+def saturation_vapour_pressure(temperature):
+    """Return the saturation vapour pressure over water (hPa)."""
+    return MAGNUS_A * math.exp(
+        MAGNUS_B * temperature / (MAGNUS_C + temperature))
+
+
+def vapour_pressure(temperature, humidity):
+    """Return the vapour pressure (hPa).
+    :param temperature: Air temperature.
+    :param humidity: Relative humidity.
+    """
+    return saturation_vapour_pressure(temperature) * humidity / 100
+
+
+def dew_point(temperature, humidity):
+    """Return the dew point temperature.
+    :param temperature: Air temperature.
+    :param humidity: Relative humidity, greater than 0.
+    """
+    gamma = math.log(humidity / 100) + \
+        MAGNUS_B * temperature / (MAGNUS_C + temperature)
+    return MAGNUS_C * gamma / (MAGNUS_B - gamma)
+
+
+def wet_bulb(temperature, humidity, pressure):
+    """Return the (psychrometric) wet bulb temperature, solving
+    e = es(Tw) - A p (T - Tw) for Tw by bisection between the dew point and
+    the air temperature.
+    :param temperature: Air temperature.
+    :param humidity: Relative humidity, greater than 0.
+    :param pressure: Station pressure.
+    """
+    vapour = vapour_pressure(temperature, humidity)
+    low = dew_point(temperature, humidity)
+    high = temperature
+    for _ in range(30):
+        middle = (low + high) / 2
+        # Psychrometer coefficient for a ventilated wet bulb.
+        coefficient = 6.53e-4 * (1 + 0.000944 * middle)
+        error = saturation_vapour_pressure(middle) - \
+            coefficient * pressure * (temperature - middle) - vapour
+        if error > 0:
+            high = middle
+        else:
+            low = middle
+    return (low + high) / 2
+
+
+def qfe(pressure, barometer_height=0.0):
+    """Return the pressure at site (aerodrome) elevation.
+    :param pressure: Barometer pressure.
+    :param barometer_height: Height of the barometer above the site
+    elevation, negative if below it.
+    """
+    return qnh(pressure, barometer_height)
+
+
+def qnh(pressure, elevation):
+    """Return the pressure reduced to sea level using the standard
+    atmosphere, as altimeters are set.
+    :param pressure: Pressure at the elevation.
+    :param elevation: Height above mean sea level.
+    """
+    return (pressure ** ISA_EXPONENT + ISA_CONSTANT * elevation) ** \
+        (1 / ISA_EXPONENT)
+
+
+def mslp(pressure, temperature, elevation, humidity=None):
+    """Return the mean sea level pressure, reducing the station pressure
+    through a fictitious air column at the station temperature plus half
+    the standard lapse over its height, and a humidity correction when
+    the humidity is known (WMO-No. 8).
+    :param pressure: Station pressure.
+    :param temperature: Station air temperature.
+    :param elevation: Station height above mean sea level.
+    :param humidity: Relative humidity, or None.
+    """
+    column = temperature + 273.15 + LAPSE_RATE * elevation / 2
+    if humidity is not None:
+        column += 0.12 * vapour_pressure(temperature, humidity)
+    return pressure * math.exp(G * elevation / (RD * column))
@@ -0,0 +1,194 @@
+import json
+import logging
+import os
+import time
+from threading import Lock, Timer
+import paho.mqtt.client as mqtt
+from derived import INPUTS, ProductEngine
+from summary import SummaryGenerator
+from link_health import LinkHealth
+from site_aggregator import SiteAggregator, parse_nodes
+from uplink import Uplink, parse_tiers
+
+
+def on_connect(mqtt_client, userdata, flags, rc):
+    if rc == 0:
+        # Subscribe here so the subscriptions are renewed on reconnection.
+        for topic in userdata['subscriptions']:
+            mqtt_client.subscribe(topic, 1)
+    else:
+        logging.info("MQTT Connection failed")
+
+
+def own_topic(userdata, topic):
+    """Return True for the topics this service publishes to: products,
+    summaries, site products and link health."""
+    return topic in userdata['own'] or \
+        topic.startswith(userdata['summary_topic'] + '/')
+
+
+def on_message(mqtt_client, userdata, msg):
+    arrival = time.time()
+    try:
+        data = json.loads(msg.payload)
+    except ValueError:
+        return
+    if not isinstance(data, dict):
+        return
+    timestamp = data.get('time', arrival)
+    # Readings only, not this service's own messages.
+    own = own_topic(userdata, msg.topic)
+    if userdata['summary'] is not None and not own:
+        with userdata['lock']:
+            userdata['summary'].add(msg.topic, data, timestamp)
+    if userdata['site'] is not None and not own:
+        with userdata['lock']:
+            userdata['site'].add(msg.topic, data, timestamp, arrival)
+    if userdata['uplink'] is not None and not own:
+        with userdata['lock']:
+            userdata['uplink'].add(msg.topic, data, msg.payload, timestamp)
+    if userdata['engine'] is not None:
+        products = None
+        for name, field in userdata['sources'].get(msg.topic, ()):
+            if field in data:
+                products = userdata['engine'].add(name, timestamp,
+                                                  data[field])
+        # Only publish when a product has changed.
+        if products and products != userdata['last']:
+            userdata['last'] = products
+            mqtt_client.publish(userdata['topic'],
+                                json.dumps(dict(products, time=timestamp)),
+                                userdata['qos'])
+
+
+def publish_summaries(mqtt_client, userdata, delay):
+    """Publish the summaries of the periods just ended and schedule the
+    next call for the end of the next minute plus the delay."""
+    now = time.time()
+    reports = []
+    with userdata['lock']:
+        if userdata['summary'] is not None:
+            reports = userdata['summary'].close(now - delay)
+        if userdata['uplink'] is not None:
+            userdata['uplink'].close(now - delay)
+            link = dict(userdata['uplink'].health.snapshot(),
+                        spooled=len(userdata['uplink'].spool),
+                        time=round(now, 3))
+            mqtt_client.publish(userdata['link_topic'], json.dumps(link),
+                                userdata['qos'])
+    for report in reports:
+        suffix = '/1m' if report['period'] == 60 else '/10m'
+        mqtt_client.publish(userdata['summary_topic'] + suffix,
+                            json.dumps(report), userdata['qos'])
+    timer = Timer(60 - (now - delay) % 60, publish_summaries,
+                  (mqtt_client, userdata, delay))
+    timer.daemon = True
+    timer.start()
+
+
+def publish_site(mqtt_client, userdata, delay):
+    """Publish the merged site products of the slots just ended and
+    schedule the next call for the end of the next slot plus the delay."""
+    now = time.time()
+    with userdata['lock']:
+        products = userdata['site'].close(now, delay)
+    for product in products:
+        mqtt_client.publish(userdata['site_topic'], json.dumps(product),
+                            userdata['qos'])
+    period = userdata['site'].period
+    timer = Timer(period - (now - delay) % period, publish_site,
+                  (mqtt_client, userdata, delay))
+    timer.daemon = True
+    timer.start()
+
+
+def input_sources():
+    """Return {topic: [(input name, field)]} from the PRESSURE_INPUT,
+    TEMPERATURE_INPUT and HUMIDITY_INPUT 'topic:field' variables."""
+    sources = {}
+    for name in INPUTS:
+        setting = os.getenv(name.upper() + '_INPUT')
+        if setting:
+            topic, _, field = setting.rpartition(':')
+            sources.setdefault(topic, []).append((name, field))
+    return sources
+
+
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO'))
+
+products_enabled = os.getenv('PRODUCTS_ENABLE', 'false') == 'true'
+summary_enabled = os.getenv('SUMMARY_ENABLE', 'false') == 'true'
+uplink_broker = os.getenv('UPLINK_BROKER')
+site_nodes = parse_nodes(os.getenv('SITE_NODES'))
+
+if products_enabled or summary_enabled or uplink_broker or site_nodes:
+    time.sleep(15)  # allow time for networking to be established
+    userdata = {
+        'sources': input_sources(),
+        'subscriptions': [],
+        'engine': None,
+        'summary': None,
+        'uplink': None,
+        'site': None,
+        'site_topic': os.getenv('SITE_TOPIC', 'site/metpod'),
+        'topic': os.getenv('PRODUCTS_TOPIC', 'metpod/products'),
+        'summary_topic': os.getenv('SUMMARY_TOPIC', 'metpod/summary'),
+        'link_topic': os.getenv('LINK_TOPIC', 'metpod/link'),
+        'qos': int(os.getenv('MQTT_QOS', '1')),
+        'last': None,
+        'lock': Lock(),
+    }
+    if products_enabled:
+        userdata['engine'] = ProductEngine(
+            float(os.getenv('SITE_ELEVATION', 0.0)),
+            float(os.getenv('BAROMETER_HEIGHT', 0.0)),
+            float(os.getenv('ALIGN_TOLERANCE', 5.0)))
+        userdata['subscriptions'] += list(userdata['sources'])
+    if summary_enabled:
+        userdata['summary'] = SummaryGenerator()
+        userdata['subscriptions'] += os.getenv(
+            'SUMMARY_TOPICS', '#').split(',')
+    if uplink_broker:
+        health = LinkHealth(
+            os.getenv('LINK_STATE_FILE', '/data/link_state'),
+            float(os.getenv('LINK_RTT_POOR', 2.0)),
+            int(os.getenv('LINK_IN_FLIGHT_POOR', 20)),
+            probe_max_age=float(os.getenv('LINK_PROBE_MAX_AGE', 240)))
+        upstream = mqtt.Client(client_id=os.getenv('UPLINK_CLIENT_ID',
+                                                   'metpod-uplink'))
+        upstream.on_connect = health.on_connect
+        upstream.on_disconnect = health.on_disconnect
+        upstream.on_publish = health.on_publish
+        upstream.connect_async(uplink_broker,
+                               int(os.getenv('UPLINK_PORT', 1883)))
+        upstream.loop_start()
+        userdata['uplink'] = Uplink(
+            upstream, parse_tiers(os.getenv('UPLINK_TIERS')),
+            os.getenv('UPLINK_DEFAULT_TIER', '1m'),
+            int(os.getenv('UPLINK_QOS', '1')), health,
+            int(os.getenv('UPLINK_SPOOL_SIZE', 10000)))
+        # The sensor topics, not their health, tip and metrics subtopics.
+        userdata['subscriptions'] += os.getenv(
+            'UPLINK_TOPICS', 'metpod/+').split(',')
+    if site_nodes:
+        userdata['site'] = SiteAggregator(
+            site_nodes, int(os.getenv('SITE_PERIOD', 10)),
+            float(os.getenv('SITE_STALE_AFTER', 60)),
+            int(os.getenv('SITE_MAX_SLOTS', 30)))
+        userdata['subscriptions'] += [prefix + '/#'
+                                      for prefix in site_nodes.values()]
+    userdata['own'] = (userdata['topic'], userdata['summary_topic'],
+                       userdata['site_topic'], userdata['link_topic'])
+    client = mqtt.Client(client_id='products', userdata=userdata)
+    client.on_connect = on_connect  # attach function to callback
+    client.on_message = on_message  # attach function to callback
+    client.connect(os.getenv('MQTT_BROKER', 'localhost'))  # connect to broker
+    client.loop_start()  # start the loop
+    if summary_enabled or uplink_broker:
+        publish_summaries(client, userdata,
+                          float(os.getenv('SUMMARY_DELAY', 5)))
+    if site_nodes:
+        publish_site(client, userdata, float(os.getenv('SITE_DELAY', 2)))
+
+    while True:
+        time.sleep(1)
@@ -0,0 +1,236 @@
+"""One merged station product from the MetPod nodes of a site.
+
+Larger sites run more than one MetPod hub, e.g. one on the wind mast and one
+in the enclosure, each publishing its own readings. Their messages are
+bridged to one broker under a topic prefix per node, set by SITE_NODES e.g.
+'mast=mast/metpod;enclosure=enclosure/metpod'. The readings of all nodes are
+aligned on their 'time' stamps into clock aligned slots of SITE_PERIOD
+seconds and, once a slot has ended (plus a delay for late messages), one
+product is reported with the latest value of each reading in the slot.
+Readings that are amounts, such as raintip, are totalled over the slot
+instead.
+
+A node's latest readings are held over slots without any of its messages
+until the node is stale, i.e. nothing has arrived from it for
+SITE_STALE_AFTER seconds. Each slot is judged as at its end against the
+node's arrivals, so the slots of a gap stay stale once the node resumes. The
+readings of stale nodes are reported as None and the nodes listed in 'stale',
+and 'nodes' gives each node's age (seconds since its last message) and
+message count. Each reading is prefixed with its node name, e.g.
+'mast_winddir'.
+
+Each message costs one dict lookup per level of its topic to find its node
+and one per reading, however many nodes there are, and at most max_slots
+slots are buffered, the oldest dropped first if messages run far ahead.
+"""
+from summary import KINDS
+
+# Message fields which are not readings.
+SKIP_FIELDS = ('time', 'tip_time', 'seq')
+
+
+def parse_nodes(config):
+    """Parse 'node=topic prefix;...' into {node: topic prefix}."""
+    nodes = {}
+    for entry in (config or '').split(';'):
+        if not entry.strip():
+            continue
+        name, _, prefix = entry.strip().partition('=')
+        if not name or not prefix:
+            raise ValueError('Site node %r is not node=topic prefix' % entry)
+        nodes[name] = prefix.rstrip('/')
+    return nodes
+
+
+class NodeState:
+    """The arrivals and held readings of one node."""
+
+    def __init__(self, name):
+        self.name = name
+        self.first_seen = None
+        self.last_seen = None
+        self.messages = 0
+        # (last arrival, next arrival) of the gaps not yet reported
+        self.gaps = []
+        # (node, topic, field) -> latest value
+        self.values = {}
+
+    def seen(self, arrival, stale_after):
+        """Record an arrival, and the gap before it if the node went stale.
+        """
+        if self.last_seen is None:
+            self.first_seen = arrival
+        elif arrival - self.last_seen > stale_after:
+            self.gaps.append((self.last_seen, arrival))
+        if self.last_seen is None or arrival > self.last_seen:
+            self.last_seen = arrival
+        self.messages += 1
+
+    def stale(self, at, stale_after):
+        """Return True if nothing had arrived for stale_after seconds at
+        UNIX time at."""
+        if self.first_seen is None or at < self.first_seen:
+            return True
+        if at - self.last_seen > stale_after:
+            return True
+        return any(last + stale_after < at < following
+                   for last, following in self.gaps)
+
+    def age(self, now):
+        if self.last_seen is None:
+            return None
+        return round(now - self.last_seen, 1)
+
+
+class SiteAggregator:
+    """Merges the readings of several nodes into one product per slot."""
+
+    def __init__(self, nodes, period=10, stale_after=60.0, max_slots=30):
+        """
+        :param nodes: {node: topic prefix}, from parse_nodes.
+        :param period: Seconds per slot.
+        :param stale_after: Seconds without a message before a node is
+        stale.
+        :param max_slots: The most slots buffered before being reported.
+        """
+        self.period = period
+        self.stale_after = stale_after
+        self.max_slots = max_slots
+        self.nodes = {name: NodeState(name) for name in nodes}
+        self.prefixes = {prefix: self.nodes[name]
+                         for name, prefix in nodes.items()}
+        # slot start -> {(node, topic, field): value}
+        self.slots = {}
+        self.reported_until = None
+        # (node, topic, field) -> True if summed over the slot
+        self.fields = {}
+        self.columns = None
+        self.late = 0
+        self.dropped = 0
+        self.unknown = 0
+
+    def node(self, topic):
+        """Return the NodeState of a topic, or None if not under a node's
+        prefix."""
+        prefix = topic
+        while True:
+            node = self.prefixes.get(prefix)
+            if node is not None:
+                return node
+            cut = prefix.rfind('/')
+            if cut < 0:
+                return None
+            prefix = prefix[:cut]
+
+    def add(self, topic, data, timestamp, arrival):
+        """Add the readings of a message.
+        :param topic: The topic the message was published on.
+        :param data: The decoded message.
+        :param timestamp: UNIX time of the readings.
+        :param arrival: UNIX time the message arrived.
+        :return: True if the readings were added.
+        """
+        node = self.node(topic)
+        if node is None:
+            self.unknown += 1
+            return False
+        node.seen(arrival, self.stale_after)
+        start = timestamp - timestamp % self.period
+        if self.reported_until is not None and start < self.reported_until:
+            self.late += 1
+            return False
+        slot = self.slots.get(start)
+        if slot is None:
+            slot = self.slots[start] = {}
+            if len(self.slots) > self.max_slots:
+                del self.slots[min(self.slots)]
+                self.dropped += 1
+        for field, value in data.items():
+            if field in SKIP_FIELDS or isinstance(value, bool) or \
+                    not isinstance(value, (int, float)):
+                continue
+            key = (node.name, topic, field)
+            summed = self.fields.get(key)
+            if summed is None:
+                summed = self.fields[key] = KINDS.get(field) == 'sum'
+                self.columns = None
+            if summed:
+                slot[key] = slot.get(key, 0) + value
+            else:
+                slot[key] = value
+        return True
+
+    def names(self):
+        """Return [(key, product field name)] in key order, the field
+        qualified by the node, so that a column keeps its name when another
+        node starts publishing the field, and also by the last part of the
+        topic when the node has more than one sensor publishing it."""
+        if self.columns is None:
+            sensors = {}
+            for name, topic, field in self.fields:
+                sensors[(name, field)] = sensors.get((name, field), 0) + 1
+            columns = []
+            for key in sorted(self.fields):
+                name, topic, field = key
+                if sensors[(name, field)] > 1:
+                    field = topic.rsplit('/', 1)[-1] + '_' + field
+                columns.append((key, name + '_' + field))
+            self.columns = columns
+        return self.columns
+
+    def stale(self, at):
+        """Return the names of the nodes stale at UNIX time at."""
+        return sorted(name for name, node in self.nodes.items()
+                      if node.stale(at, self.stale_after))
+
+    def product(self, start, slot, now):
+        # Staleness is as at the end of the slot, judged against the gaps in
+        # the node's arrivals, so that the slots filled in after a gap report
+        # the node stale during it even once it has resumed.
+        stale = self.stale(start + self.period)
+        product = {'time': start + self.period, 'period': self.period}
+        for key, name in self.names():
+            node = self.nodes[key[0]]
+            if self.fields[key]:
+                value = slot.get(key)
+                if value is not None:
+                    value = round(value, 3)
+            elif key in slot:
+                value = node.values[key] = slot[key]
+            else:
+                value = node.values.get(key)
+            product[name] = None if node.name in stale else value
+        product['nodes'] = {name: {'age': node.age(now),
+                                   'messages': node.messages}
+                            for name, node in sorted(self.nodes.items())}
+        product['stale'] = stale
+        return product
+
+    def close(self, now, delay=0.0):
+        """Report the slots ended by now - delay.
+        :param now: UNIX time, for the nodes' ages.
+        :param delay: Seconds allowed for late messages.
+        :return: A list of product dicts, oldest first.
+        """
+        end = now - delay
+        end -= end % self.period
+        if self.reported_until is None:
+            self.reported_until = min(list(self.slots) + [end])
+        # After a long gap only the last max_slots slots are reported.
+        self.reported_until = max(self.reported_until,
+                                  end - self.max_slots * self.period)
+        products = []
+        while self.reported_until < end:
+            start = self.reported_until
+            products.append(self.product(start, self.slots.pop(start, {}),
+                                         now))
+            self.reported_until = start + self.period
+        for start in [start for start in self.slots
+                      if start < self.reported_until]:
+            # Skipped over after a long gap.
+            del self.slots[start]
+            self.dropped += 1
+        for node in self.nodes.values():
+            node.gaps = [gap for gap in node.gaps
+                         if gap[1] > self.reported_until]
+        return products
@@ -0,0 +1,283 @@
+"""Clock aligned station summaries of the sensor readings.
+
+Each reading is added to the aggregator of its field for the minute of its
+'time' stamp, which costs the same however many sensors there are. When a
+minute ends (plus a delay for late messages) its aggregators are reported,
+and merged into the 10 minute aggregators, which are reported at the end
+of each 10 minutes. Readings arriving after their period has been reported
+are counted as late and otherwise ignored. At most backfill minutes are
+reported at once, so a message stamped long ago (e.g. retained, or with a
+bad clock) does not flood the broker with empty reports, and a 10 minute
+period is only reported if its first minute was.
+
+Wind is averaged as vectors, with the gust the highest 3 sample (3 s at
+1 Hz) running mean speed. Fields with no readings in a period are reported
+as None and listed in 'missing', and each report carries the number of
+readings behind every field in 'counts'.
+"""
+import math
+from collections import deque
+
+# How each field is summarised. Fields not listed are ignored, as are the
+# WindSonic driver's own rolling means and gusts.
+KINDS = {
+    'windspd': 'wind',
+    'temperature': 'mean',
+    'humidity': 'mean',
+    'dew_point': 'mean',
+    'pressure': 'mean',
+    'raintip': 'sum',
+    'rainrate': 'max',
+}
+
+
+class MeanAggregator:
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        if not self.count or value < self.min:
+            self.min = value
+        if not self.count or value > self.max:
+            self.max = value
+        self.count += 1
+        self.sum += value
+
+    def merge(self, other):
+        if other.count:
+            if not self.count or other.min < self.min:
+                self.min = other.min
+            if not self.count or other.max > self.max:
+                self.max = other.max
+            self.count += other.count
+            self.sum += other.sum
+
+    def result(self, name):
+        if not self.count:
+            return {name: None, name + '_min': None, name + '_max': None}
+        return {name: round(self.sum / self.count, 2),
+                name + '_min': self.min, name + '_max': self.max}
+
+
+class SumAggregator:
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+
+    def add(self, value):
+        self.count += 1
+        self.sum += value
+
+    def merge(self, other):
+        self.count += other.count
+        self.sum += other.sum
+
+    def result(self, name):
+        return {name: round(self.sum, 3) if self.count else None}
+
+
+class MaxAggregator:
+
+    def __init__(self):
+        self.count = 0
+        self.max = None
+
+    def add(self, value):
+        if not self.count or value > self.max:
+            self.max = value
+        self.count += 1
+
+    def merge(self, other):
+        if other.count:
+            if not self.count or other.max > self.max:
+                self.max = other.max
+            self.count += other.count
+
+    def result(self, name):
+        return {name + '_max': self.max}
+
+
+class WindAggregator:
+    """Vector mean direction and speed, scalar mean speed, gust and lull."""
+
+    def __init__(self):
+        self.count = 0
+        self.u = 0.0
+        self.v = 0.0
+        self.speed = 0.0
+        self.gust = None
+        self.lull = None
+
+    def add(self, speed, direction, gust_speed):
+        radians = math.radians(direction)
+        self.u += speed * math.sin(radians)
+        self.v += speed * math.cos(radians)
+        self.speed += speed
+        self.count += 1
+        if gust_speed is not None:
+            if self.gust is None or gust_speed > self.gust:
+                self.gust = gust_speed
+            if self.lull is None or gust_speed < self.lull:
+                self.lull = gust_speed
+
+    def merge(self, other):
+        self.count += other.count
+        self.u += other.u
+        self.v += other.v
+        self.speed += other.speed
+        for extreme, better in (('gust', max), ('lull', min)):
+            value = getattr(other, extreme)
+            if value is not None:
+                current = getattr(self, extreme)
+                setattr(self, extreme, value if current is None
+                        else better(current, value))
+
+    def result(self, name):
+        # name is 'windspd', or e.g. 'north_windspd' for several sensors.
+        prefix = name[:-len('windspd')]
+        direction = speed = gust = lull = None
+        if self.count:
+            if self.u or self.v:
+                direction = int(round(math.degrees(
+                    math.atan2(self.u, self.v)))) % 360 or 360
+            speed = round(self.speed / self.count, 1)
+        if self.gust is not None:
+            gust = round(self.gust, 1)
+            lull = round(self.lull, 1)
+        return {prefix + 'winddir': direction, prefix + 'windspd': speed,
+                prefix + 'windgust': gust, prefix + 'windlull': lull}
+
+
+AGGREGATORS = {'mean': MeanAggregator, 'sum': SumAggregator,
+               'max': MaxAggregator, 'wind': WindAggregator}
+
+
+class SummaryGenerator:
+    """Aggregates readings into per minute and per 10 minute reports."""
+
+    def __init__(self, period=60, multiple=10, gust_samples=3,
+                 backfill=10):
+        self.period = period
+        self.backfill = backfill
+        self.long_period = period * multiple
+        self.gust_samples = gust_samples
+        # minute start -> {(topic, field): aggregator}
+        self.minutes = {}
+        self.long = {}
+        self.long_start = None
+        # Whether the 10 minute aggregators have every minute reported.
+        self.long_whole = False
+        self.reported_until = None
+        self.gust_windows = {}
+        self.fields = {}
+        self.late = 0
+
+    def add(self, topic, data, timestamp):
+        """Add the readings of a message.
+        :param topic: The topic the message was published on.
+        :param data: The decoded message.
+        :param timestamp: UNIX time of the readings.
+        """
+        start = timestamp - timestamp % self.period
+        if self.reported_until is not None and start < self.reported_until:
+            self.late += 1
+            return
+        aggregators = self.minutes.setdefault(start, {})
+        for field, value in data.items():
+            kind = KINDS.get(field)
+            if kind is None or isinstance(value, bool) or \
+                    not isinstance(value, (int, float)):
+                continue
+            key = (topic, field)
+            aggregator = aggregators.get(key)
+            if aggregator is None:
+                aggregator = aggregators[key] = AGGREGATORS[kind]()
+                self.fields.setdefault(key, kind)
+            if kind == 'wind':
+                direction = data.get('winddir')
+                if not isinstance(direction, (int, float)):
+                    continue
+                window = self.gust_windows.get(topic)
+                if window is None:
+                    window = self.gust_windows[topic] = deque(
+                        maxlen=self.gust_samples)
+                window.append(value)
+                gust_speed = sum(window) / len(window) \
+                    if len(window) == window.maxlen else None
+                aggregator.add(value, direction, gust_speed)
+            else:
+                aggregator.add(value)
+
+    def names(self):
+        """Return the report field name of each (topic, field), qualified
+        by the topic when more than one sensor publishes the field."""
+        topics = {}
+        for topic, field in self.fields:
+            topics.setdefault(field, []).append(topic)
+        names = {}
+        for (topic, field), kind in self.fields.items():
+            name = field
+            if len(topics[field]) > 1:
+                name = topic.rsplit('/', 1)[-1] + '_' + field
+            names[(topic, field)] = name
+        return names
+
+    def report(self, start, period, aggregators):
+        names = self.names()
+        report = {'time': start + period, 'period': period}
+        counts = {}
+        missing = []
+        for key, kind in sorted(self.fields.items()):
+            aggregator = aggregators.get(key)
+            if aggregator is None:
+                aggregator = AGGREGATORS[kind]()
+            name = names[key]
+            report.update(aggregator.result(name))
+            counts[name] = aggregator.count
+            if not aggregator.count:
+                missing.append(name)
+        report['counts'] = counts
+        report['missing'] = missing
+        return report
+
+    def close(self, now):
+        """Report the periods ended by now.
+        :param now: UNIX time, allowing for any delay for late messages.
+        :return: A list of report dicts, oldest first.
+        """
+        end = now - now % self.period
+        if self.reported_until is None:
+            self.reported_until = min(list(self.minutes) + [end])
+        oldest = end - self.backfill * self.period
+        if self.reported_until < oldest:
+            self.reported_until = oldest
+            for start in [start for start in self.minutes
+                          if start < oldest]:
+                del self.minutes[start]
+            self.long_start = None
+        reports = []
+        while self.reported_until < end:
+            start = self.reported_until
+            aggregators = self.minutes.pop(start, {})
+            reports.append(self.report(start, self.period, aggregators))
+            long_start = start - start % self.long_period
+            if long_start != self.long_start:
+                self.long_start = long_start
+                self.long_whole = start == long_start
+                self.long = {}
+            for key, aggregator in aggregators.items():
+                merged = self.long.get(key)
+                if merged is None:
+                    merged = self.long[key] = AGGREGATORS[self.fields[key]]()
+                merged.merge(aggregator)
+            self.reported_until = start + self.period
+            if self.reported_until % self.long_period == 0 and \
+                    self.long_whole:
+                reports.append(self.report(long_start, self.long_period,
+                                           self.long))
+        return reports
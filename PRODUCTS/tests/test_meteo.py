@@ -0,0 +1,58 @@
+import unittest
+import meteo
+from derived import ProductEngine
+
+
+class MeteoTest(unittest.TestCase):
+
+    def test_humidity_products(self):
+        """Test the vapour pressure, dew point and wet bulb against
+        tabulated values."""
+        self.assertAlmostEqual(meteo.saturation_vapour_pressure(20), 23.37,
+                               places=1)
+        self.assertAlmostEqual(meteo.vapour_pressure(20, 50), 11.69,
+                               places=1)
+        self.assertAlmostEqual(meteo.dew_point(20, 50), 9.3, places=1)
+        self.assertAlmostEqual(meteo.dew_point(15, 100), 15.0, places=3)
+        self.assertAlmostEqual(meteo.wet_bulb(20, 50, 1013.25), 13.7,
+                               delta=0.2)
+        self.assertAlmostEqual(meteo.wet_bulb(10, 100, 1000), 10.0,
+                               places=2)
+
+    def test_pressure_products(self):
+        """Test the pressure reductions."""
+        self.assertAlmostEqual(meteo.qnh(1013.25, 0), 1013.25, places=3)
+        # 1000 hPa is 110.9 m in the standard atmosphere.
+        self.assertAlmostEqual(meteo.qnh(1000, 110.9), 1013.25, places=1)
+        self.assertAlmostEqual(meteo.qfe(1000, 0), 1000)
+        self.assertGreater(meteo.qfe(1000, 2), 1000)
+        self.assertAlmostEqual(meteo.mslp(1000, 15, 100), 1012.0, delta=0.1)
+        # Cold air columns are denser, giving a higher sea level pressure.
+        self.assertGreater(meteo.mslp(1000, -10, 100),
+                           meteo.mslp(1000, 15, 100))
+
+
+class ProductEngineTest(unittest.TestCase):
+
+    def test_alignment_and_memoization(self):
+        """Test that inputs are aligned by time within the tolerance and
+        products are only recomputed when their inputs change."""
+        engine = ProductEngine(elevation=100, tolerance=5)
+        self.assertEqual(engine.add('pressure', 1000.0, 1000.0)['qnh'],
+                         1011.9)
+        products = engine.add('temperature', 1002.0, 15.0)
+        self.assertIn('mslp', products)
+        self.assertNotIn('dew_point', products)
+        products = engine.add('humidity', 1003.0, 50)
+        self.assertEqual(products['dew_point'], 4.7)
+        self.assertIn('wet_bulb', products)
+        # The pressure sample is now too old to be aligned.
+        products = engine.add('humidity', 1006.0, 50)
+        self.assertNotIn('qnh', products)
+        self.assertEqual(engine.memos['dew_point'].calls, 1)
+        engine.add('temperature', 1007.0, 15.5)
+        self.assertEqual(engine.memos['dew_point'].calls, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
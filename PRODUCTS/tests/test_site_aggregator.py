@@ -0,0 +1,119 @@
+import unittest
+from site_aggregator import SiteAggregator, parse_nodes
+
+
+class SiteAggregatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.site = SiteAggregator(parse_nodes(
+            'mast=mast/metpod;enclosure=enclosure/metpod/'), period=10,
+            stale_after=30)
+        # The start of a slot.
+        self.start = 1760000400.0
+
+    def test_merged_products(self):
+        """Test that the nodes' readings are aligned into one product per
+        slot, with amounts totalled, readings held over slots without
+        messages and every field qualified by its node."""
+        for second in range(20):
+            timestamp = self.start + second
+            self.site.add('mast/metpod/windsonic',
+                          {'winddir': 180 + second, 'windspd': 4.0,
+                           'time': timestamp}, timestamp, timestamp + 0.1)
+            if second < 10:
+                self.site.add('enclosure/metpod/ptu300',
+                              {'temperature': 10.0 + second / 10,
+                               'time': timestamp}, timestamp, timestamp)
+        for node in ('mast', 'enclosure'):
+            self.site.add(node + '/metpod/raingauge', {'raintip': 0.2},
+                          self.start + 1, self.start + 20)
+        self.site.add('enclosure/metpod/raingauge', {'raintip': 0.2},
+                      self.start + 2, self.start + 20)
+        self.site.add('other/metpod/ptu300', {'temperature': 5.0},
+                      self.start, self.start)
+        self.assertEqual(self.site.unknown, 1)
+
+        products = self.site.close(self.start + 21, delay=1)
+        self.assertEqual([product['time'] for product in products],
+                         [self.start + 10, self.start + 20])
+        first, second = products
+        self.assertEqual(first['mast_winddir'], 189)
+        self.assertEqual(first['enclosure_temperature'], 10.9)
+        self.assertEqual(first['mast_raintip'], 0.2)
+        self.assertEqual(first['enclosure_raintip'], 0.4)
+        self.assertEqual(second['mast_winddir'], 199)
+        self.assertEqual(second['enclosure_temperature'], 10.9)
+        self.assertIsNone(second['enclosure_raintip'])
+        self.assertEqual(second['stale'], [])
+        self.assertEqual(second['nodes']['mast'],
+                         {'age': 1.0, 'messages': 21})
+
+        # A column keeps its name when a second node publishes the field.
+        self.site.add('enclosure/metpod/windsonic', {'winddir': 90},
+                      self.start + 21, self.start + 21)
+        names = dict(self.site.names())
+        self.assertEqual(names[('mast', 'mast/metpod/windsonic',
+                                'winddir')], 'mast_winddir')
+        self.assertEqual(names[('enclosure', 'enclosure/metpod/windsonic',
+                                'winddir')], 'enclosure_winddir')
+
+        # Late messages are counted and otherwise ignored.
+        self.assertFalse(self.site.add('mast/metpod/windsonic',
+                                       {'windspd': 1.0}, self.start + 5,
+                                       self.start + 22))
+        self.assertEqual(self.site.late, 1)
+
+    def test_stale_nodes(self):
+        """Test that a node's readings are reported as None from the first
+        slot ending a stale period after its last message, and that the
+        buffered slots are bounded."""
+        self.site.add('mast/metpod/windsonic', {'windspd': 4.0},
+                      self.start, self.start)
+        self.site.add('enclosure/metpod/ptu300', {'temperature': 10.0},
+                      self.start, self.start)
+        for second in range(60):
+            timestamp = self.start + second
+            self.site.add('mast/metpod/windsonic', {'windspd': 5.0},
+                          timestamp, timestamp)
+        products = self.site.close(self.start + 61)
+        self.assertEqual(len(products), 6)
+        # Staleness is as at the end of each slot.
+        self.assertEqual([product['stale'] for product in products],
+                         [[]] * 3 + [['enclosure']] * 3)
+        self.assertEqual(products[2]['enclosure_temperature'], 10.0)
+        last = products[-1]
+        self.assertEqual(last['mast_windspd'], 5.0)
+        self.assertIsNone(last['enclosure_temperature'])
+        self.assertEqual(last['stale'], ['enclosure'])
+        self.assertEqual(last['nodes']['enclosure']['age'], 61)
+
+        for slot in range(100):
+            timestamp = self.start + 100 + slot * 10
+            self.site.add('mast/metpod/windsonic', {'windspd': 5.0},
+                          timestamp, timestamp)
+        self.assertEqual(len(self.site.slots), 30)
+        self.assertEqual(self.site.dropped, 70)
+
+    def test_stale_gap_after_resuming(self):
+        """Test that the slots of a node's gap are reported stale when the
+        node resumes before they are reported."""
+        for second in range(60):
+            timestamp = self.start + second
+            self.site.add('mast/metpod/windsonic', {'windspd': 5.0},
+                          timestamp, timestamp)
+            if second == 0 or second >= 55:
+                self.site.add('enclosure/metpod/ptu300',
+                              {'temperature': 10.0 + second},
+                              timestamp, timestamp)
+        products = self.site.close(self.start + 61)
+        self.assertEqual([product['stale'] for product in products],
+                         [[]] * 3 + [['enclosure']] * 2 + [[]])
+        self.assertEqual([product['enclosure_temperature']
+                          for product in products],
+                         [10.0] * 3 + [None] * 2 + [69.0])
+        self.assertEqual(products[-1]['nodes']['enclosure']['age'], 2)
+        self.assertEqual(self.site.nodes['enclosure'].gaps, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
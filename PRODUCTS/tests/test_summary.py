@@ -0,0 +1,88 @@
+import unittest
+from summary import SummaryGenerator
+
+
+class SummaryGeneratorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.summary = SummaryGenerator()
+        # The start of a 10 minute period.
+        self.start = 1760000400.0
+
+    def test_minute_and_10_minute_reports(self):
+        """Test that readings are summarised into clock aligned minute and
+        10 minute reports, with wind averaged as vectors."""
+        for second in range(600):
+            timestamp = self.start + second
+            self.summary.add('metpod/windsonic', {
+                'winddir': 350 if second % 2 else 10, 'windspd': 4,
+                'windgust': 99, 'time': timestamp}, timestamp)
+            if second % 10 == 0:
+                self.summary.add('metpod/ptu300', {
+                    'pressure': 1000 + second / 600, 'temperature': 10.0,
+                    'dew_point': 5.0, 'humidity': 71}, timestamp)
+        self.summary.add('metpod/raingauge', {'raintip': 0.2,
+                                              'rainrate': 3.0},
+                         self.start + 30)
+        reports = self.summary.close(self.start + 600)
+        self.assertEqual([report['period'] for report in reports],
+                         [60] * 10 + [600])
+        first = reports[0]
+        self.assertEqual(first['time'], self.start + 60)
+        self.assertEqual(first['winddir'], 360)
+        self.assertEqual(first['windspd'], 4)
+        self.assertEqual(first['windgust'], 4)
+        self.assertEqual(first['raintip'], 0.2)
+        self.assertEqual(first['counts']['pressure'], 6)
+        self.assertEqual(reports[1]['raintip'], None)
+        self.assertEqual(reports[1]['missing'], ['rainrate', 'raintip'])
+        ten = reports[-1]
+        self.assertEqual(ten['time'], self.start + 600)
+        self.assertEqual(ten['counts']['windspd'], 600)
+        self.assertEqual(ten['pressure_min'], 1000)
+        self.assertEqual(ten['raintip'], 0.2)
+        self.assertEqual(ten['rainrate_max'], 3.0)
+
+    def test_late_and_missing_data(self):
+        """Test that late readings are counted and ignored, that gaps are
+        reported as missing, and that duplicated fields are qualified."""
+        self.summary.add('metpod/ptu300', {'pressure': 1000},
+                         self.start + 1)
+        self.summary.add('metpod/ptb220', {'pressure': 1001},
+                         self.start + 2)
+        reports = self.summary.close(self.start + 60)
+        self.assertEqual(reports[0]['ptu300_pressure'], 1000)
+        self.assertEqual(reports[0]['ptb220_pressure'], 1001)
+        self.summary.add('metpod/ptu300', {'pressure': 1000},
+                         self.start + 3)
+        self.assertEqual(self.summary.late, 1)
+        reports = self.summary.close(self.start + 180)
+        self.assertEqual(len(reports), 2)
+        self.assertEqual(reports[-1]['missing'],
+                         ['ptb220_pressure', 'ptu300_pressure'])
+
+    def test_bounded_backfill(self):
+        """Test that a message stamped days ago only backfills a bounded
+        number of minute reports, and that a 10 minute period whose start
+        was not reported is not reported as if complete."""
+        self.summary.add('metpod/ptu300', {'temperature': 10.0},
+                         self.start - 3 * 86400)
+        self.summary.add('metpod/ptu300', {'temperature': 11.0},
+                         self.start + 300)
+        # No report of the 10 minutes ending at self.start, which began
+        # before the first minute reported.
+        reports = self.summary.close(self.start + 420)
+        self.assertEqual([report['period'] for report in reports],
+                         [60] * 10)
+        self.assertEqual(reports[0]['time'], self.start - 120)
+        self.assertEqual(reports[-1]['temperature'], None)
+        self.assertEqual(reports[-2]['temperature'], 11.0)
+        # The 10 minute period from self.start is complete.
+        reports = self.summary.close(self.start + 600)
+        self.assertEqual([report['period'] for report in reports],
+                         [60] * 3 + [600])
+        self.assertEqual(reports[-1]['temperature'], 11.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
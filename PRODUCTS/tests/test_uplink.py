@@ -0,0 +1,141 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from link_health import LinkHealth
+from uplink import Uplink, parse_tiers
+
+
+class UpstreamClient:
+
+    def __init__(self):
+        self.messages = []
+
+    def publish(self, topic, payload, qos=0):
+        self.messages.append((topic, payload, qos))
+
+
+class UplinkTest(unittest.TestCase):
+
+    def test_tiers(self):
+        """Test that each topic is sent upstream by its configured tiers."""
+        upstream = UpstreamClient()
+        uplink = Uplink(upstream, parse_tiers(
+            'metpod/windsonic=10m;metpod/ptu300=1m+10m;'
+            'metpod/raingauge=raw;metpod/debug=none'))
+        start = 1760000400.0
+        for second in range(600):
+            timestamp = start + second
+            for topic, data in (
+                    ('metpod/windsonic', {'winddir': 90, 'windspd': 3}),
+                    ('metpod/ptu300', {'temperature': 10.0}),
+                    ('metpod/debug', {'temperature': 10.0}),
+                    ('metpod/other', {'pressure': 1000.0})):
+                uplink.add(topic, data, json.dumps(data), timestamp)
+        uplink.add('metpod/raingauge', {'raintip': 0.2}, '{"raintip": 0.2}',
+                   start)
+        uplink.add('metpod/summary/1m', {'period': 60}, '{"period": 60}',
+                   start)
+        uplink.close(start + 600)
+        topics = [message[0] for message in upstream.messages]
+        self.assertEqual(topics.count('metpod/raingauge'), 1)
+        self.assertEqual(topics.count('metpod/summary/1m'), 1)
+        self.assertEqual(topics.count('metpod/windsonic/10m'), 1)
+        self.assertEqual(topics.count('metpod/windsonic/1m'), 0)
+        self.assertEqual(topics.count('metpod/ptu300/1m'), 10)
+        self.assertEqual(topics.count('metpod/ptu300/10m'), 1)
+        self.assertEqual(topics.count('metpod/other/1m'), 10)
+        self.assertFalse([topic for topic in topics if 'debug' in topic])
+        report = json.loads(dict(
+            message[:2] for message in upstream.messages)[
+            'metpod/windsonic/10m'])
+        self.assertEqual((report['period'], report['winddir']), (600, 90))
+        self.assertEqual(uplink.forwarded, len(upstream.messages))
+        self.assertRaises(ValueError, parse_tiers, 'metpod/ptu300=5m')
+
+    def test_link_adaptation(self):
+        """Test that raw tiers degrade to summaries with lower QoS on a
+        poor link, are spooled while it is down and sent on recovery."""
+        state_file = os.path.join(tempfile.mkdtemp(), 'link_state')
+        health = LinkHealth(state_file, rtt_poor=2.0)
+        upstream = UpstreamClient()
+        uplink = Uplink(upstream, parse_tiers('metpod/windsonic=raw'),
+                        health=health)
+        health.on_connect(None, None, {}, 0)
+        data = {'winddir': 90, 'windspd': 3}
+        start = 1760000400.0
+
+        uplink.add('metpod/windsonic', data, '{}', start)
+        self.assertEqual(len(upstream.messages), 1)
+
+        health.sent(1, now=0.0)
+        health.acknowledged(1, now=5.0)
+        self.assertEqual(health.state(), 'poor')
+        for second in range(1, 60):
+            uplink.add('metpod/windsonic', data, '{}', start + second)
+        uplink.close(start + 60)
+        self.assertEqual(upstream.messages[1:],
+                         [('metpod/windsonic/1m', upstream.messages[1][1],
+                           0)])
+
+        with open(state_file, 'w') as probe:
+            json.dump({'time': time.time(), 'online': False}, probe)
+        uplink.close(start + 60)
+        self.assertEqual(uplink.link_state, 'down')
+        for second in range(60, 180):
+            uplink.add('metpod/windsonic', data, '{}', start + second)
+        uplink.close(start + 180)
+        self.assertEqual(len(upstream.messages), 2)
+        self.assertEqual(len(uplink.spool), 2)
+        self.assertEqual(health.snapshot()['online'], False)
+
+        with open(state_file, 'w') as probe:
+            json.dump({'time': time.time(), 'online': True}, probe)
+        health.on_connect(None, None, {}, 0)
+        uplink.close(start + 180)
+        self.assertEqual(len(upstream.messages), 4)
+        self.assertFalse(uplink.spool)
+        uplink.add('metpod/windsonic', data, '{}', start + 181)
+        self.assertEqual(upstream.messages[-1][0], 'metpod/windsonic')
+
+    def test_failed_probe_expires(self):
+        """Test that a failed probe no longer holds the link down once it
+        is old, or once a publish has been acknowledged since."""
+        state_file = os.path.join(tempfile.mkdtemp(), 'link_state')
+        health = LinkHealth(state_file, probe_max_age=240)
+        health.on_connect(None, None, {}, 0)
+        probe_time = time.time() - 10
+        with open(state_file, 'w') as probe:
+            json.dump({'time': probe_time, 'online': False}, probe)
+        health.read_probe()
+        self.assertEqual(health.state(), 'down')
+        health.read_probe(now=probe_time + 241)
+        self.assertEqual(health.state(), 'good')
+        health.read_probe()
+        self.assertEqual(health.state(), 'down')
+        health.sent(1, now=0.0)
+        health.acknowledged(1, now=0.1)
+        self.assertEqual(health.state(), 'good')
+
+    def test_qos_0_publishes(self):
+        """Test that the on_publish of QoS 0 publishes is not taken for an
+        acknowledgement, and that unmatched acknowledgements expire."""
+        health = LinkHealth(ack_timeout=30)
+        health.on_connect(None, None, {}, 0)
+        health.acknowledged(1, now=0.0)
+        health.sent(1, qos=0, now=0.0)
+        health.sent(2, qos=0, now=0.0)
+        health.acknowledged(2, now=0.1)
+        self.assertEqual((health.early, health.unacknowledged), ({}, {}))
+        self.assertIsNone(health.rtt)
+        health.acknowledged(3, now=1.0)
+        health.state(now=40.0)
+        self.assertEqual(health.early, {})
+        health.sent(3, now=41.0)
+        health.acknowledged(3, now=41.5)
+        self.assertEqual(health.rtt, 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+"""Forward readings from the local broker to the upstream broker by tier.
+
+The drivers publish every reading to the local broker, where the store,
+products and summaries use them at full rate. Only the tiers configured for
+each sensor topic are sent upstream:
+
+raw    every message, as published
+1m     per minute summaries, published upstream to <topic>/1m
+10m    per 10 minute summaries, published upstream to <topic>/10m
+none   nothing
+
+Tiers are set per topic with UPLINK_TIERS e.g.
+'metpod/windsonic=10m;metpod/ptu300=1m+10m;metpod/raingauge=raw', and
+UPLINK_DEFAULT_TIER (default 1m) for other topics. Messages which are
+already summaries (those with a 'period' field) are forwarded as they are
+unless their tier is none. The products service's own products, summaries
+and link health are not forwarded.
+
+With a LinkHealth, sending adapts to the link: while it is poor, raw tiers
+are sent as minute summaries instead and per minute messages with QoS 0,
+and while it is down messages are held in a bounded spool (oldest dropped
+first), which is sent once the link is good again.
+"""
+import json
+from collections import deque
+from link_health import DOWN, GOOD
+from summary import SummaryGenerator
+
+TIERS = ('raw', '1m', '10m', 'none')
+SUFFIXES = {60: '1m', 600: '10m'}
+
+
+def parse_tiers(config):
+    """Parse 'topic=tier[+tier];...' into {topic: set of tiers}."""
+    tiers = {}
+    for entry in (config or '').split(';'):
+        if not entry.strip():
+            continue
+        topic, _, names = entry.strip().partition('=')
+        tiers[topic] = parse_tier(names)
+    return tiers
+
+
+def parse_tier(names):
+    tier = set(names.split('+'))
+    unknown = tier.difference(TIERS)
+    if unknown:
+        raise ValueError('Unknown uplink tier ' + ', '.join(sorted(unknown)))
+    return tier
+
+
+class Uplink:
+    """Sends the configured tiers of each topic to the upstream client."""
+
+    def __init__(self, upstream, tiers, default='1m', qos=1, health=None,
+                 spool_size=10000, drain_size=600):
+        """
+        :param upstream: The upstream client, anything with publish().
+        :param tiers: {topic: set of tiers}, from parse_tiers.
+        :param default: The tier(s) of other topics e.g. '1m+10m'.
+        :param qos: QoS of the upstream messages.
+        :param health: A LinkHealth, or None to always send.
+        :param spool_size: Messages held while the link is down.
+        :param drain_size: Spooled messages sent per close() call.
+        """
+        self.upstream = upstream
+        self.tiers = tiers
+        self.default = parse_tier(default)
+        self.qos = qos
+        self.health = health
+        self.spool = deque(maxlen=spool_size)
+        self.drain_size = drain_size
+        self.link_state = GOOD
+        self.summaries = {}
+        self.forwarded = 0
+        self.received = 0
+        self.spool_dropped = 0
+
+    def tier(self, topic):
+        tier = self.tiers.get(topic, self.default)
+        if 'raw' in tier and self.link_state != GOOD:
+            # Degrade to summaries until the link recovers.
+            tier = (tier - {'raw'}) | {'1m'}
+        return tier
+
+    def add(self, topic, data, payload, timestamp):
+        """Handle a message from the local broker.
+        :param topic: The local topic.
+        :param data: The decoded message.
+        :param payload: The message as published.
+        :param timestamp: UNIX time of the readings.
+        """
+        self.received += 1
+        if self.health is not None:
+            self.link_state = self.health.state()
+        tier = self.tier(topic)
+        if 'none' in tier:
+            return
+        if 'raw' in tier or 'period' in data:
+            self.send(topic, payload, data.get('period'))
+            return
+        summary = self.summaries.get(topic)
+        if summary is None:
+            summary = self.summaries[topic] = SummaryGenerator()
+        summary.add(topic, data, timestamp)
+
+    def update_link(self):
+        """Read the link health, returning the link state."""
+        if self.health is not None:
+            self.health.read_probe()
+            self.link_state = self.health.state()
+        return self.link_state
+
+    def close(self, now):
+        """Send the summaries of the periods ended by now, and then any
+        spooled messages if the link is good."""
+        self.update_link()
+        for topic, summary in self.summaries.items():
+            tier = self.tier(topic)
+            for report in summary.close(now):
+                suffix = SUFFIXES[report['period']]
+                if suffix in tier:
+                    self.send(topic + '/' + suffix, report,
+                              report['period'])
+        if self.link_state == GOOD:
+            for _ in range(min(self.drain_size, len(self.spool))):
+                self.publish(*self.spool.popleft())
+
+    def send(self, topic, message, period=None):
+        """Send a message, or spool it while the link is down.
+        :param topic: The upstream topic.
+        :param message: The payload, or a dict to be sent as JSON.
+        :param period: The summary period of the message, if any.
+        """
+        if isinstance(message, dict):
+            message = json.dumps(message)
+        qos = self.qos
+        if self.link_state != GOOD and period == 60:
+            # Later 10 minute summaries cover for lost minute summaries.
+            qos = 0
+        if self.link_state == DOWN:
+            if len(self.spool) == self.spool.maxlen:
+                self.spool_dropped += 1
+            self.spool.append((topic, message, qos))
+            return
+        self.publish(topic, message, qos)
+
+    def publish(self, topic, message, qos):
+        info = self.upstream.publish(topic, message, qos)
+        if self.health is not None:
+            self.health.sent(getattr(info, 'mid', None), qos)
+        self.forwarded += 1
@@ -3,18 +3,16 @@ import os
 import time
 import json
 import logging
+import metrics
 from collections import OrderedDict
-from rain_rate_calc import BucketTipHandler
+from rain_state import RainState
 import RPi.GPIO as GPIO
 from threading import Timer
 
 
 class RainGaugeSetup:
 
-    def __init__(self, client, mqtt_topic, mqtt_qos):
-        logging.basicConfig(level=logging.DEBUG)
-        logging.captureWarnings(True)
-
+    def __init__(self, client, mqtt_topic, mqtt_qos, owner_thread=True):
         # The Raspberry Pi GPIO pin number to which one wire of the tipping
         # bucket rain gauge will be connected. The other wire will be
         # connected to any GND pin.
@@ -42,14 +40,41 @@ class RainGaugeSetup:
         else:
             self.units = 'mm/hr'
 
-        self.rain_data = OrderedDict(
-            [('rainrate', 0.0), ('raintip', 0.0), ('units', self.units)])
-
-        self.bucket_tip_handler = BucketTipHandler(self.amount_per_tip)
+        # Only the state's owner thread changes the rate and tips, and
+        # sends the messages. Without an owner thread (e.g. in the soak
+        # test) they are handled on the GPIO callback and Timer threads.
+        self.state = RainState(self.amount_per_tip, self.publish_tip,
+                               self.publish_rain, start=owner_thread)
+        self.bucket_tip_handler = self.state.bucket_tip_handler
+
+        # Each bucket tip is also published as soon as it is detected, to
+        # TIP_TOPIC (none if empty), numbered so that lost tips show up as
+        # gaps in the sequence.
+        self.tip_topic = os.getenv('TIP_TOPIC', '%s/tip' % mqtt_topic)
+
+        self.tips = metrics.REGISTRY.counter(
+            'rain_tips_total', 'Bucket tips', sensor='raingauge')
+        self.noise_tips = metrics.REGISTRY.counter(
+            'rain_tip_noise_total', 'GPIO edges rejected as noise',
+            sensor='raingauge')
+        self.tip_seconds = metrics.REGISTRY.histogram(
+            'rain_tip_seconds',
+            'Time to post a bucket tip to the rain state',
+            sensor='raingauge')
+        self.publish_seconds = metrics.REGISTRY.histogram(
+            'publish_seconds', 'Time to hand a message to the MQTT client',
+            sensor='raingauge')
+        self.published = metrics.REGISTRY.counter(
+            'published_total', 'Messages published', sensor='raingauge')
+        self.tip_latency = metrics.REGISTRY.histogram(
+            'rain_tip_latency_seconds',
+            'Time from a bucket tip GPIO edge to its tip message',
+            sensor='raingauge')
 
         logging.info('Amount per tip = ' + str(self.amount_per_tip))
         logging.info('Units = ' + str(self.units))
         logging.info('TX Interval = ' + str(self.tx_interval))
+        logging.info('Tip topic = ' + str(self.tip_topic))
 
         # Tipping bucket gauge connected to GPIO pin on Raspberry Pi.
         # This registers the call back for pin interrupts
@@ -61,38 +86,73 @@ class RainGaugeSetup:
         self.tx_message()
 
     def tx_message(self):
-        """Collect the latest rainrate message data, produce and transmit
-        a JSON formatted message over the serial port. The raintip field
-        will show the amount per tip for one message when a tip occurs. This
-        could be tracked to record total rainfall."""
-        if self.units.upper() == 'INCH/HR':
-            rainrate_inch = round((self.bucket_tip_handler.rate / 25.4), 3)
-            self.rain_data.update(
-                dict(rainrate=rainrate_inch, units=self.units))
-
-        else:
-            self.rain_data.update(
-                dict(rainrate=self.bucket_tip_handler.rate, units=self.units))
-        dataline = json.dumps(self.rain_data)
-        logging.info(dataline)
-        self.client.publish(self.mqtt_topic, dataline, self.mqtt_qos)
-        self.rain_data.update(dict(raintip=0.0))
+        """Post a tick for the rain message to be sent, then schedule the
+        next one."""
+        self.state.tick()
 
         # Asynchronously schedule this function to be run again x seconds
         Timer(self.tx_interval, self.tx_message).start()
 
+    def publish_rain(self, snapshot):
+        """Produce and transmit a JSON formatted rainrate message from a
+        state snapshot. The raintip field will show the total amount of the
+        tips since the last message. This could be tracked to record total
+        rainfall. 'time' is when the message was produced and 'tip_time' the
+        GPIO edge time of the last bucket tip, both as UNIX times."""
+        if self.units.upper() == 'INCH/HR':
+            rainrate = round((snapshot.rate / 25.4), 3)
+        else:
+            rainrate = snapshot.rate
+        rain_data = OrderedDict(
+            [('rainrate', rainrate),
+             ('raintip', round(snapshot.tips * self.tip_amount(), 3)),
+             ('units', self.units), ('time', round(time.time(), 3)),
+             ('tip_time', None if snapshot.tip_time is None
+              else round(snapshot.tip_time, 3))])
+        dataline = json.dumps(rain_data)
+        logging.debug('Rain data: %s', dataline)
+        self.publish(self.mqtt_topic, dataline)
+
+    def publish(self, topic, dataline):
+        publish_start = time.perf_counter()
+        self.client.publish(topic, dataline, self.mqtt_qos)
+        self.publish_seconds.observe(time.perf_counter() - publish_start)
+        self.published.inc()
+
+    def tip_amount(self):
+        """Return the rainfall amount per tip in the configured units."""
+        if self.units.upper() == 'INCH/HR':
+            return round((self.amount_per_tip / 25.4), 3)
+        return self.amount_per_tip
+
+    def publish_tip(self, snapshot, edge_time):
+        """Publish a bucket tip to the tip topic straight away, e.g.
+        {"seq": 42, "tip_amount": 0.2, "tip_time": 1634567889.456,
+        "time": 1634567889.463}
+        :param snapshot: The state snapshot including the tip.
+        :param edge_time: The UNIX time of the tip's GPIO edge.
+        """
+        if not self.tip_topic:
+            return
+        dataline = json.dumps(OrderedDict(
+            [('seq', snapshot.sequence), ('tip_amount', self.tip_amount()),
+             ('tip_time', round(edge_time, 3)),
+             ('time', round(time.time(), 3))]))
+        self.publish(self.tip_topic, dataline)
+        self.tip_latency.observe(time.time() - edge_time)
+
     def rain_tip_event(self, channel):
         """Handle rain bucket tip, an initial delay and re-check for the
        GPIO pin status is made to avoid false/noise contacts"""
+        edge_time = time.time()
         time.sleep(0.005)
         # First check if the pin status is still low after the 0.005 delay -
         # if it is then we can assume that this is a genuine tip and not
         # an electrical noise tip.
         if GPIO.input(channel) == 0:
-            self.bucket_tip_handler.process_bucket_tip()
-
-            if self.units.upper() == 'INCH/HR':
-                amount_per_tip_inch = round((self.amount_per_tip / 25.4), 3)
-                self.rain_data.update(dict(raintip=amount_per_tip_inch))
-            else:
-                self.rain_data.update(dict(raintip=self.amount_per_tip))
+            tip_start = time.perf_counter()
+            self.tips.inc()
+            self.state.tip(edge_time)
+            self.tip_seconds.observe(time.perf_counter() - tip_start)
+        else:
+            self.noise_tips.inc()
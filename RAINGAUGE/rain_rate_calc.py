@@ -11,7 +11,16 @@ class BucketTipHandler:
     timers used in rainfall rate calculations.
     """
 
-    def __init__(self, amount_per_tip):
+    def __init__(self, amount_per_tip, update_job=None):
+        """
+        :param amount_per_tip: The amount of rainfall required to tip the
+        bucket.
+        :param update_job: The function the scheduler runs every 5 seconds
+        between tips, by default update_rain_rate. A function that hands
+        the update to another thread can be given instead, so that only
+        that thread changes the rate.
+        """
+        self.update_job = update_job or self.update_rain_rate
         self.bucket_tips_counter = 0
         self.amount_per_tip = float(amount_per_tip)
         self.tips_timer = Timer()
@@ -36,13 +45,13 @@ class BucketTipHandler:
         # Initial setup of rate update scheduler.
         if self.rain_event_scheduler.running:
             self.rain_event_scheduler.remove_all_jobs()
-            self.rain_event_scheduler.add_job(self.update_rain_rate,
+            self.rain_event_scheduler.add_job(self.update_job,
                                               IntervalTrigger(seconds=5))
             self.rain_event_scheduler.resume()
         # Subsequently for subsequent rain events the scheduler will be paused
         # so needs to have 'update rate job' added back in and resumed.
         else:
-            self.rain_event_scheduler.add_job(self.update_rain_rate,
+            self.rain_event_scheduler.add_job(self.update_job,
                                               IntervalTrigger(seconds=5))
             self.rain_event_scheduler.start()
 
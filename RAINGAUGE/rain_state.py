@@ -0,0 +1,117 @@
+"""Single writer state of the rain gauge.
+
+Bucket tips arrive on the GPIO callback thread, rate messages are due on
+the tx_message Timer thread and rate updates on the APScheduler thread.
+Rather than all three changing the rate calculation and the tips counted
+for the next message, with a tip lost whenever it lands between a message
+being sent and its tips being reset, they put events on a queue and only
+the RainState owner thread changes the state. Putting an event never waits
+for the owner, so the GPIO callback is not held up by a message being sent.
+
+Readers get the state as a RainSnapshot, an immutable tuple that the owner
+replaces whole after each event, so it is always consistent without a lock.
+"""
+import logging
+import queue
+import threading
+from collections import namedtuple
+from rain_rate_calc import BucketTipHandler
+
+# rate: The rainfall rate in the units of the amount per tip, per hour.
+# tips: Tips since the last rate message.
+# tip_time: The UNIX time of the GPIO edge of the last tip.
+# sequence: Tips since the state was created.
+RainSnapshot = namedtuple('RainSnapshot', 'rate tips tip_time sequence')
+
+TIP = 'tip'
+TICK = 'tick'
+UPDATE = 'update'
+STOP = 'stop'
+
+
+class RainState:
+
+    def __init__(self, amount_per_tip, on_tip=None, on_tick=None,
+                 start=True):
+        """
+        :param amount_per_tip: The amount of rainfall required to tip the
+        bucket.
+        :param on_tip: Called on the owner thread with the snapshot and edge
+        time of each tip, before the rate is recalculated.
+        :param on_tick: Called on the owner thread with the snapshot on each
+        tick, before the tips are reset for the next message.
+        :param start: Start the owner thread. If False, events are processed
+        on the thread posting them, which must then be the only one.
+        """
+        self.on_tip = on_tip
+        self.on_tick = on_tick
+        self.bucket_tip_handler = BucketTipHandler(amount_per_tip,
+                                                   self.update_rate)
+        self.snapshot = RainSnapshot(0.0, 0, None, 0)
+        self.events = queue.SimpleQueue()
+        self.thread = None
+        if start:
+            self.start()
+
+    def post(self, event, value=None):
+        if self.thread is None:
+            self.process(event, value)
+        else:
+            self.events.put((event, value))
+
+    def tip(self, edge_time):
+        """Post a bucket tip.
+        :param edge_time: The UNIX time of the tip's GPIO edge.
+        """
+        self.post(TIP, edge_time)
+
+    def tick(self):
+        """Post a rate message tick."""
+        self.post(TICK)
+
+    def update_rate(self):
+        """Post a rate update, as the BucketTipHandler scheduler job."""
+        self.post(UPDATE)
+
+    def process(self, event, value=None):
+        """Apply an event to the state. Only called by the owner."""
+        rate, tips, tip_time, sequence = self.snapshot
+        handler = self.bucket_tip_handler
+        if event == TIP:
+            self.snapshot = RainSnapshot(rate, tips + 1, value, sequence + 1)
+            if self.on_tip is not None:
+                self.on_tip(self.snapshot, value)
+            handler.process_bucket_tip()
+            self.snapshot = self.snapshot._replace(rate=handler.rate)
+        elif event == TICK:
+            if self.on_tick is not None:
+                self.on_tick(self.snapshot)
+            self.snapshot = self.snapshot._replace(tips=0)
+        elif event == UPDATE and handler.tips_timer.running:
+            # Not running if the rain event ended after the update was
+            # posted, leaving nothing to update.
+            handler.update_rain_rate()
+            self.snapshot = self.snapshot._replace(rate=handler.rate)
+
+    def run(self):
+        while True:
+            event, value = self.events.get()
+            if event == STOP:
+                return
+            try:
+                self.process(event, value)
+            except Exception:
+                # The owner thread must outlive a failed message or update.
+                logging.exception('Rain state %s event failed', event)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop the owner thread once the events posted so far have been
+        processed."""
+        if self.thread is not None:
+            self.events.put((STOP, None))
+            self.thread.join()
+            self.thread = None
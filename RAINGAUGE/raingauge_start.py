@@ -1,6 +1,9 @@
 import logging
 import os
 import time
+import profiling
+import log_setup
+import metrics
 from rain_gauge import RainGaugeSetup
 import paho.mqtt.client as mqtt
 
@@ -20,8 +23,8 @@ def on_message(mqtt_client, userdata, msg):
     # msg_in = json.loads(msg_decode)  # decode json data
 
 
-logging.basicConfig(level=logging.DEBUG)
-logging.captureWarnings(True)
+log_setup.configure()
+profiling.install()
 
 if os.getenv('ENABLE', 'false') == 'true':
     Connected = False  # global variable for the state of the connection
@@ -37,6 +40,7 @@ if os.getenv('ENABLE', 'false') == 'true':
 
     mqtt_topic = os.getenv('MQTT_TOPIC')
     mqtt_qos = int(os.getenv('MQTT_QOS', '1'))
+    metrics.start_from_env(client)
 
     RainGaugeSetup(client, mqtt_topic, mqtt_qos)
 
@@ -0,0 +1,68 @@
+import json
+import sys
+import types
+import unittest
+from unittest import mock
+
+# RPi.GPIO only installs on a Raspberry Pi, so the pin is a mock.
+GPIO = mock.MagicMock()
+GPIO.input.return_value = 0
+sys.modules.setdefault('RPi', types.ModuleType('RPi')).GPIO = GPIO
+sys.modules.setdefault('RPi.GPIO', GPIO)
+
+from rain_gauge import RainGaugeSetup  # noqa: E402
+
+
+class RecordingClient:
+
+    def __init__(self):
+        self.messages = []
+
+    def publish(self, topic, payload, qos=0):
+        self.messages.append((topic, json.loads(payload)))
+
+    def topic(self, topic):
+        return [data for name, data in self.messages if name == topic]
+
+
+class RainGaugeTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('rain_gauge.Timer')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = RecordingClient()
+        self.rain_gauge = RainGaugeSetup(self.client, 'metpod/rain', 0)
+        self.addCleanup(self.shutdown)
+
+    def shutdown(self):
+        self.rain_gauge.state.stop()
+        scheduler = self.rain_gauge.bucket_tip_handler.rain_event_scheduler
+        if scheduler.running:
+            scheduler.shutdown(wait=False)
+
+    def test_tip_messages(self):
+        """Test that each tip is published straight away with a sequence
+        number and its edge time, and that tips between rate messages add
+        up rather than collapsing into one."""
+        for tip in range(3):
+            self.rain_gauge.rain_tip_event(self.rain_gauge.gpio_pin)
+        self.rain_gauge.tx_message()
+        # Stopping the owner thread waits for the posted events.
+        self.rain_gauge.state.stop()
+        tips = self.client.topic('metpod/rain/tip')
+        self.assertEqual([tip['seq'] for tip in tips], [1, 2, 3])
+        for tip in tips:
+            self.assertEqual(tip['tip_amount'], 0.2)
+            self.assertLessEqual(tip['tip_time'], tip['time'])
+            self.assertLess(tip['time'] - tip['tip_time'], 0.1)
+
+        rain = self.client.topic('metpod/rain')
+        self.assertEqual(rain[-1]['raintip'], 0.6)
+        self.assertEqual(rain[-1]['tip_time'], tips[-1]['tip_time'])
+        self.rain_gauge.tx_message()
+        self.assertEqual(self.client.topic('metpod/rain')[-1]['raintip'], 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import threading
+import time
+import unittest
+from rain_state import RainState
+
+THREADS = 4
+TIPS = 250
+
+
+class RainStateTest(unittest.TestCase):
+
+    def test_concurrent_tips_and_ticks(self):
+        """Test that with tips posted from several threads while ticks and
+        rate updates are posted from another, every tip is numbered once
+        and counted in exactly one message, and readers only ever see
+        consistent snapshots."""
+        sequences = []
+        message_tips = []
+        state = RainState(
+            0.2, on_tip=lambda snapshot, edge_time:
+            sequences.append(snapshot.sequence),
+            on_tick=lambda snapshot: message_tips.append(snapshot.tips))
+        self.addCleanup(
+            state.bucket_tip_handler.rain_event_scheduler.shutdown, False)
+        tipping = threading.Event()
+        tipping.set()
+        inconsistent = []
+
+        def tip():
+            for _ in range(TIPS):
+                state.tip(time.time())
+                time.sleep(0.0001)
+
+        def tick():
+            while tipping.is_set():
+                state.tick()
+                state.update_rate()
+                time.sleep(0.001)
+
+        def read():
+            last = state.snapshot
+            while tipping.is_set():
+                snapshot = state.snapshot
+                if snapshot.sequence < last.sequence or \
+                        snapshot.tips > snapshot.sequence:
+                    inconsistent.append((last, snapshot))
+                last = snapshot
+
+        tippers = [threading.Thread(target=tip) for _ in range(THREADS)]
+        others = [threading.Thread(target=tick), threading.Thread(target=read)]
+        for thread in tippers + others:
+            thread.start()
+        for thread in tippers:
+            thread.join()
+        tipping.clear()
+        for thread in others:
+            thread.join()
+        state.tick()
+        state.stop()
+
+        self.assertEqual(sequences, list(range(1, THREADS * TIPS + 1)))
+        self.assertEqual(sum(message_tips), THREADS * TIPS)
+        self.assertGreater(len(message_tips), 2)
+        self.assertEqual(state.snapshot.sequence, THREADS * TIPS)
+        self.assertEqual(state.snapshot.tips, 0)
+        self.assertGreater(state.snapshot.rate, 0)
+        self.assertEqual(inconsistent, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
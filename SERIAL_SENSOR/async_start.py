@@ -0,0 +1,164 @@
+"""Single process runtime hosting every configured serial sensor, and
+optionally the rain gauge, on one asyncio event loop.
+
+This is an alternative to running serial-A/B/C and raingauge as separate
+containers. Sensors are configured with the SENSORS variable, one entry per
+port separated by ';', each entry being 'sensor,port,baud,topic' e.g.
+SENSORS=ptu300,/dev/ttyUSB0,9600,metpod/ptu;windsonic,/dev/ttyUSB1,9600,metpod/wind
+The sensor may be given as 'sensor.mode' to select a mode other than ascii.
+Only drivers of sensors that stream their output line by line can be hosted
+here; polled drivers such as ptu300.modbus are rejected and must run in
+their own serial container.
+"""
+import asyncio
+import logging
+import os
+import sys
+import time
+import serial
+import paho.mqtt.client as mqtt
+import metrics
+import profiling
+import log_setup
+from drivers import load_driver
+from publish_queue import queue_from_env
+from serial_capture import capture_from_env
+
+
+class AsyncSerialReader:
+    """Non-blocking reader for one serial port. The port is opened with a
+    zero timeout and watched by the event loop; complete lines are passed to
+    the driver's process_line exactly as readline() would have returned
+    them."""
+
+    def __init__(self, driver, port, baud, loop, retry_delay=5,
+                 capture=None):
+        self.driver = driver
+        self.capture = capture
+        self.port = port
+        self.baud = baud
+        self.loop = loop
+        self.retry_delay = retry_delay
+        self.serial_port = None
+        self.buffer = b''
+
+    def open(self):
+        try:
+            self.serial_port = serial.Serial(self.port, self.baud, timeout=0)
+            logging.info('Serial port: ' + str(self.serial_port))
+            self.loop.add_reader(self.serial_port.fileno(), self.on_readable)
+        except serial.SerialException as error:
+            logging.warning('Serial port error: %s', error)
+            self.loop.call_later(self.retry_delay, self.open)
+
+    def on_readable(self):
+        try:
+            data_bytes = self.serial_port.read(
+                self.serial_port.in_waiting or 1)
+            read_time = time.monotonic()
+        except serial.SerialException as error:
+            logging.warning('Serial port error: %s', error)
+            self.loop.remove_reader(self.serial_port.fileno())
+            self.serial_port.close()
+            self.buffer = b''
+            self.loop.call_later(self.retry_delay, self.open)
+            return
+
+        if self.capture is not None:
+            self.capture.write(data_bytes, read_time)
+        self.buffer += data_bytes
+        while b'\n' in self.buffer:
+            line, self.buffer = self.buffer.split(b'\n', 1)
+            try:
+                self.driver.process_line(line + b'\n', read_time)
+            except ValueError as error:
+                logging.warning('Invalid data: %s', error)
+            except Exception:
+                # A fault in decoding must not stop the port being read.
+                self.driver.metrics.processing_errors.inc()
+                logging.exception('Error processing data')
+
+
+def parse_sensors(config):
+    """Parse the SENSORS configuration string.
+    :param config: ';' separated 'sensor,port,baud,topic' entries.
+    :return: A list of (sensor, port, baud, topic) tuples.
+    """
+    sensors = []
+    for entry in config.split(';'):
+        if entry.strip():
+            sensor, port, baud, topic = [
+                field.strip() for field in entry.split(',')]
+            sensors.append((sensor, port, int(baud), topic))
+    return sensors
+
+
+def streaming_driver(sensor):
+    """Return the driver class of a 'sensor[.mode]' SENSORS entry.
+    :raise: LookupError if there is no such driver, or ValueError if the
+    driver polls its sensor rather than reading lines as they arrive.
+    """
+    name, _, mode = sensor.partition('.')
+    driver_class = load_driver(name, mode or 'ascii')
+    if not hasattr(driver_class, 'process_line'):
+        raise ValueError(
+            'Sensor ' + sensor + ' is polled, which the single process '
+            'runtime does not support; run it in a serial container')
+    return driver_class
+
+
+def start_rain_gauge(publisher, mqtt_qos):
+    """Host the rain gauge in this process. The RAINGAUGE modules must be
+    importable, by default from a RAINGAUGE directory alongside this one."""
+    sys.path.append(os.getenv(
+        'RAINGAUGE_PATH',
+        os.path.join(os.path.dirname(__file__), '..', 'RAINGAUGE')))
+    from rain_gauge import RainGaugeSetup
+    RainGaugeSetup(publisher, os.getenv('RAINGAUGE_TOPIC'), mqtt_qos)
+
+
+async def main(client):
+    loop = asyncio.get_running_loop()
+    # All sensors share one bounded publish queue, which publish() may be
+    # called on from any thread (e.g. the rain gauge GPIO callback).
+    publisher = queue_from_env(client, 'async')
+    mqtt_qos = int(os.getenv('MQTT_QOS', '1'))
+    metrics.start_from_env(client)
+
+    sensors = [(streaming_driver(sensor), port, baud, topic)
+               for sensor, port, baud, topic
+               in parse_sensors(os.getenv('SENSORS', ''))]
+    for driver_class, port, baud, topic in sensors:
+        driver = driver_class(publisher, topic, mqtt_qos, port, baud,
+                              start=False)
+        AsyncSerialReader(driver, port, baud, loop,
+                          capture=capture_from_env(port)).open()
+
+    if os.getenv('RAINGAUGE_ENABLE', 'false') == 'true':
+        start_rain_gauge(publisher, mqtt_qos)
+
+    await asyncio.Event().wait()
+
+
+def on_connect(mqtt_client, userdata, flags, rc):
+    if rc == 0:
+        global Connected  # Use global variable
+        Connected = True  # Signal connection
+    else:
+        logging.info("MQTT Connection failed")
+
+
+if __name__ == '__main__' and os.getenv('ENABLE', 'false') == 'true':
+    log_setup.configure()
+    profiling.install()
+    Connected = False  # global variable for the state of the connection
+    time.sleep(15)  # allow time for networking to be established
+    client = mqtt.Client('metpod-sensors')  # create new instance
+    client.on_connect = on_connect  # attach function to callback
+    client.connect(os.getenv('MQTT_BROKER', 'localhost'))  # connect to broker
+    client.loop_start()  # start the loop
+
+    while not Connected:  # Wait for connection
+        time.sleep(0.1)
+
+    asyncio.run(main(client))
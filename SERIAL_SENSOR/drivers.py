@@ -0,0 +1,61 @@
+"""Registry of the serial sensor drivers, keyed on the SENSOR and MODE
+environment variables. Drivers are referenced by 'module:Class' name and only
+the selected driver module is imported, so start up cost does not grow with
+the number of drivers available.
+
+Drivers packaged outside this directory can be added without editing the
+registry by declaring an entry point in the 'metpod.drivers' group named
+'<sensor>.<mode>' e.g. 'hmp155.ascii = hmp155_ascii:HMP155ascii'.
+"""
+import importlib
+
+ENTRY_POINT_GROUP = 'metpod.drivers'
+
+DRIVERS = {
+    ('ptu300', 'ascii'): 'ptu300_ascii:PTU300ascii',
+    ('windsonic', 'ascii'): 'windsonic_ascii:WINDSONICascii',
+    ('windsonic', 'framed'): 'windsonic_framed:WINDSONICframed',
+    ('ptb220', 'ascii'): 'ptb220_ascii:PTB220ascii',
+    ('ptu300', 'modbus'): 'ptu300_modbus:PTU300modbus',
+}
+
+
+def find_driver(sensor, mode):
+    """Return the 'module:Class' reference for a sensor and mode. Installed
+    entry points are only searched when the driver is not built in.
+    :param sensor: The sensor name e.g. 'ptu300'.
+    :param mode: The sensor output mode e.g. 'ascii'.
+    :return: The driver reference, or None if no driver is available.
+    """
+    if not sensor or not mode:
+        # e.g. the SENSOR variable is not set.
+        return None
+    reference = DRIVERS.get((sensor, mode))
+    if reference is None:
+        from importlib.metadata import entry_points
+        name = sensor + '.' + mode
+        try:
+            found = entry_points(group=ENTRY_POINT_GROUP, name=name)
+        except TypeError:
+            # Python < 3.10 returns a dict of entry points per group.
+            found = [entry for entry in
+                     entry_points().get(ENTRY_POINT_GROUP, [])
+                     if entry.name == name]
+        for entry in found:
+            reference = entry.value
+    return reference
+
+
+def load_driver(sensor, mode='ascii'):
+    """Import and return the driver class for a sensor and mode.
+    :param sensor: The sensor name e.g. 'ptu300'.
+    :param mode: The sensor output mode e.g. 'ascii'.
+    :return: The driver class.
+    :raise: LookupError if no driver is registered for the sensor and mode.
+    """
+    reference = find_driver(sensor, mode)
+    if reference is None:
+        raise LookupError(
+            'No driver for sensor ' + str(sensor) + ' mode ' + str(mode))
+    module_name, class_name = reference.split(':')
+    return getattr(importlib.import_module(module_name), class_name)
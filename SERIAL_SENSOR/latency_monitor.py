@@ -0,0 +1,78 @@
+"""Measure end to end latency of the published sensor messages.
+
+Subscribes to the given topics on a (local) broker and, for every message
+carrying a 'time' field, records the delay between the sensor read (or
+rain gauge message) time and its arrival here. Latency percentiles per
+topic, and of any 'timing' stage fields, are printed every interval e.g.
+python latency_monitor.py --broker localhost --topic 'metpod/#'
+The device and this machine's clocks must be synchronised (e.g. NTP) for
+the end to end figures to be meaningful; run it on the device itself to
+avoid that.
+"""
+import argparse
+import json
+import time
+from collections import defaultdict
+import paho.mqtt.client as mqtt
+from load_harness import percentiles
+
+
+class LatencyMonitor:
+    """Collects per topic arrival delays and stage timings."""
+
+    def __init__(self):
+        self.delays = defaultdict(list)
+        self.stages = defaultdict(list)
+        self.untimed = defaultdict(int)
+
+    def on_message(self, mqtt_client, userdata, msg):
+        arrival = time.time()
+        try:
+            data = json.loads(msg.payload)
+            sent = float(data['time'])
+        except (ValueError, KeyError, TypeError):
+            self.untimed[msg.topic] += 1
+            return
+        self.delays[msg.topic].append(arrival - sent)
+        for stage, milliseconds in (data.get('timing') or {}).items():
+            self.stages[msg.topic + ' ' + stage].append(milliseconds / 1000)
+
+    def report(self):
+        """Return the latency percentiles (ms) since the last report."""
+        report = {}
+        for topic, delays in sorted(self.delays.items()):
+            report[topic] = dict(count=len(delays), **percentiles(delays))
+        for stage, values in sorted(self.stages.items()):
+            report[stage] = dict(count=len(values), **percentiles(values))
+        for topic, count in sorted(self.untimed.items()):
+            report.setdefault(topic, {})['untimed'] = count
+        self.delays.clear()
+        self.stages.clear()
+        self.untimed.clear()
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--broker', default='localhost')
+    parser.add_argument('--port', type=int, default=1883)
+    parser.add_argument('--topic', action='append',
+                        help='topic to subscribe to, may be repeated')
+    parser.add_argument('--interval', type=float, default=60.0,
+                        help='seconds between reports')
+    args = parser.parse_args()
+
+    monitor = LatencyMonitor()
+    client = mqtt.Client(client_id='latency-monitor')
+    client.on_message = monitor.on_message
+    client.connect(args.broker, args.port)
+    for topic in args.topic or ['#']:
+        client.subscribe(topic)
+    client.loop_start()
+    while True:
+        time.sleep(args.interval)
+        print(json.dumps(monitor.report()), flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""End to end load test of the serial drivers against simulated sensors.
+
+Starts a PTY simulator per sensor, runs the real driver (and its threaded
+serial reader) against it, publishing to an in-process broker stand-in, then
+reports lines/s, drop rate and latency percentiles as JSON. Exits with a
+non-zero status when the drop rate or 95th percentile latency exceed the
+given limits, so it can be used as a regression gate e.g.
+python load_harness.py --sensors ptu300,windsonic --rate 1 --duration 60
+"""
+import argparse
+import json
+import logging
+import sys
+import threading
+import time
+from drivers import load_driver
+from sensor_sim import SensorSimulator
+
+
+class BrokerStandIn:
+    """Records published messages in place of an MQTT client."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.messages = []
+
+    def publish(self, topic, payload, qos=0):
+        with self.lock:
+            self.messages.append((time.monotonic(), topic, payload))
+
+
+class LineTimer:
+    """Wraps a driver's process_line to time each line from the moment the
+    simulator sent it and from the moment the reader returned it, to the
+    moment the driver published it."""
+
+    def __init__(self, driver, simulator, client):
+        self.driver = driver
+        self.simulator = simulator
+        self.client = client
+        self.process_line = driver.process_line
+        driver.process_line = self
+        self.lines = 0
+        self.send_to_publish = []
+        self.read_to_publish = []
+
+    def __call__(self, data_bytes, read_time=None):
+        if not data_bytes:
+            return None
+        if read_time is None:
+            read_time = time.monotonic()
+        send_time = None
+        # A readline timeout returns the start of a line without its end.
+        # Only the read ending the line takes the line's send time.
+        complete = data_bytes.endswith(b'\n')
+        if complete and self.simulator.send_times:
+            send_time = self.simulator.send_times.popleft()
+        published = len(self.client.messages)
+        try:
+            return self.process_line(data_bytes, read_time)
+        finally:
+            if complete:
+                self.lines += 1
+            if send_time is not None and \
+                    len(self.client.messages) > published:
+                publish_time = self.client.messages[-1][0]
+                self.send_to_publish.append(publish_time - send_time)
+                self.read_to_publish.append(publish_time - read_time)
+
+
+def percentiles(values, points=(50, 95, 99)):
+    """Return the given percentiles of a list of latencies in milliseconds.
+    :param values: Latencies in seconds.
+    :param points: The percentiles required.
+    :return: A dict of e.g. {'p50': 1.2} or None values if there is no data.
+    """
+    values = sorted(values)
+    result = {}
+    for point in points:
+        if values:
+            index = min(len(values) - 1, int(len(values) * point / 100))
+            result['p' + str(point)] = round(values[index] * 1000, 3)
+        else:
+            result['p' + str(point)] = None
+    return result
+
+
+def run_load_test(sensors, rate, baud, duration, malformed, drain=2.0):
+    """Run every sensor driver against a simulator for a period of time.
+    :return: A dict of results per sensor.
+    """
+    results = {}
+    running = []
+    for sensor in sensors:
+        simulator = SensorSimulator(sensor, rate, baud, malformed, seed=1)
+        client = BrokerStandIn()
+        driver = load_driver(sensor)(client, 'load-test/' + sensor, 0,
+                                     simulator.port, baud, start=False)
+        timer = LineTimer(driver, simulator, client)
+        running.append((sensor, simulator, driver, timer, client))
+
+    start = time.monotonic()
+    for sensor, simulator, driver, timer, client in running:
+        simulator.start()
+        driver.start_reader(simulator.port, baud, True)
+    time.sleep(duration)
+    for sensor, simulator, driver, timer, client in running:
+        simulator.stop()
+    # Allow the readers to catch up with anything already sent.
+    time.sleep(drain)
+    elapsed = time.monotonic() - start
+    for sensor, simulator, driver, timer, client in running:
+        driver.stop()
+        driver.serial_port.close()
+        simulator.close()
+
+    for sensor, simulator, driver, timer, client in running:
+        results[sensor] = {
+            'sent': simulator.sent,
+            'sent_malformed': simulator.sent_malformed,
+            'lines_read': timer.lines,
+            'published': len(client.messages),
+            'lines_per_second': round(timer.lines / elapsed, 3),
+            'drop_rate': round(1 - timer.lines / simulator.sent, 4)
+            if simulator.sent else 0.0,
+            'send_to_publish_ms': percentiles(timer.send_to_publish),
+            'read_to_publish_ms': percentiles(timer.read_to_publish),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sensors', default='ptu300,ptb220,windsonic')
+    parser.add_argument('--rate', type=float, default=1.0,
+                        help='frames per second per sensor')
+    parser.add_argument('--baud', type=int, default=9600)
+    parser.add_argument('--duration', type=float, default=30.0,
+                        help='seconds')
+    parser.add_argument('--malformed', type=float, default=0.05,
+                        help='proportion of malformed frames (0 - 1)')
+    parser.add_argument('--max-drop', type=float, default=0.01,
+                        help='maximum acceptable drop rate')
+    parser.add_argument('--max-p95', type=float, default=1500.0,
+                        help='maximum acceptable p95 send to publish ms')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    logging.captureWarnings(True)
+    results = run_load_test(args.sensors.split(','), args.rate, args.baud,
+                            args.duration, args.malformed)
+    print(json.dumps(results, indent=2))
+
+    failed = False
+    for sensor, result in results.items():
+        p95 = result['send_to_publish_ms']['p95']
+        if result['drop_rate'] > args.max_drop or \
+                p95 is None or p95 > args.max_p95:
+            print('FAIL ' + sensor, file=sys.stderr)
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+"""Addressed polling of several Vaisala sensors sharing an RS-485 bus.
+
+The sensors are set to POLL mode with distinct addresses and answer a
+'SEND <address>' request with one line of their normal output. The bus is
+half duplex, so one bus thread polls each device in turn, waiting at most
+the device's timeout for its response, while a second thread decodes and
+publishes the responses through the device's driver, so that the next
+request goes out without waiting for the previous response to be handled.
+
+The poll interval adapts to the bus: each device's transaction time (request
+plus response) is measured, or estimated from the configured baud rate
+until it has been, and one poll cycle of every device is only started as
+often as those times allow within the bus utilisation limit. Devices that
+stop answering are polled less often, backing off exponentially, so that
+their timeouts do not hold up the others.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+import serial
+import metrics
+
+# 10 bits per character on the wire (start, 8 data, stop).
+BITS_PER_CHAR = 10
+
+
+class PolledDevice:
+    """A sensor on the bus, its driver and its polling statistics."""
+
+    def __init__(self, address, driver, timeout=None):
+        """
+        :param address: The sensor's POLL mode address.
+        :param driver: A driver instance created with start=False.
+        :param timeout: Seconds to wait for a response, by default
+        estimated from the baud rate.
+        """
+        self.address = address
+        self.driver = driver
+        self.request = ('SEND %s\r\n' % address).encode()
+        self.timeout = timeout
+        # Exponentially weighted transaction time, once measured.
+        self.transaction = None
+        self.consecutive_timeouts = 0
+        self.skip = 0
+        labels = dict(sensor=type(driver).__name__.lower(),
+                      address=str(address))
+        self.polls = metrics.REGISTRY.counter(
+            'poll_requests_total', 'Poll requests sent', **labels)
+        self.timeouts = metrics.REGISTRY.counter(
+            'poll_timeouts_total', 'Poll requests without a response',
+            **labels)
+        self.transaction_seconds = metrics.REGISTRY.histogram(
+            'poll_transaction_seconds', 'Poll request to response time',
+            **labels)
+
+
+class PollScheduler:
+    """Polls the devices on one serial port."""
+
+    def __init__(self, serial_port, devices, baud, interval=1.0,
+                 response_chars=80, turnaround=0.05, utilisation=0.8,
+                 max_backoff=32):
+        """
+        :param serial_port: An open serial.Serial (or compatible) port.
+        :param devices: PolledDevice instances.
+        :param baud: The bus baud rate.
+        :param interval: Requested seconds between polls of each device.
+        :param response_chars: Expected response length, for estimates.
+        :param turnaround: Expected seconds before a device responds.
+        :param utilisation: Maximum proportion of time the bus is busy.
+        :param max_backoff: Maximum cycles skipped for a silent device.
+        """
+        self.serial_port = serial_port
+        self.devices = devices
+        self.char_time = BITS_PER_CHAR / baud
+        self.interval = interval
+        self.response_chars = response_chars
+        self.turnaround = turnaround
+        self.utilisation = utilisation
+        self.max_backoff = max_backoff
+        self.responses = queue.Queue(maxsize=len(devices) * 4)
+        self.running = False
+        self.threads = []
+        self.cycles = 0
+        self.interval_gauge = metrics.REGISTRY.gauge(
+            'poll_interval_seconds', 'Seconds between poll cycles',
+            function=self.effective_interval,
+            port=os.path.basename(str(getattr(serial_port, 'port', ''))))
+        for device in devices:
+            if device.timeout is None:
+                device.timeout = self.estimate(device) * 2 + 0.05
+
+    def estimate(self, device):
+        """Return the expected transaction time of a device."""
+        if device.transaction is not None:
+            return device.transaction
+        return self.turnaround + \
+            (len(device.request) + self.response_chars) * self.char_time
+
+    def effective_interval(self):
+        """Return the poll cycle interval the bus allows, at least the
+        requested interval."""
+        busy = sum(self.estimate(device) for device in self.devices
+                   if not device.skip)
+        return max(self.interval, busy / self.utilisation)
+
+    def poll(self, device):
+        """Send a request and wait for the response line.
+        :return: The response bytes, or None on timeout.
+        """
+        # Discard any late response to an earlier request.
+        self.serial_port.reset_input_buffer()
+        if self.serial_port.timeout != device.timeout:
+            self.serial_port.timeout = device.timeout
+        start = time.monotonic()
+        self.serial_port.write(device.request)
+        device.polls.inc()
+        response = self.serial_port.readline()
+        duration = time.monotonic() - start
+        if not response.endswith(b'\n'):
+            device.timeouts.inc()
+            device.consecutive_timeouts += 1
+            if device.consecutive_timeouts >= 3:
+                device.skip = min(2 ** (device.consecutive_timeouts - 3),
+                                  self.max_backoff)
+            return None
+        device.consecutive_timeouts = 0
+        device.transaction_seconds.observe(duration)
+        device.transaction = duration if device.transaction is None \
+            else 0.8 * device.transaction + 0.2 * duration
+        return response
+
+    def run_cycle(self):
+        """Poll each device once (skipping those backing off), queueing
+        the responses for processing."""
+        for device in self.devices:
+            if device.skip:
+                device.skip -= 1
+                continue
+            try:
+                response = self.poll(device)
+            except serial.SerialException as error:
+                logging.warning('Serial port error: %s', error)
+                return
+            if response is not None:
+                try:
+                    self.responses.put_nowait(
+                        (device, response, time.monotonic()))
+                except queue.Full:
+                    logging.warning('Poll responses dropped, processing '
+                                    'is not keeping up')
+        self.cycles += 1
+
+    def run_bus(self):
+        next_cycle = time.monotonic()
+        while self.running:
+            self.run_cycle()
+            next_cycle = max(next_cycle + self.effective_interval(),
+                             time.monotonic())
+            delay = next_cycle - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    def run_processing(self):
+        while self.running or not self.responses.empty():
+            try:
+                device, response, read_time = self.responses.get(
+                    timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                device.driver.process_line(response, read_time)
+            except ValueError as error:
+                logging.warning('Invalid data: %s', error)
+            except Exception:
+                # One bad response must not stop the processing of the
+                # others while the bus thread carries on polling.
+                device.driver.metrics.processing_errors.inc()
+                logging.exception('Error processing poll response')
+
+    def start(self):
+        self.running = True
+        self.threads = [
+            threading.Thread(target=self.run_bus, daemon=True),
+            threading.Thread(target=self.run_processing, daemon=True)]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        self.running = False
+        for thread in self.threads:
+            thread.join()
+
+
+def parse_devices(config):
+    """Parse POLL_DEVICES, ',' separated 'sensor[.mode]:address[:topic]'
+    entries, e.g. 'ptu300:1:metpod/ptu300,ptb220:2'.
+    :return: A list of (sensor, mode, address, topic or None) tuples.
+    """
+    devices = []
+    for entry in config.split(','):
+        fields = entry.strip().split(':', 2)
+        sensor, _, mode = fields[0].partition('.')
+        topic = fields[2] if len(fields) > 2 else None
+        devices.append((sensor, mode or 'ascii', fields[1], topic))
+    return devices
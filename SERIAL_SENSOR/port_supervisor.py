@@ -0,0 +1,250 @@
+"""Supervision of a sensor driver's serial port.
+
+A USB serial adapter that resets leaves the driver reading a dead port, and
+a sensor that stops sending leaves it reading nothing, both indefinitely.
+The supervisor watches the bytes the driver reads, its serial errors and its
+reader loop and, when nothing has been read for STALE_AFTER seconds, or for 5
+seconds while the port reports errors or the reader has died, reopens the
+port with exponential backoff, restarting the reader if it has died. The
+device can be found by its USB serial number (PORT_SERIAL_NUMBER) rather
+than PORT, so an adapter that comes back as /dev/ttyUSB1 instead of
+/dev/ttyUSB0 is still found.
+
+The port state ('starting', 'up', 'stale' or 'down') is published as JSON to
+HEALTH_TOPIC on each change and every HEALTH_INTERVAL seconds, with the
+number of open attempts and the total seconds without data.
+"""
+import json
+import logging
+import os
+import time
+from threading import Timer
+import serial
+from serial.tools import list_ports
+import metrics
+
+STARTING = 'starting'
+UP = 'up'
+STALE = 'stale'
+DOWN = 'down'
+
+
+def resolve_port(port, serial_number=None):
+    """Return the device of a serial port.
+    :param port: The configured device e.g. /dev/ttyUSB0.
+    :param serial_number: A USB serial number to find the device by, or
+    None to use the configured device.
+    :return: The device path.
+    :raise: serial.SerialException if no device has the serial number.
+    """
+    if not serial_number:
+        return port
+    for info in list_ports.comports():
+        if info.serial_number == serial_number:
+            return info.device
+    raise serial.SerialException(
+        'No USB serial device with serial number ' + serial_number)
+
+
+class PortSupervisor:
+
+    def __init__(self, driver, port, baud, serial_number=None, client=None,
+                 health_topic=None, qos=0, stale_after=30.0, fail_after=5.0,
+                 check_interval=1.0, min_backoff=1.0, max_backoff=60.0,
+                 health_interval=60.0):
+        """
+        :param driver: A driver instance created with start=False.
+        :param port: The configured serial port device.
+        :param baud: The baud rate.
+        :param serial_number: USB serial number to find the device by.
+        :param client: MQTT client for health messages, or None.
+        :param health_topic: Topic for health messages, or None.
+        :param stale_after: Seconds without data before reopening.
+        :param fail_after: Seconds without data before reopening a port
+        reporting errors.
+        :param check_interval: Seconds between checks.
+        :param min_backoff: Seconds before the first reopen retry.
+        :param max_backoff: Maximum seconds between reopen retries.
+        :param health_interval: Seconds between health messages.
+        """
+        self.driver = driver
+        self.port = port
+        self.baud = baud
+        self.serial_number = serial_number
+        self.client = client
+        self.health_topic = health_topic
+        self.qos = qos
+        self.stale_after = stale_after
+        self.fail_after = fail_after
+        self.check_interval = check_interval
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.health_interval = health_interval
+        self.device = None
+        self.state = STARTING
+        self.started = False
+        self.backoff = min_backoff
+        self.next_attempt = 0.0
+        self.last_data = None
+        self.last_check = None
+        self.last_health = None
+        self.bytes_read = 0
+        self.read_errors = 0
+        self.downtime = 0.0
+        self.running = False
+        self.timer = None
+        labels = dict(port=os.path.basename(str(port)))
+        self.opens = metrics.REGISTRY.counter(
+            'port_open_attempts_total', 'Serial port open attempts',
+            **labels)
+        metrics.REGISTRY.gauge(
+            'port_up', 'Serial port delivering data (1) or not (0)',
+            function=lambda: int(self.state == UP), **labels)
+        metrics.REGISTRY.gauge(
+            'port_downtime_seconds', 'Seconds without data from the port',
+            function=lambda: round(self.downtime, 1), **labels)
+
+    def open(self):
+        """Open the port, starting the driver's reader the first time or
+        when it has died, and otherwise handing the driver the new port.
+        :return: True if the port was opened.
+        """
+        self.opens.inc()
+        try:
+            self.device = resolve_port(self.port, self.serial_number)
+            if not self.started:
+                self.driver.start_reader(self.device, self.baud, True)
+                self.started = True
+            elif not self.driver.reader_running():
+                # e.g. ended by an unhandled error, so a new port alone
+                # would never be read.
+                logging.warning('Serial port %s reader stopped, restarting',
+                                self.port)
+                old_port = self.driver.serial_port
+                self.driver.start_reader(self.device, self.baud, True)
+                if old_port is not None:
+                    self.close_port(old_port)
+            else:
+                old_port = self.driver.serial_port
+                self.driver.serial_port = serial.Serial(
+                    self.device, self.baud, timeout=old_port.timeout)
+                # The reader may still be waiting on the old port, so close
+                # it once any read in progress has timed out.
+                closer = Timer((old_port.timeout or 0) + 1.0,
+                               self.close_port, (old_port,))
+                closer.daemon = True
+                closer.start()
+        except (serial.SerialException, OSError) as error:
+            logging.warning('Serial port open failed: %s', error)
+            return False
+        logging.info('Serial port %s opened as %s', self.port, self.device)
+        return True
+
+    @staticmethod
+    def close_port(serial_port):
+        try:
+            serial_port.close()
+        except (serial.SerialException, OSError):
+            pass
+
+    def check(self, now=None):
+        """Check the driver is reading data, reopening the port if not."""
+        now = time.monotonic() if now is None else now
+        if self.last_data is None:
+            self.last_data = now
+        bytes_read = self.driver.metrics.bytes_read.value
+        read_errors = self.driver.metrics.read_errors.value
+        receiving = bytes_read != self.bytes_read
+        # Errors since data was last read, or the port last opened, or a
+        # reader that is no longer running.
+        failing = read_errors != self.read_errors or \
+            (self.started and not self.driver.reader_running())
+        self.bytes_read = bytes_read
+        if self.state in (STALE, DOWN):
+            self.downtime += now - self.last_check
+        self.last_check = now
+
+        silent = now - self.last_data
+        if receiving:
+            self.last_data = now
+            self.read_errors = read_errors
+            self.backoff = self.min_backoff
+            self.set_state(UP, now)
+        elif not self.started or silent >= self.stale_after or \
+                (failing and silent >= self.fail_after):
+            if self.started:
+                if self.state == UP:
+                    # Count the time since data was last read.
+                    self.downtime += silent
+                self.set_state(DOWN if failing else STALE, now)
+            if now >= self.next_attempt:
+                if self.open():
+                    # Give the new port a full window to deliver data.
+                    self.last_data = now
+                    self.read_errors = read_errors
+                else:
+                    self.set_state(DOWN, now)
+                self.next_attempt = now + self.backoff
+                self.backoff = min(self.backoff * 2, self.max_backoff)
+
+        if self.last_health is None or \
+                now - self.last_health >= self.health_interval:
+            self.publish_health(now)
+
+    def set_state(self, state, now):
+        if state != self.state:
+            if state == UP:
+                logging.info('Serial port %s receiving data', self.port)
+            else:
+                logging.warning('Serial port %s %s', self.port, state)
+            self.state = state
+            self.publish_health(now)
+
+    def health(self, now=None):
+        """Return the port health as a dict, for publishing."""
+        now = time.monotonic() if now is None else now
+        return {'state': self.state, 'port': self.port,
+                'device': self.device,
+                'data_age': round(now - self.last_data, 1)
+                if self.last_data is not None else None,
+                'open_attempts': self.opens.value,
+                'downtime': round(self.downtime, 1)}
+
+    def publish_health(self, now):
+        self.last_health = now
+        if self.client is not None and self.health_topic:
+            self.client.publish(self.health_topic,
+                                json.dumps(self.health(now)), self.qos)
+
+    def run(self):
+        self.check()
+        if self.running:
+            self.timer = Timer(self.check_interval, self.run)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def start(self):
+        """Open the port and start supervising it."""
+        self.running = True
+        self.run()
+
+    def stop(self):
+        self.running = False
+        if self.timer is not None:
+            self.timer.cancel()
+
+
+def supervisor_from_env(driver, client, mqtt_topic, mqtt_qos, port, baud):
+    """Return a PortSupervisor configured with the PORT_SERIAL_NUMBER,
+    STALE_AFTER, HEALTH_TOPIC, HEALTH_INTERVAL and REOPEN_MAX_BACKOFF
+    variables, or None if STALE_AFTER is 0."""
+    stale_after = float(os.getenv('STALE_AFTER', 30))
+    if not stale_after:
+        return None
+    return PortSupervisor(
+        driver, port, baud,
+        serial_number=os.getenv('PORT_SERIAL_NUMBER'), client=client,
+        health_topic=os.getenv('HEALTH_TOPIC', '%s/health' % mqtt_topic),
+        qos=mqtt_qos, stale_after=stale_after,
+        max_backoff=float(os.getenv('REOPEN_MAX_BACKOFF', 60)),
+        health_interval=float(os.getenv('HEALTH_INTERVAL', 60)))
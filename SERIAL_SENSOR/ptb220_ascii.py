@@ -1,46 +1,23 @@
-import serial
 import os
 import re
-import json
 import logging
-import warnings
 import value_checks
-from threading import Timer
+from serial_driver import LineDriver
 
 
-class PTB220ascii:
+class PTB220ascii(LineDriver):
 
-    def __init__(self, client, mqtt_topic, qos, port, baud):
-        self.serial_port = serial.Serial(port, baud, timeout=1.0)
-        logging.info('Serial port: ' + str(self.serial_port))
+    sensor = 'ptb220'
 
+    def __init__(self, client, mqtt_topic, qos, port, baud, start=True,
+                 capture=None):
         # .P.1  1005.75 ***.* * 1005.8 1005.7 1005.7 000.F9
         self.search_exp = re.compile('.P.+')
-        self.client = client
-        self.mqtt_topic = mqtt_topic
-        self.qos = qos
-        self.serial_port_reader()
+        super().__init__(client, mqtt_topic, qos, port, baud, start,
+                         capture)
 
-    def serial_port_reader(self):
-        """Read a line of incoming data from the assigned serial port, then
-        pass the data onto a processor for extraction of the data values"""
-        try:
-            data_bytes = self.serial_port.readline()
-            dataline = str(data_bytes)
-            # Only process output if we have actual data in the line
-            if len(dataline) > 30:
-                logging.info(
-                    'RAW data: ' + str(self.serial_port.name) + ' ' + dataline)
-                data_elements = self.data_decoder(dataline)
-                data = get_readings(data_elements)[0]
-                self.client.publish(self.mqtt_topic, json.dumps(data),
-                                    self.qos)
-                logging.info(
-                    'Published topic:' + self.mqtt_topic + ' ' + str(data))
-        except serial.SerialException as error:
-            warnings.warn("Serial port error: " + str(error), Warning)
-        # Asynchronously schedule this function to be run again in 1.0 seconds
-        Timer(1, self.serial_port_reader).start()
+    def readings(self, data_elements):
+        return get_readings(data_elements)[0]
 
     def data_decoder(self, dataline):
         """
@@ -58,11 +35,14 @@ class PTB220ascii:
             """ Apply any instrument corrections """
             pressure_correction = float(os.getenv('PRESS_CORR', 0.0))
             data = find_numeric_data(dataline)
-            logging.info('Numeric data: ' + str(data))
+            logging.debug('Numeric data: %s', data)
+            if len(data) < 3:
+                # e.g. a frame cut short by a sensor reset.
+                raise ValueError('Truncated PTB220 data ' + dataline)
             if value_checks.pressure_check(float(data[2])):
                 pressure = float(data[2]) + pressure_correction
             else:
-                warnings.warn('invalid PTB220 sensor data', Warning)
+                logging.warning('invalid PTB220 sensor data')
             return [pressure]
 
 
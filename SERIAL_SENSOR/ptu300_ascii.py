@@ -1,47 +1,24 @@
-import serial
 import os
 import re
-import json
 import logging
-import warnings
 import value_checks
-from threading import Timer
+from serial_driver import LineDriver
 
 
-class PTU300ascii:
+class PTU300ascii(LineDriver):
 
-    def __init__(self, client, mqtt_topic, qos, port, baud):
-        self.serial_port = serial.Serial(port, baud, timeout=1.0)
-        logging.info('Serial port: ' + str(self.serial_port))
+    sensor = 'ptu300'
 
+    def __init__(self, client, mqtt_topic, qos, port, baud, start=True,
+                 capture=None):
         # b"P=  1003.8 hPa   T= 17.7 'C RH= 40.9 %RH TD=  4.3 'C  trend=*****
         # tend=*\r\n"
         self.ptu300search = re.compile('P=.+hPa.+T=.+RH=.+TD=.+trend=.+tend=.')
-        self.client = client
-        self.mqtt_topic = mqtt_topic
-        self.qos = qos
-        self.serial_port_reader()
+        super().__init__(client, mqtt_topic, qos, port, baud, start,
+                         capture)
 
-    def serial_port_reader(self):
-        """Read a line of incoming data from the assigned serial port, then
-        pass the data onto a processor for extraction of the data values"""
-        try:
-            data_bytes = self.serial_port.readline()
-            dataline = str(data_bytes)
-            # Only process output if we have actual data in the line
-            if len(dataline) > 30:
-                logging.info(
-                    'RAW data: ' + str(self.serial_port.name) + ' ' + dataline)
-                data_elements = self.data_decoder(dataline)
-                data = get_readings(data_elements)[0]
-                self.client.publish(self.mqtt_topic, json.dumps(data),
-                                    self.qos)
-                logging.info(
-                    'Published topic:' + self.mqtt_topic + ' ' + str(data))
-        except serial.SerialException as error:
-            warnings.warn("Serial port error: " + str(error), Warning)
-        # Asynchronously schedule this function to be run again in 1.0 seconds
-        Timer(1, self.serial_port_reader).start()
+    def readings(self, data_elements):
+        return get_readings(data_elements)[0]
 
     def data_decoder(self, dataline):
         """
@@ -84,7 +61,7 @@ class PTU300ascii:
                 if humidity > 100:
                     humidity = 100
             else:
-                warnings.warn('invalid PTU300 data', Warning)
+                logging.warning('invalid PTU300 data')
 
             return pressure, temperature, dew_point, humidity
 
@@ -0,0 +1,174 @@
+"""Vaisala PTU300 read over Modbus RTU.
+
+All four readings are read with one 'read holding registers' (function
+0x03) request for a contiguous block of registers holding 32 bit IEEE
+floats, decoded with struct rather than by parsing text. The register of
+each reading within the block (in 16 bit registers from MODBUS_START) is set
+with MODBUS_REGISTERS to match the map configured on the transmitter, and
+MODBUS_WORD_ORDER gives the order of the two registers of each float ('big',
+most significant first, or 'little').
+"""
+import os
+import struct
+import time
+import value_checks
+from ptu300_ascii import get_readings
+from serial_driver import SerialDriver
+
+READ_HOLDING_REGISTERS = 0x03
+
+# Readings in the get_readings order, and their default register offsets
+# from MODBUS_START.
+READINGS = ('pressure', 'temperature', 'dew_point', 'humidity')
+DEFAULT_REGISTERS = 'pressure=0,temperature=2,dew_point=4,humidity=6'
+
+
+def crc_table():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+CRC_TABLE = crc_table()
+
+
+def crc16(data):
+    """Return the Modbus RTU CRC of some bytes."""
+    crc = 0xFFFF
+    for byte in data:
+        crc = (crc >> 8) ^ CRC_TABLE[(crc ^ byte) & 0xFF]
+    return crc
+
+
+def frame(body):
+    """Append the CRC (low byte first) to a frame body."""
+    return body + struct.pack('<H', crc16(body))
+
+
+def read_request(slave, start, count):
+    """Return a read holding registers request frame."""
+    return frame(struct.pack('>BBHH', slave, READ_HOLDING_REGISTERS, start,
+                             count))
+
+
+def parse_response(response, slave, count):
+    """Check a read holding registers response and return the register
+    data bytes.
+    :param response: The response frame.
+    :param slave: The slave address the request was sent to.
+    :param count: The number of registers requested.
+    :return: The 2 * count register bytes.
+    :raise: ValueError if the response is incomplete, corrupted, from
+    another slave or a Modbus exception.
+    """
+    if len(response) >= 5 and response[1] == READ_HOLDING_REGISTERS | 0x80:
+        raise ValueError('Modbus exception code ' + str(response[2]))
+    if len(response) != 5 + 2 * count:
+        raise ValueError('Modbus response of ' + str(len(response)) +
+                         ' bytes, expected ' + str(5 + 2 * count))
+    if crc16(response[:-2]) != struct.unpack('<H', response[-2:])[0]:
+        raise ValueError('Modbus CRC error')
+    if response[0] != slave or response[1] != READ_HOLDING_REGISTERS or \
+            response[2] != 2 * count:
+        raise ValueError('Unexpected Modbus response header')
+    return response[3:-2]
+
+
+def parse_registers(config):
+    """Parse 'name=offset,...' into a list of the offsets of READINGS."""
+    registers = {}
+    for entry in config.split(','):
+        name, _, offset = entry.strip().partition('=')
+        registers[name] = int(offset)
+    return [registers[name] for name in READINGS]
+
+
+class PTU300modbus(SerialDriver):
+
+    sensor = 'ptu300'
+
+    def __init__(self, client, mqtt_topic, qos, port, baud, start=True,
+                 capture=None):
+        self.slave = int(os.getenv('MODBUS_ADDRESS', 240))
+        self.start = int(os.getenv('MODBUS_START', '0'), 0)
+        self.offsets = parse_registers(os.getenv('MODBUS_REGISTERS',
+                                                 DEFAULT_REGISTERS))
+        self.count = max(self.offsets) + 2
+        self.word_swap = os.getenv('MODBUS_WORD_ORDER', 'big') == 'little'
+        self.request = read_request(self.slave, self.start, self.count)
+        # With start=False the caller owns the port and passes responses to
+        # process_frame.
+        super().__init__(client, mqtt_topic, qos, port, baud, start,
+                         capture)
+
+    def readings(self, data_elements):
+        return get_readings(data_elements)[0]
+
+    def poll(self):
+        """Request the readings from the transmitter and read the response,
+        then pass it onto the processor.
+        :return: The published readings, None if there was no response.
+        """
+        self.serial_port.reset_input_buffer()
+        read_start = time.monotonic()
+        self.serial_port.write(self.request)
+        data_bytes = self.serial_port.read(5 + 2 * self.count)
+        read_time = time.monotonic()
+        self.metrics.read_seconds.observe(read_time - read_start)
+        if self.capture is not None:
+            self.capture.write(data_bytes, read_time)
+        return self.process_frame(data_bytes, read_time)
+
+    # The reader loop polls the transmitter once a second.
+    read = poll
+
+    def process_frame(self, data_bytes, read_time=None):
+        """Decode a Modbus response and publish the readings.
+        :param data_bytes: The response frame as read from the serial port.
+        :param read_time: time.monotonic() time the response was read, by
+        default now.
+        :return: The published readings, None if there was no response.
+        """
+        if read_time is None:
+            read_time = time.monotonic()
+        if not data_bytes:
+            self.metrics.read_timeouts.inc()
+            return None
+        self.metrics.lines_read.inc()
+        self.metrics.bytes_read.inc(len(data_bytes))
+        return self.publish_decoded(data_bytes, read_time)
+
+    def data_decoder(self, response):
+        """
+        Decode the readings from a read holding registers response, applying
+        the same corrections and value checks as the ASCII output.
+        :param response: The response frame.
+        :return: pressure, temperature, dew_point, humidity
+        """
+        registers = parse_response(response, self.slave, self.count)
+        values = []
+        for offset in self.offsets:
+            word = registers[offset * 2:offset * 2 + 4]
+            if self.word_swap:
+                word = word[2:] + word[:2]
+            values.append(struct.unpack('>f', word)[0])
+        pressure, temperature, dew_point, humidity = values
+
+        pressure_correction = float(os.getenv('PRESS_CORR', 0.0))
+        temperature_correction = float(os.getenv('TEMP_CORR', 0.0))
+        humidity_correction = float(os.getenv('HUMI_CORR', 0.0))
+        value_checks.pressure_check(pressure)
+        value_checks.temperature_check(temperature)
+        value_checks.temperature_check(dew_point)
+        humidity = int(round(humidity + humidity_correction, 0))
+        # Supersaturation, see PTU300ascii.data_decoder.
+        if humidity > 100:
+            humidity = 100
+        value_checks.humidity_check(humidity)
+        return (round(pressure + pressure_correction, 1),
+                round(temperature + temperature_correction, 1),
+                round(dew_point, 1), humidity)
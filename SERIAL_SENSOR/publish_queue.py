@@ -0,0 +1,174 @@
+"""Bounded queue between the sensor readers and the MQTT client.
+
+The drivers decode and publish on their reader thread, so a slow broker (or
+a full paho outgoing queue) would hold up serial reads until the UART buffer
+overflows. A PublishQueue stands in for the MQTT client handed to the
+drivers: publish() only queues the message and a worker thread hands it to
+the client. The queue holds at most PUBLISH_QUEUE_SIZE messages, and the
+worker waits while PUBLISH_MAX_BACKLOG messages handed to the client are
+still queued or in flight in it, so memory stays bounded when the broker is
+slow or away. The worker counts these itself, from the client's on_publish
+callback, which paho calls once a QoS 0 message has been written to the
+socket or a QoS 1 or 2 message acknowledged. When the queue is full the
+PUBLISH_QUEUE_POLICY decides what is lost:
+
+drop-oldest  the oldest queued message is dropped (the default)
+drop-newest  the new message is dropped
+collapse     the new message's fields are merged into the latest queued
+             message for the same topic, so only the latest value of each
+             field is kept; other topics drop the oldest message
+"""
+import json
+import logging
+import os
+import threading
+from collections import deque
+import metrics
+
+DROP_OLDEST = 'drop-oldest'
+DROP_NEWEST = 'drop-newest'
+COLLAPSE = 'collapse'
+POLICIES = (DROP_OLDEST, DROP_NEWEST, COLLAPSE)
+
+
+def merge_payloads(queued, payload):
+    """Return a JSON payload with the fields of a queued payload updated by
+    those of a newer one, or the newer one if either is not a JSON object.
+    """
+    try:
+        merged = json.loads(queued)
+        merged.update(json.loads(payload))
+    except (ValueError, TypeError, AttributeError):
+        return payload
+    return json.dumps(merged)
+
+
+class PublishQueue:
+
+    def __init__(self, client, maxsize=1000, policy=DROP_OLDEST,
+                 max_backlog=1000, name='serial'):
+        """
+        :param client: The MQTT client.
+        :param maxsize: Maximum messages queued.
+        :param policy: 'drop-oldest', 'drop-newest' or 'collapse'.
+        :param max_backlog: Messages queued or in flight in the client
+        above which the worker waits.
+        :param name: Queue name for the metrics labels.
+        """
+        if policy not in POLICIES:
+            raise ValueError('Unknown publish queue policy ' + str(policy))
+        self.client = client
+        self.maxsize = maxsize
+        self.policy = policy
+        self.max_backlog = max_backlog
+        # Messages handed to the client and not yet published by it.
+        self.in_flight = 0
+        self.queue = deque()
+        # Latest queued message of each topic, for collapsing.
+        self.latest = {}
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+        self.depth = metrics.REGISTRY.gauge(
+            'publish_queue_depth', 'Messages waiting in the publish queue',
+            function=lambda: len(self.queue), queue=name)
+        self.dropped = metrics.REGISTRY.counter(
+            'publish_queue_dropped_total',
+            'Messages dropped from the full publish queue', queue=name)
+        self.collapsed = metrics.REGISTRY.counter(
+            'publish_queue_collapsed_total',
+            'Messages merged into a queued message of the same topic',
+            queue=name)
+        self.sent = metrics.REGISTRY.counter(
+            'publish_queue_sent_total', 'Messages handed to the MQTT client',
+            queue=name)
+        metrics.REGISTRY.gauge(
+            'publish_queue_in_flight',
+            'Messages queued or in flight in the MQTT client',
+            function=lambda: self.in_flight, queue=name)
+
+    def publish(self, topic, payload, qos=0):
+        """Queue a message, in place of the client's publish."""
+        with self.condition:
+            if len(self.queue) >= self.maxsize:
+                if self.policy == DROP_NEWEST:
+                    self.dropped.inc()
+                    return
+                if self.policy == COLLAPSE and topic in self.latest:
+                    message = self.latest[topic]
+                    message[1] = merge_payloads(message[1], payload)
+                    message[2] = max(message[2], qos)
+                    self.collapsed.inc()
+                    return
+                self.pop()
+                self.dropped.inc()
+            message = [topic, payload, qos]
+            self.queue.append(message)
+            self.latest[topic] = message
+            self.condition.notify()
+
+    def pop(self):
+        message = self.queue.popleft()
+        if self.latest.get(message[0]) is message:
+            del self.latest[message[0]]
+        return message
+
+    def on_publish(self, mqtt_client, userdata, mid, *args):
+        """The client's on_publish callback: a message has left it."""
+        with self.condition:
+            # May run before the publish is counted, briefly going below 0.
+            self.in_flight -= 1
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and not self.queue:
+                    self.condition.wait()
+                if not self.queue:
+                    return
+                # Leave messages in the queue, where the drop policy
+                # applies, while the client is not keeping up.
+                while self.running and self.in_flight >= self.max_backlog:
+                    self.condition.wait(1.0)
+                topic, payload, qos = self.pop()
+            try:
+                info = self.client.publish(topic, payload, qos)
+            except (ValueError, OSError) as error:
+                logging.warning('Publish failed: %s', error)
+                continue
+            # A QoS 0 message the client could not send is dropped by it,
+            # the others are kept until sent.
+            if qos or getattr(info, 'rc', 0) == 0:
+                with self.condition:
+                    self.in_flight += 1
+            self.sent.inc()
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop the worker once the queued messages have been sent."""
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+
+
+def queue_from_env(client, name='serial'):
+    """Return a started PublishQueue configured with the PUBLISH_QUEUE_SIZE,
+    PUBLISH_QUEUE_POLICY and PUBLISH_MAX_BACKLOG variables, or the client
+    itself if PUBLISH_QUEUE_SIZE is 0. The queue becomes the client's
+    on_publish callback."""
+    maxsize = int(os.getenv('PUBLISH_QUEUE_SIZE', 1000))
+    if not maxsize:
+        return client
+    publisher = PublishQueue(
+        client, maxsize, os.getenv('PUBLISH_QUEUE_POLICY', DROP_OLDEST),
+        int(os.getenv('PUBLISH_MAX_BACKLOG', 1000)), name)
+    client.on_publish = publisher.on_publish
+    publisher.start()
+    return publisher
@@ -0,0 +1,130 @@
+"""Replay a raw serial capture back through a sensor driver.
+
+The captured data is split into lines and passed to the driver's
+process_line, i.e. the same data_decoder, value checks and WindProcessor
+used on the device, at real time, N times real time or maximum speed, e.g.
+python replay.py /data/capture/ttyUSB0.cap --sensor windsonic --speed 0
+The captures of polled drivers, e.g. --sensor ptu300 --mode modbus, hold one
+response per read, and each is passed whole to the driver's process_frame.
+"""
+import argparse
+import json
+import logging
+import time
+from drivers import load_driver
+from serial_capture import read_capture
+
+
+class ReplayClient:
+    """Stands in for the MQTT client, counting and optionally printing the
+    messages the driver publishes."""
+
+    def __init__(self, echo=False):
+        self.echo = echo
+        self.published = 0
+
+    def publish(self, topic, payload, qos=0):
+        self.published += 1
+        if self.echo:
+            print(payload)
+
+
+def replay(driver, records, speed=1.0, start_time=None):
+    """Feed captured records through a driver.
+    :param driver: A driver instance created with start=False.
+    :param records: (monotonic timestamp, raw bytes) tuples from a capture.
+    :param speed: Replay speed as a multiple of real time, 0 for maximum.
+    :param start_time: UNIX time of the first record, to time the readings
+    from the capture rather than the replay, or None.
+    :return: A dict of replay statistics.
+    """
+    # Polled drivers decode each response read whole rather than by lines.
+    process_frame = getattr(driver, 'process_frame', None)
+    wind_processor = getattr(driver, 'wind_processor', None)
+    if wind_processor is not None:
+        wind_processor.cancel_timers()
+    stats = {'reads': 0, 'lines': 0, 'bytes': 0, 'invalid': 0,
+             'capture_seconds': 0.0}
+    buffer = b''
+    first = None
+    read_time = None
+    start = time.monotonic()
+
+    for timestamp, data_bytes in records:
+        if first is None:
+            first = timestamp
+            # Converts capture times to monotonic times that the drivers'
+            # timestamps turn into UNIX times from start_time.
+            clock_offset = time.monotonic() - time.time() + \
+                (start_time or 0) - first
+        elapsed = timestamp - first
+        if speed > 0:
+            delay = start + elapsed / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        # Set the WindProcessor startup flags on capture time rather than
+        # on the wall clock timers used on the device.
+        if wind_processor is not None:
+            if elapsed >= 180:
+                wind_processor.set_2min_flag()
+            if elapsed >= 600:
+                wind_processor.set_10min_flag()
+
+        stats['reads'] += 1
+        stats['bytes'] += len(data_bytes)
+        stats['capture_seconds'] = elapsed
+        if start_time is not None:
+            read_time = timestamp + clock_offset
+        if process_frame is not None:
+            lines = [data_bytes]
+        else:
+            buffer += data_bytes
+            lines = []
+            while b'\n' in buffer:
+                line, buffer = buffer.split(b'\n', 1)
+                lines.append(line + b'\n')
+        for line in lines:
+            stats['lines'] += 1
+            try:
+                if process_frame is not None:
+                    process_frame(line, read_time)
+                else:
+                    driver.process_line(line, read_time)
+            except ValueError as error:
+                stats['invalid'] += 1
+                logging.warning('Invalid data: %s', error)
+
+    stats['replay_seconds'] = time.monotonic() - start
+    if stats['replay_seconds'] > 0:
+        stats['lines_per_second'] = stats['lines'] / stats['replay_seconds']
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('capture', help='capture path without the .N suffix')
+    parser.add_argument('--sensor', required=True, help='e.g. windsonic')
+    parser.add_argument('--mode', default='ascii')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='multiple of real time, 0 for maximum speed')
+    parser.add_argument('--echo', action='store_true',
+                        help='print each decoded message')
+    parser.add_argument('--start', type=float,
+                        help='UNIX time of the start of the capture, to '
+                             'time the messages from the capture')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.ERROR)
+    client = ReplayClient(args.echo)
+    driver = load_driver(args.sensor, args.mode)(
+        client, 'replay', 0, args.capture, None, start=False)
+    stats = replay(driver, read_capture(args.capture), args.speed,
+                   args.start)
+    stats['published'] = client.published
+    print(json.dumps(stats))
+
+
+if __name__ == '__main__':
+    main()
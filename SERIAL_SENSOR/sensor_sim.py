@@ -0,0 +1,317 @@
+"""Simulated Vaisala PTU300/PTB220 and Gill WindSonic sensors on
+pseudo-terminals, for exercising the drivers without hardware.
+
+Each simulator opens a PTY pair and writes realistic frames to the master
+side at a configurable rate, paced to the configured baud rate. The slave
+side (e.g. /dev/pts/3) is used as the driver's serial PORT. A proportion of
+frames can be made malformed: truncated, corrupted or out of range. Run
+standalone with e.g. python sensor_sim.py windsonic --rate 4
+A polled RS-485 bus of addressed sensors is simulated with e.g.
+python sensor_sim.py poll --devices ptu300:1,ptb220:2
+and a PTU300 Modbus RTU slave with python sensor_sim.py modbus --baud 19200
+"""
+import argparse
+import os
+import random
+import select
+import struct
+import threading
+import time
+import tty
+from collections import deque
+import ptu300_modbus
+
+
+def ptu300_frame(rng):
+    pressure = rng.uniform(980, 1040)
+    temperature = rng.uniform(-10, 30)
+    humidity = rng.uniform(20, 100)
+    dew_point = temperature - (100 - humidity) / 5
+    return ("P=  %6.1f hPa   T= %4.1f 'C RH= %4.1f %%RH TD= %4.1f 'C  "
+            "trend=***** tend=*\r\n" % (pressure, temperature, humidity,
+                                        dew_point)).encode()
+
+
+def ptb220_frame(rng):
+    pressure = rng.uniform(980, 1040)
+    return ('.P.1  %7.2f ***.* * %6.1f %6.1f %6.1f 000.F9\r\n' % (
+        pressure, pressure, pressure, pressure)).encode()
+
+
+def windsonic_frame(rng):
+    body = 'Q,%03d,%06.2f,M,00,' % (rng.randrange(0, 360),
+                                    rng.uniform(0, 40))
+    return b'\x02' + body.encode() + b'\x03' + (
+        '%02X\r\n' % windsonic_checksum(body.encode())).encode()
+
+
+def windsonic_nmea_frame(rng):
+    body = 'IIMWV,%03d,R,%06.2f,M,A' % (rng.randrange(0, 360),
+                                        rng.uniform(0, 40))
+    return ('$%s*%02X\r\n' % (body, windsonic_checksum(
+        body.encode()))).encode()
+
+
+def windsonic_checksum(body):
+    """XOR of the bytes between the STX and ETX (or $ and *)
+    characters."""
+    checksum = 0
+    for byte in body:
+        checksum ^= byte
+    return checksum
+
+
+FRAMES = {
+    'ptu300': ptu300_frame,
+    'ptb220': ptb220_frame,
+    'windsonic': windsonic_frame,
+    'windsonic_nmea': windsonic_nmea_frame,
+}
+
+
+def malformed_frame(frame, rng):
+    """Return a damaged copy of a frame, always still newline terminated so
+    that the line count seen by the reader matches the frames sent."""
+    kind = rng.randrange(3)
+    if kind == 0:
+        # Truncated, e.g. a frame cut short by a sensor reset.
+        return frame[:rng.randrange(1, len(frame) - 2)] + b'\r\n'
+    if kind == 1:
+        # Line noise corrupting some of the characters.
+        data = bytearray(frame[:-2])
+        for _ in range(3):
+            data[rng.randrange(len(data))] = rng.randrange(32, 127)
+        return bytes(data) + b'\r\n'
+    # Digits replaced so that values fall outside the QC limits.
+    return frame.replace(b'1', b'9').replace(b'0', b'9')
+
+
+class SensorSimulator:
+    """A simulated free-running sensor writing frames to a PTY."""
+
+    def __init__(self, sensor, rate=1.0, baud=9600, malformed=0.0, seed=None):
+        self.frame = FRAMES[sensor]
+        self.rate = rate
+        self.baud = baud
+        self.malformed = malformed
+        self.rng = random.Random(seed)
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+        self.sent = 0
+        self.sent_malformed = 0
+        # Monotonic send time of each frame, in order, for latency matching.
+        self.send_times = deque()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+
+    def run(self):
+        interval = 1.0 / self.rate
+        next_send = time.monotonic()
+        while self.running:
+            frame = self.frame(self.rng)
+            if self.rng.random() < self.malformed:
+                frame = malformed_frame(frame, self.rng)
+                self.sent_malformed += 1
+            self.send_times.append(time.monotonic())
+            os.write(self.master, frame)
+            self.sent += 1
+            # 10 bits per character on the wire (start, 8 data, stop).
+            next_send = max(next_send + interval,
+                            time.monotonic() + len(frame) * 10 / self.baud)
+            delay = next_send - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    def close(self):
+        self.stop()
+        os.close(self.master)
+        os.close(self.slave)
+
+
+class PolledBusSimulator:
+    """Simulated sensors in POLL mode sharing one RS-485 bus (a PTY), each
+    answering 'SEND <address>' requests with a frame after a response
+    delay, paced to the baud rate. Addresses not in devices are silent."""
+
+    def __init__(self, devices, baud=9600, response_delay=0.02,
+                 malformed=0.0, seed=None):
+        """
+        :param devices: {address: sensor name} e.g. {'1': 'ptu300'}.
+        """
+        self.devices = {str(address): FRAMES[sensor]
+                        for address, sensor in devices.items()}
+        self.baud = baud
+        self.response_delay = response_delay
+        self.malformed = malformed
+        self.rng = random.Random(seed)
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+        self.requests = {}
+        self.sent = {}
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+
+    def run(self):
+        buffer = b''
+        while self.running:
+            readable = select.select([self.master], [], [], 0.1)[0]
+            if not readable:
+                continue
+            buffer += os.read(self.master, 1024)
+            while b'\n' in buffer:
+                line, buffer = buffer.split(b'\n', 1)
+                self.respond(line.strip().decode('ascii', 'replace'))
+
+    def respond(self, request):
+        command, _, address = request.partition(' ')
+        if command.upper() != 'SEND':
+            return
+        self.requests[address] = self.requests.get(address, 0) + 1
+        frame = self.devices.get(address)
+        if frame is None:
+            return
+        frame = frame(self.rng)
+        if self.rng.random() < self.malformed:
+            frame = malformed_frame(frame, self.rng)
+        time.sleep(self.response_delay + len(frame) * 10 / self.baud)
+        os.write(self.master, frame)
+        self.sent[address] = self.sent.get(address, 0) + 1
+
+    def close(self):
+        self.stop()
+        os.close(self.master)
+        os.close(self.slave)
+
+
+class ModbusSlaveSimulator:
+    """A simulated PTU300 Modbus RTU slave on a PTY, answering read holding
+    registers requests for its address from a block of float registers
+    holding changing PTU readings, laid out as in ptu300_modbus."""
+
+    def __init__(self, address=240, baud=19200, response_delay=0.005,
+                 word_order='big', seed=None):
+        self.address = address
+        self.baud = baud
+        self.response_delay = response_delay
+        self.word_order = word_order
+        self.rng = random.Random(seed)
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+        self.requests = 0
+        self.sent = 0
+        self.running = False
+        self.thread = None
+
+    def registers(self):
+        """Return the register bytes of the current readings."""
+        temperature = self.rng.uniform(-10, 30)
+        humidity = self.rng.uniform(20, 100)
+        data = b''
+        for value in (self.rng.uniform(980, 1040), temperature,
+                      temperature - (100 - humidity) / 5, humidity):
+            word = struct.pack('>f', value)
+            if self.word_order == 'little':
+                word = word[2:] + word[:2]
+            data += word
+        return data
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+
+    def run(self):
+        buffer = b''
+        while self.running:
+            readable = select.select([self.master], [], [], 0.1)[0]
+            if not readable:
+                continue
+            buffer += os.read(self.master, 1024)
+            # Requests are fixed 8 byte read holding registers frames.
+            while len(buffer) >= 8:
+                request, buffer = buffer[:8], buffer[8:]
+                self.respond(request)
+
+    def respond(self, request):
+        if ptu300_modbus.crc16(request[:-2]) != \
+                struct.unpack('<H', request[-2:])[0]:
+            return
+        address, function, start, count = struct.unpack('>BBHH',
+                                                        request[:6])
+        if address != self.address:
+            return
+        self.requests += 1
+        data = (self.registers() + bytes(2 * count))[:2 * count]
+        response = ptu300_modbus.frame(struct.pack(
+            '>BBB', address, function, len(data)) + data)
+        time.sleep(self.response_delay + len(response) * 10 / self.baud)
+        os.write(self.master, response)
+        self.sent += 1
+
+    def close(self):
+        self.stop()
+        os.close(self.master)
+        os.close(self.slave)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('sensor', choices=sorted(FRAMES) + ['poll', 'modbus'])
+    parser.add_argument('--devices', default='ptu300:1,ptb220:2',
+                        help="polled bus 'sensor:address' entries")
+    parser.add_argument('--rate', type=float, default=1.0,
+                        help='frames per second')
+    parser.add_argument('--baud', type=int, default=9600)
+    parser.add_argument('--malformed', type=float, default=0.0,
+                        help='proportion of malformed frames (0 - 1)')
+    args = parser.parse_args()
+
+    if args.sensor == 'modbus':
+        simulator = ModbusSlaveSimulator(baud=args.baud)
+    elif args.sensor == 'poll':
+        simulator = PolledBusSimulator(
+            {entry.split(':')[1]: entry.split(':')[0]
+             for entry in args.devices.split(',')},
+            args.baud, malformed=args.malformed)
+    else:
+        simulator = SensorSimulator(args.sensor, args.rate, args.baud,
+                                    args.malformed)
+    print('Simulated ' + args.sensor + ' on ' + simulator.port, flush=True)
+    simulator.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        simulator.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""Raw serial capture to a set of memory-mapped, size capped files.
+
+Each capture file starts with a header holding a segment sequence number,
+followed by records of (monotonic timestamp, length, raw bytes). When a file
+is full the oldest file in the set is reused, so a capture never uses more
+than CAPTURE_SIZE * CAPTURE_FILES bytes of disk. Writes are plain memory
+copies into the mapped file; the kernel writes the pages back in the
+background so the serial read path is never blocked on the SD card.
+"""
+import glob
+import mmap
+import os
+import struct
+import time
+
+MAGIC = b'MPCAP1\n\x00'
+FILE_HEADER = struct.Struct('<8sQ')  # magic, segment sequence number
+RECORD_HEADER = struct.Struct('<dI')  # monotonic time, data length
+
+
+class CaptureWriter:
+    """Append raw serial data to a rotating set of capture files named
+    '<path>.0' to '<path>.<files - 1>'."""
+
+    def __init__(self, path, size=1048576, files=4):
+        self.path = path
+        self.size = size
+        self.files = files
+        self.sequence = 0
+        self.file = None
+        self.map = None
+        self.offset = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Carry on after the newest segment left by a previous run.
+        for segment in capture_segments(path):
+            self.sequence = segment[0] + 1
+        self.open_segment()
+
+    def open_segment(self):
+        """Create (or reuse) the next capture file in the set and map it."""
+        self.close()
+        name = self.path + '.' + str(self.sequence % self.files)
+        self.file = open(name, 'w+b')
+        self.file.truncate(self.size)
+        self.map = mmap.mmap(self.file.fileno(), self.size)
+        self.map[0:FILE_HEADER.size] = FILE_HEADER.pack(MAGIC, self.sequence)
+        self.offset = FILE_HEADER.size
+        self.sequence += 1
+
+    def write(self, data_bytes, timestamp=None):
+        """Append one read from the serial port to the capture.
+        :param data_bytes: The raw bytes read.
+        :param timestamp: time.monotonic() time of the read, default now.
+        """
+        if not data_bytes:
+            return
+        if timestamp is None:
+            timestamp = time.monotonic()
+        data_bytes = data_bytes[:self.size - FILE_HEADER.size -
+                                RECORD_HEADER.size]
+        end = self.offset + RECORD_HEADER.size + len(data_bytes)
+        if end > self.size:
+            self.open_segment()
+            end = self.offset + RECORD_HEADER.size + len(data_bytes)
+        RECORD_HEADER.pack_into(self.map, self.offset, timestamp,
+                                len(data_bytes))
+        self.map[self.offset + RECORD_HEADER.size:end] = data_bytes
+        self.offset = end
+
+    def close(self):
+        if self.map is not None:
+            self.map.flush()
+            self.map.close()
+            self.file.close()
+            self.map = None
+
+
+def capture_segments(path):
+    """Return the capture files for a path ordered oldest first.
+    :param path: The capture path, without the segment suffix.
+    :return: A list of (sequence number, file name) tuples.
+    """
+    segments = []
+    for name in glob.glob(glob.escape(path) + '.[0-9]*'):
+        with open(name, 'rb') as capture_file:
+            magic, sequence = FILE_HEADER.unpack(
+                capture_file.read(FILE_HEADER.size))
+        if magic == MAGIC:
+            segments.append((sequence, name))
+    return sorted(segments)
+
+
+def read_capture(path):
+    """Read back every record of a capture, oldest first.
+    :param path: The capture path, without the segment suffix.
+    :return: A generator of (monotonic timestamp, raw bytes) tuples.
+    """
+    for sequence, name in capture_segments(path):
+        with open(name, 'rb') as capture_file:
+            data = capture_file.read()
+        offset = FILE_HEADER.size
+        while offset + RECORD_HEADER.size <= len(data):
+            timestamp, length = RECORD_HEADER.unpack_from(data, offset)
+            # Unused space in a capture file is zero filled.
+            if length == 0:
+                break
+            offset += RECORD_HEADER.size
+            yield timestamp, data[offset:offset + length]
+            offset += length
+
+
+def capture_from_env(port):
+    """Return a CaptureWriter for a serial port if CAPTURE_DIR is set.
+    :param port: The serial port device e.g. /dev/ttyUSB0.
+    :return: A CaptureWriter, or None if capture is not enabled.
+    """
+    capture_dir = os.getenv('CAPTURE_DIR')
+    if not capture_dir:
+        return None
+    name = os.path.basename(port) + '.cap'
+    return CaptureWriter(os.path.join(capture_dir, name),
+                         int(os.getenv('CAPTURE_SIZE', 1048576)),
+                         int(os.getenv('CAPTURE_FILES', 4)))
@@ -0,0 +1,189 @@
+"""Base classes of the serial sensor drivers.
+
+Every driver reads its sensor's output from a serial port, decodes it with
+its data_decoder and publishes the readings as JSON to its MQTT topic. The
+reading, timing, metrics and error handling are the same for every sensor
+and are kept here, so that a driver only provides its sensor's decoding:
+data_decoder, readings and, for a sensor not read a line at a time, read.
+"""
+import json
+import time
+import logging
+import serial
+import metrics
+import timestamps
+import threading
+from threading import Timer
+
+
+class SerialDriver:
+    """Reads a sensor once a second, decoding and publishing its output."""
+
+    # The sensor label of the driver's metrics.
+    sensor = None
+
+    def __init__(self, client, mqtt_topic, qos, port, baud, start=True,
+                 capture=None):
+        """
+        :param client: The MQTT client (or publish queue) to publish to.
+        :param mqtt_topic: The topic the readings are published to.
+        :param qos: The MQTT QoS of the readings.
+        :param port: The serial port device.
+        :param baud: The baud rate.
+        :param start: False if the caller owns the port, see start_reader.
+        :param capture: Optional serial_capture.CaptureWriter recording the
+        raw data read.
+        """
+        self.client = client
+        self.mqtt_topic = mqtt_topic
+        self.qos = qos
+        self.port_name = port
+        self.capture = capture
+        self.metrics = metrics.SensorMetrics(self.sensor, port)
+        self.stopped = False
+        self.timer = None
+        self.start_reader(port, baud, start)
+
+    def start_reader(self, port, baud, start):
+        """Open the serial port and start the reader loop. With start=False
+        the caller owns the port (e.g. the asyncio runtime) and feeds the
+        data read in instead."""
+        self.serial_port = None
+        if start:
+            self.serial_port = serial.Serial(port, baud, timeout=1.0)
+            logging.info('Serial port: ' + str(self.serial_port))
+            self.stopped = False
+            self.serial_port_reader()
+
+    def read_once(self):
+        """Read from the assigned serial port and pass the data onto a
+        processor for extraction of the data values, logging any errors.
+        :return: False if the serial port failed.
+        """
+        try:
+            self.read()
+        except serial.SerialException as error:
+            self.metrics.read_errors.inc()
+            logging.warning('Serial port error: %s', error)
+            return False
+        except ValueError as error:
+            # Data failing the value checks must not stop the reader loop.
+            logging.warning('Invalid data: %s', error)
+        except Exception:
+            # Nor must a fault in decoding data no check anticipated.
+            self.metrics.processing_errors.inc()
+            logging.exception('Error processing data')
+        return True
+
+    def serial_port_reader(self):
+        """Read the serial port once a second until stopped."""
+        self.read_once()
+        # Asynchronously schedule this function to be run again in 1.0 seconds
+        if not self.stopped:
+            timer = Timer(1, self.serial_port_reader)
+            timer.start()
+            self.timer = timer
+
+    def reader_running(self):
+        """Return True if the reader loop is reading or scheduled to read.
+        """
+        timer = self.timer
+        return not self.stopped and timer is not None and timer.is_alive()
+
+    def stop(self):
+        """Stop the reader loop, waiting for any read in progress, after
+        which the serial port may be closed."""
+        self.stopped = True
+        timer = None
+        # A read finishing as the loop stops may have scheduled another.
+        while self.timer is not timer:
+            timer = self.timer
+            timer.cancel()
+            if timer is not threading.current_thread():
+                timer.join()
+
+    def read(self):
+        """Read the sensor's output and process it.
+        :return: The published readings, None if there were none.
+        """
+        raise NotImplementedError
+
+    def data_decoder(self, data, *args):
+        """Decode the sensor's output and check the values.
+        :return: The data elements given to readings.
+        :raise: ValueError if the data fails the value checks.
+        """
+        raise NotImplementedError
+
+    def readings(self, data_elements):
+        """Return the readings dict to publish for the decoded data
+        elements."""
+        raise NotImplementedError
+
+    def publish_decoded(self, data, read_time, *args):
+        """Decode sensor output and publish the readings.
+        :param data: The sensor output, passed on to data_decoder with args.
+        :param read_time: time.monotonic() time the output was read.
+        :return: The published readings.
+        :raise: ValueError if the data fails the value checks.
+        """
+        decode_start = time.monotonic()
+        try:
+            data_elements = self.data_decoder(data, *args)
+        except ValueError:
+            self.metrics.qc_failures.inc()
+            raise
+        decode_end = time.monotonic()
+        self.metrics.decode_seconds.observe(decode_end - decode_start)
+        return self.publish_readings(data_elements, read_time, decode_start,
+                                     decode_end)
+
+    def publish_readings(self, data_elements, read_time, decode_start,
+                         decode_end):
+        """Timestamp and publish decoded readings.
+        :return: The published readings.
+        """
+        data = timestamps.stamp(self.readings(data_elements), read_time,
+                                decode_start, decode_end)
+        publish_start = time.monotonic()
+        self.client.publish(self.mqtt_topic, json.dumps(data), self.qos)
+        self.metrics.publish_seconds.observe(
+            time.monotonic() - publish_start)
+        self.metrics.published.inc()
+        logging.debug('Published topic: %s %s', self.mqtt_topic, data)
+        return data
+
+
+class LineDriver(SerialDriver):
+    """A driver of a sensor streaming its output a line at a time."""
+
+    def read(self):
+        """Read a line of incoming data from the serial port and process it.
+        :return: The published readings, None if the line held no data.
+        """
+        read_start = time.monotonic()
+        data_bytes = self.serial_port.readline()
+        read_time = time.monotonic()
+        self.metrics.read_seconds.observe(read_time - read_start)
+        if self.capture is not None:
+            self.capture.write(data_bytes, read_time)
+        return self.process_line(data_bytes, read_time)
+
+    def process_line(self, data_bytes, read_time=None):
+        """Decode a line of raw sensor output and publish the readings.
+        :param data_bytes: A line of data as read from the serial port.
+        :param read_time: time.monotonic() time the line was read, by
+        default now.
+        :return: The published readings, None if the line held no data.
+        """
+        if read_time is None:
+            read_time = time.monotonic()
+        dataline = str(data_bytes)
+        # Only process output if we have actual data in the line
+        if len(dataline) > 30:
+            self.metrics.lines_read.inc()
+            self.metrics.bytes_read.inc(len(data_bytes))
+            logging.debug('RAW data: %s %s', self.port_name, dataline)
+            return self.publish_decoded(dataline, read_time)
+        elif not data_bytes:
+            self.metrics.read_timeouts.inc()
@@ -1,9 +1,15 @@
 import logging
 import os
 import time
-from ptu300_ascii import PTU300ascii
-from windsonic_ascii import WINDSONICascii
-from ptb220_ascii import PTB220ascii
+import profiling
+import log_setup
+import metrics
+from drivers import load_driver
+from poll_scheduler import PolledDevice, PollScheduler, parse_devices
+from port_supervisor import supervisor_from_env
+from publish_queue import queue_from_env
+from serial_capture import capture_from_env
+import serial
 import paho.mqtt.client as mqtt
 
 
@@ -22,8 +28,8 @@ def on_message(mqtt_client, userdata, msg):
     # msg_in = json.loads(msg_decode)  # decode json data
 
 
-logging.basicConfig(level=logging.DEBUG)
-logging.captureWarnings(True)
+log_setup.configure()
+profiling.install()
 
 if os.getenv('ENABLE', 'false') == 'true':
     Connected = False  # global variable for the state of the connection
@@ -41,18 +47,35 @@ if os.getenv('ENABLE', 'false') == 'true':
     baud = int(os.getenv('BAUD', 9600))
     mqtt_topic = os.getenv('MQTT_TOPIC')
     mqtt_qos = int(os.getenv('MQTT_QOS', '1'))
+    metrics.start_from_env(client)
+    # The drivers publish through a bounded queue so that a slow broker
+    # does not hold up the serial reads.
+    publisher = queue_from_env(client)
 
-    if os.getenv('SENSOR') == 'ptu300':
-        if os.getenv('MODE') == 'ascii':
-            PTU300ascii(client, mqtt_topic, mqtt_qos, port, baud)
-
-    elif os.getenv('SENSOR') == 'windsonic':
-        if os.getenv('MODE') == 'ascii':
-            WINDSONICascii(client, mqtt_topic, mqtt_qos, port, baud)
-
-    elif os.getenv('SENSOR') == 'ptb220':
-        if os.getenv('MODE') == 'ascii':
-            PTB220ascii(client, mqtt_topic, mqtt_qos, port, baud)
+    if os.getenv('POLL_DEVICES'):
+        # Several addressed sensors polled on one RS-485 bus.
+        devices = []
+        for sensor, mode, address, topic in parse_devices(
+                os.getenv('POLL_DEVICES')):
+            driver = load_driver(sensor, mode)(
+                publisher, topic or '%s/%s%s' % (mqtt_topic, sensor, address),
+                mqtt_qos, port, baud, start=False)
+            devices.append(PolledDevice(address, driver))
+        scheduler = PollScheduler(
+            serial.Serial(port, baud), devices, baud,
+            interval=float(os.getenv('POLL_INTERVAL', 1.0)))
+        scheduler.start()
+    else:
+        driver = load_driver(os.getenv('SENSOR'), os.getenv('MODE', 'ascii'))(
+            publisher, mqtt_topic, mqtt_qos, port, baud, start=False,
+            capture=capture_from_env(port))
+        # Reopen the port if it fails or goes quiet, unless STALE_AFTER=0.
+        supervisor = supervisor_from_env(driver, publisher, mqtt_topic,
+                                         mqtt_qos, port, baud)
+        if supervisor is not None:
+            supervisor.start()
+        else:
+            driver.start_reader(port, baud, True)
 
     while True:
         time.sleep(1)
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The modules shared between containers, which the Dockerfiles copy in
+# beside this container's own.
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(
+    os.path.dirname(os.path.abspath(__file__)))), 'common'))
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import os
+import subprocess
+import sys
+from unittest import TestCase, mock
+from drivers import load_driver
+from ptb220_ascii import PTB220ascii
+from ptu300_ascii import PTU300ascii
+
+
+class TestDriverRegistry(TestCase):
+    """Test the lookup and lazy import of serial sensor drivers."""
+
+    def test_load_builtin_driver(self):
+        """Test that a built in driver class is returned for its sensor and
+        mode."""
+        self.assertIs(load_driver('ptu300', 'ascii'), PTU300ascii)
+
+    def test_unknown_driver(self):
+        """Test that an unknown sensor or mode raises a LookupError."""
+        with self.assertRaisesRegex(LookupError, 'No driver for sensor'):
+            load_driver('ptu300', 'binary')
+        with self.assertRaisesRegex(LookupError, 'No driver for sensor None'):
+            load_driver(None, 'ascii')
+
+    def test_only_selected_driver_imported(self):
+        """Test that loading one driver does not import the others."""
+        code = ('import sys, drivers; drivers.load_driver("ptb220"); '
+                'print(sorted(m for m in sys.modules '
+                'if m.endswith("_ascii")))')
+        # With this process's path, which includes the shared modules.
+        output = subprocess.run([sys.executable, '-c', code],
+                                capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.dirname(
+                                    os.path.abspath(__file__))),
+                                env=dict(os.environ,
+                                         PYTHONPATH=os.pathsep.join(
+                                             sys.path)))
+        self.assertEqual(output.stdout.strip(), "['ptb220_ascii']")
+
+    def test_polled_driver_rejected_by_async_runtime(self):
+        """Test that the single process runtime accepts streaming drivers
+        and rejects polled ones, which it would never read."""
+        from async_start import streaming_driver
+        self.assertIs(streaming_driver('ptu300'), PTU300ascii)
+        with self.assertRaisesRegex(ValueError, 'ptu300.modbus is polled'):
+            streaming_driver('ptu300.modbus')
+
+
+class TestMalformedFrames(TestCase):
+    """Test that malformed frames are rejected without stopping the
+    reader."""
+
+    def test_truncated_frames(self):
+        """Test that truncated PTB220 frames fail the value checks and the
+        reader loop is still rescheduled after each one."""
+        client = mock.Mock()
+        driver = PTB220ascii(client, 'metpod/ptb220', 0, 'truncated', 9600,
+                             start=False)
+        lines = [b'.P.1  1005.75 ***.* * ****** ******\r\n',
+                 b'.P.1  ***.* * ****** ****** ******\r\n',
+                 b'.P.1  1005.75 ***.* * 1005.8 1005.7 1005.7 000.F9\r\n']
+        driver.serial_port = mock.Mock()
+        driver.serial_port.readline.side_effect = lines
+        with mock.patch('serial_driver.Timer') as timer:
+            for _ in lines:
+                driver.serial_port_reader()
+        self.assertEqual(timer.call_count, len(lines))
+        self.assertEqual(driver.metrics.qc_failures.value, 2)
+        self.assertEqual(client.publish.call_count, 1)
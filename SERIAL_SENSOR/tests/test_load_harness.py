@@ -0,0 +1,36 @@
+import time
+import types
+import unittest
+from collections import deque
+from load_harness import BrokerStandIn, LineTimer
+
+
+class LineTimerTest(unittest.TestCase):
+
+    def test_partial_lines(self):
+        """Test that a partial line from a readline timeout neither counts
+        as a line nor takes the next line's send time, and that a line
+        without a send time is not timed."""
+        client = BrokerStandIn()
+
+        def process_line(data_bytes, read_time=None):
+            if data_bytes.endswith(b'\n'):
+                client.publish('load-test/ptu300', data_bytes)
+
+        driver = types.SimpleNamespace(process_line=process_line)
+        now = time.monotonic()
+        simulator = types.SimpleNamespace(send_times=deque([now - 1.0,
+                                                            now - 0.5]))
+        timer = LineTimer(driver, simulator, client)
+        driver.process_line(b'P= 1003', now)
+        driver.process_line(b'.8 hPa\r\n', now)
+        driver.process_line(b'P= 1003.9 hPa\r\n', now)
+        driver.process_line(b'P= 1004.0 hPa\r\n', now)
+        self.assertEqual(timer.lines, 3)
+        self.assertEqual(len(timer.send_to_publish), 2)
+        self.assertGreaterEqual(timer.send_to_publish[0], 1.0)
+        self.assertLess(timer.send_to_publish[1], 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
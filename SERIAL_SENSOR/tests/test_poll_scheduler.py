@@ -0,0 +1,101 @@
+import json
+import time
+import unittest
+from unittest import mock
+import serial
+from drivers import load_driver
+from poll_scheduler import PolledDevice, PollScheduler, parse_devices
+from replay import ReplayClient
+from sensor_sim import PolledBusSimulator
+
+
+class RecordingClient(ReplayClient):
+
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def publish(self, topic, payload, qos=0):
+        super().publish(topic, payload, qos)
+        self.messages.append((topic, json.loads(payload)))
+
+
+class PollSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.simulator = PolledBusSimulator(
+            {'1': 'ptu300', '2': 'ptb220'}, baud=19200, seed=1)
+        self.simulator.start()
+        self.port = serial.Serial(self.simulator.port, 19200)
+        self.client = RecordingClient()
+
+    def tearDown(self):
+        self.port.close()
+        self.simulator.close()
+
+    def device(self, sensor, address, timeout=None):
+        driver = load_driver(sensor)(self.client, 'metpod/' + sensor, 0,
+                                     self.simulator.port, 19200,
+                                     start=False)
+        return PolledDevice(address, driver, timeout)
+
+    def test_interleaved_polling(self):
+        """Test that addressed devices sharing a bus are polled in turn,
+        each response published by its own driver, and that a silent
+        device times out and is backed off."""
+        devices = [self.device('ptu300', '1'), self.device('ptb220', '2'),
+                   self.device('ptb220', '3', timeout=0.1)]
+        scheduler = PollScheduler(self.port, devices, 19200, interval=0.05)
+        scheduler.start()
+        deadline = time.monotonic() + 10
+        while scheduler.cycles < 8 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        scheduler.stop()
+
+        topics = [topic for topic, data in self.client.messages]
+        self.assertGreaterEqual(topics.count('metpod/ptu300'), 8)
+        self.assertGreaterEqual(topics.count('metpod/ptb220'), 8)
+        for topic, data in self.client.messages:
+            self.assertEqual('temperature' in data,
+                             topic == 'metpod/ptu300')
+        # The silent address was backed off rather than polled each cycle.
+        self.assertLess(self.simulator.requests['3'], 8)
+        self.assertEqual(devices[2].timeouts.value,
+                         self.simulator.requests['3'])
+        self.assertIsNotNone(devices[0].transaction)
+
+    def test_processing_survives_errors(self):
+        """Test that a response the driver fails on unexpectedly is counted
+        and the responses after it are still processed."""
+        device = self.device('ptb220', '1')
+        scheduler = PollScheduler(self.port, [device], 19200)
+        device.driver.process_line = mock.Mock(
+            side_effect=[IndexError('list index out of range'), None])
+        scheduler.responses.put((device, b'.P.1  1005.75\r\n', 0.0))
+        scheduler.responses.put((device, b'.P.1  1005.75\r\n', 0.0))
+        scheduler.run_processing()
+        self.assertEqual(device.driver.process_line.call_count, 2)
+        self.assertEqual(device.driver.metrics.processing_errors.value, 1)
+
+    def test_poll_rate_follows_baud(self):
+        """Test that the poll interval is stretched to what the bus
+        bandwidth allows."""
+        devices = [self.device('ptu300', str(address))
+                   for address in range(1, 5)]
+        self.assertEqual(PollScheduler(self.port, devices, 19200,
+                                       interval=1.0).effective_interval(),
+                         1.0)
+        slow = PollScheduler(self.port, devices, 1200, interval=1.0)
+        # 4 x (0.05 s turnaround + 88 characters at 1200 baud) / 0.8
+        self.assertAlmostEqual(slow.effective_interval(), 3.92, places=2)
+
+    def test_parse_devices(self):
+        """Test that POLL_DEVICES entries are parsed."""
+        self.assertEqual(
+            parse_devices('ptu300:1:metpod/ptu,ptb220.ascii:2'),
+            [('ptu300', 'ascii', '1', 'metpod/ptu'),
+             ('ptb220', 'ascii', '2', None)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import json
+import time
+import unittest
+from collections import namedtuple
+from unittest import mock
+from port_supervisor import PortSupervisor
+from replay import ReplayClient
+from sensor_sim import SensorSimulator
+from windsonic_framed import WINDSONICframed
+
+PortInfo = namedtuple('PortInfo', 'device serial_number')
+
+
+class RecordingClient(ReplayClient):
+
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def publish(self, topic, payload, qos=0):
+        super().publish(topic, payload, qos)
+        self.messages.append((topic, json.loads(payload)))
+
+    def states(self):
+        states = []
+        for topic, data in self.messages:
+            if topic.endswith('/health') and \
+                    (not states or states[-1] != data['state']):
+                states.append(data['state'])
+        return states
+
+    def readings(self):
+        return len([topic for topic, data in self.messages
+                    if not topic.endswith('/health')])
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+
+class PortSupervisorTest(unittest.TestCase):
+
+    def setUp(self):
+        # Distinct names keep each test's metrics apart in the registry.
+        name = self.id().rsplit('.', 1)[1]
+        self.simulator = SensorSimulator('windsonic', rate=10, baud=19200,
+                                         seed=1)
+        self.simulator.start()
+        self.ports = [PortInfo('/dev/ttyS0', None),
+                      PortInfo(self.simulator.port, 'FT1234')]
+        self.client = RecordingClient()
+        self.driver = WINDSONICframed(self.client, 'metpod/windsonic', 0,
+                                      name, 19200, start=False)
+        self.driver.wind_processor.cancel_timers()
+        patcher = mock.patch('port_supervisor.list_ports.comports',
+                             lambda: self.ports)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.supervisor = PortSupervisor(
+            self.driver, name, 19200, serial_number='FT1234',
+            client=self.client, health_topic='metpod/windsonic/health',
+            stale_after=1.0, fail_after=0.3, check_interval=0.1,
+            min_backoff=0.1)
+
+    def tearDown(self):
+        self.supervisor.stop()
+        self.driver.stop()
+        self.driver.serial_port.close()
+        self.simulator.close()
+
+    def test_adapter_reset(self):
+        """Test that when the adapter is reset and comes back as another
+        device the port is found by its serial number and reopened, with
+        the downtime counted."""
+        self.supervisor.start()
+        wait_for(lambda: self.client.readings() >= 5)
+        self.assertEqual(self.supervisor.device, self.simulator.port)
+
+        self.simulator.close()
+        self.simulator = SensorSimulator('windsonic', rate=10, baud=19200,
+                                         seed=2)
+        self.ports[1] = PortInfo(self.simulator.port, 'FT1234')
+        self.simulator.start()
+        readings = self.client.readings()
+        wait_for(lambda: self.client.readings() >= readings + 5 and
+                 self.supervisor.state == 'up')
+
+        self.assertEqual(self.client.states(),
+                         ['starting', 'up', 'down', 'up'])
+        self.assertEqual(self.supervisor.device, self.simulator.port)
+        self.assertGreaterEqual(self.supervisor.opens.value, 2)
+        health = self.supervisor.health()
+        self.assertEqual(health['state'], 'up')
+        self.assertGreater(health['downtime'], 0.2)
+
+    def test_reader_died(self):
+        """Test that a reader ended by an unhandled error is detected and
+        restarted on a new port, rather than the port reported healthy
+        while nothing reads it."""
+        self.supervisor.start()
+        wait_for(lambda: self.client.readings() >= 5)
+        read_once = self.driver.read_once
+        failures = []
+
+        def fail_once():
+            if not failures:
+                failures.append(True)
+                raise RuntimeError('reader fault')
+            return read_once()
+
+        with mock.patch('threading.excepthook'):
+            self.driver.read_once = fail_once
+            wait_for(lambda: not self.driver.reader_running())
+        self.assertEqual(failures, [True])
+        readings = self.client.readings()
+        wait_for(lambda: self.client.readings() >= readings + 5 and
+                 self.supervisor.state == 'up')
+        self.assertTrue(self.driver.reader_running())
+        self.assertEqual(self.client.states(),
+                         ['starting', 'up', 'down', 'up'])
+        self.assertGreaterEqual(self.supervisor.opens.value, 2)
+
+    def test_stale_stream(self):
+        """Test that a sensor that stops sending is detected and its port
+        reopened until data arrives again."""
+        self.supervisor.start()
+        wait_for(lambda: self.client.readings() >= 5)
+        self.simulator.stop()
+        wait_for(lambda: self.supervisor.opens.value >= 3)
+        self.assertEqual(self.supervisor.state, 'stale')
+        self.simulator.start()
+        wait_for(lambda: self.supervisor.state == 'up')
+        self.assertEqual(self.client.states(),
+                         ['starting', 'up', 'stale', 'up'])
+        self.assertGreater(self.supervisor.downtime, 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
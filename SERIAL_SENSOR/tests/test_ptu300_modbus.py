@@ -0,0 +1,84 @@
+import json
+import os
+import struct
+import unittest
+from unittest import mock
+import serial
+from drivers import load_driver
+from ptu300_modbus import PTU300modbus, frame, parse_response, read_request
+from replay import ReplayClient
+from sensor_sim import ModbusSlaveSimulator
+
+
+class RecordingClient(ReplayClient):
+
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def publish(self, topic, payload, qos=0):
+        super().publish(topic, payload, qos)
+        self.messages.append((topic, json.loads(payload)))
+
+
+class PTU300modbusTest(unittest.TestCase):
+
+    def test_frames(self):
+        """Test that requests carry the Modbus CRC and that corrupted,
+        short and exception responses are rejected."""
+        self.assertEqual(read_request(1, 0, 10),
+                         bytes.fromhex('01030000000AC5CD'))
+        response = frame(bytes((240, 3, 4)) + struct.pack('>f', 1003.8))
+        self.assertEqual(len(parse_response(response, 240, 2)), 4)
+        corrupted = response[:4] + bytes((response[4] ^ 1,)) + response[5:]
+        self.assertRaisesRegex(ValueError, 'CRC', parse_response,
+                               corrupted, 240, 2)
+        self.assertRaises(ValueError, parse_response, response[:-1], 240, 2)
+        self.assertRaisesRegex(ValueError, 'exception code 2',
+                               parse_response, frame(bytes((240, 0x83, 2))),
+                               240, 2)
+
+    def test_word_order_and_register_map(self):
+        """Test that the configured register map and word order are used
+        to decode the readings."""
+        words = [struct.pack('>f', value)
+                 for value in (17.7, 1003.8, 40.9, 4.3)]
+        data = b''.join(word[2:] + word[:2] for word in words)
+        response = frame(bytes((7, 3, len(data))) + data)
+        with mock.patch.dict(os.environ, {
+                'MODBUS_ADDRESS': '7', 'MODBUS_WORD_ORDER': 'little',
+                'MODBUS_REGISTERS':
+                    'temperature=0,pressure=2,humidity=4,dew_point=6'}):
+            driver = PTU300modbus(None, '', 0, None, None, start=False)
+        self.assertEqual(driver.data_decoder(response),
+                         (1003.8, 17.7, 4.3, 41))
+
+    def test_simulated_slave(self):
+        """Test that the driver polls a simulated slave over a PTY and
+        publishes each response."""
+        simulator = ModbusSlaveSimulator(address=240, baud=19200, seed=1)
+        simulator.start()
+        client = RecordingClient()
+        driver = load_driver('ptu300', 'modbus')(
+            client, 'metpod/ptu300', 0, simulator.port, 19200, start=False)
+        driver.serial_port = serial.Serial(simulator.port, 19200,
+                                           timeout=1.0)
+        try:
+            for _ in range(3):
+                driver.poll()
+        finally:
+            driver.serial_port.close()
+            simulator.close()
+
+        self.assertEqual(simulator.requests, 3)
+        self.assertEqual(len(client.messages), 3)
+        topic, data = client.messages[0]
+        self.assertEqual(topic, 'metpod/ptu300')
+        self.assertEqual(sorted(data)[:4], ['dew_point', 'humidity',
+                                            'pressure', 'temperature'])
+        self.assertTrue(980 <= data['pressure'] <= 1040)
+        self.assertEqual(driver.metrics.qc_failures.value, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import json
+import time
+import types
+import unittest
+from publish_queue import PublishQueue
+
+
+class SlowClient:
+    """Stands in for a paho client, which only publishes when asked."""
+
+    def __init__(self):
+        self.messages = []
+        self.on_publish = None
+
+    def publish(self, topic, payload, qos=0):
+        self.messages.append((topic, json.loads(payload), qos))
+        return types.SimpleNamespace(rc=0, mid=len(self.messages))
+
+    def send(self):
+        """Publish the messages so far, as paho's network loop would."""
+        for mid in range(len(self.messages)):
+            self.on_publish(self, None, mid + 1)
+
+
+class PublishQueueTest(unittest.TestCase):
+
+    def fill(self, publisher, count=10, topic='metpod/windsonic'):
+        for index in range(count):
+            publisher.publish(topic, json.dumps(
+                {'windspd': index, 'time': index}), 1)
+
+    def test_drop_policies(self):
+        """Test that a full queue stays at its size and drops the oldest or
+        newest message, or collapses to the latest value of each field."""
+        client = SlowClient()
+        oldest = PublishQueue(client, maxsize=4, name='oldest')
+        self.fill(oldest)
+        self.assertEqual(oldest.depth.sample(), 4)
+        self.assertEqual(oldest.dropped.value, 6)
+        newest = PublishQueue(client, maxsize=4, policy='drop-newest',
+                              name='newest')
+        self.fill(newest)
+        self.assertEqual(newest.dropped.value, 6)
+        collapse = PublishQueue(client, maxsize=4, policy='collapse',
+                                name='collapse')
+        self.fill(collapse, 3)
+        collapse.publish('metpod/ptu300', '{"pressure": 1000.0}', 1)
+        collapse.publish('metpod/ptu300', '{"temperature": 10.0}', 1)
+        self.fill(collapse, 3, 'metpod/rain')
+        self.assertEqual(collapse.collapsed.value, 3)
+        self.assertEqual(collapse.dropped.value, 1)
+
+        for publisher in (oldest, newest, collapse):
+            publisher.start()
+            publisher.stop()
+        self.assertEqual(
+            [data['windspd'] for topic, data, qos in client.messages[:8]],
+            [6, 7, 8, 9, 0, 1, 2, 3])
+        self.assertEqual(client.messages[8:], [
+            ('metpod/windsonic', {'windspd': 1, 'time': 1}, 1),
+            ('metpod/windsonic', {'windspd': 2, 'time': 2}, 1),
+            ('metpod/ptu300', {'pressure': 1000.0, 'temperature': 10.0}, 1),
+            ('metpod/rain', {'windspd': 2, 'time': 2}, 1)])
+        self.assertEqual(collapse.sent.value, 4)
+
+    def test_client_backlog(self):
+        """Test that messages are held in the queue, where the drop policy
+        applies, while the client's own queue is full."""
+        client = SlowClient()
+        publisher = PublishQueue(client, maxsize=3, max_backlog=2,
+                                 name='backlog')
+        client.on_publish = publisher.on_publish
+        publisher.start()
+        self.fill(publisher, 2)
+        while publisher.queue:
+            time.sleep(0.01)
+        self.fill(publisher, 10)
+        time.sleep(0.1)
+        self.assertEqual(len(client.messages), 2)
+        self.assertEqual(publisher.in_flight, 2)
+        self.assertEqual(publisher.depth.sample(), 3)
+        # QoS 0 messages count too, as paho calls on_publish for them.
+        publisher.publish('metpod/debug', '{"windspd": 99}', 0)
+        client.send()
+        publisher.stop()
+        self.assertEqual([data['windspd'] for topic, data, qos
+                          in client.messages], [0, 1, 8, 9, 99])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import struct
+import tempfile
+from unittest import TestCase
+from serial_capture import CaptureWriter, read_capture, capture_segments
+from ptu300_ascii import PTU300ascii
+from ptu300_modbus import PTU300modbus, frame
+from replay import ReplayClient, replay
+
+PTU300_LINE = b"P=  1003.8 hPa   T= 17.7 'C RH= 40.9 %RH TD=  4.3 'C  " \
+              b"trend=***** tend=*\r\n"
+
+
+class TestSerialCapture(TestCase):
+    """Test recording raw serial data and replaying it through a driver."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'ttyUSB0.cap')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_write_and_read_back(self):
+        """Test that records are read back in order with their times."""
+        capture = CaptureWriter(self.path, size=4096, files=2)
+        capture.write(b'first\r\n', 1.5)
+        capture.write(b'', 2.0)
+        capture.write(b'second\r\n', 2.5)
+        capture.close()
+        self.assertEqual(list(read_capture(self.path)),
+                         [(1.5, b'first\r\n'), (2.5, b'second\r\n')])
+
+    def test_rotation_caps_size(self):
+        """Test that the capture rotates over a fixed number of files,
+        keeping the most recent records."""
+        capture = CaptureWriter(self.path, size=256, files=3)
+        for number in range(100):
+            capture.write(b'%03d\r\n' % number, float(number))
+        capture.close()
+        self.assertEqual(len(capture_segments(self.path)), 3)
+        for name in os.listdir(self.directory.name):
+            self.assertEqual(
+                os.path.getsize(os.path.join(self.directory.name, name)), 256)
+        records = list(read_capture(self.path))
+        self.assertEqual(records[-1], (99.0, b'099\r\n'))
+        self.assertEqual([timestamp for timestamp, data in records],
+                         sorted(timestamp for timestamp, data in records))
+
+    def test_replay_through_driver(self):
+        """Test that a capture split across reads is decoded line by
+        line at maximum speed."""
+        capture = CaptureWriter(self.path)
+        capture.write(PTU300_LINE[:20], 0.0)
+        capture.write(PTU300_LINE[20:] + PTU300_LINE, 1.0)
+        capture.close()
+        client = ReplayClient()
+        driver = PTU300ascii(client, 'test', 0, self.path, None, start=False)
+        stats = replay(driver, read_capture(self.path), speed=0)
+        self.assertEqual(stats['lines'], 2)
+        self.assertEqual(client.published, 2)
+
+    def test_replay_modbus_capture(self):
+        """Test that a polled driver's capture is replayed one response per
+        read, whatever bytes the responses hold."""
+        data = b''.join(struct.pack('>f', value)
+                        for value in (1003.8, 17.7, 4.3, 40.9))
+        response = frame(bytes((240, 3, len(data))) + data)
+        capture = CaptureWriter(self.path)
+        capture.write(response, 0.0)
+        capture.write(response[:-1] + bytes((response[-1] ^ 1,)), 1.0)
+        capture.write(response, 2.0)
+        capture.close()
+        client = ReplayClient()
+        driver = PTU300modbus(client, 'test', 0, self.path, None,
+                              start=False)
+        stats = replay(driver, read_capture(self.path), speed=0)
+        self.assertEqual(stats['lines'], 3)
+        self.assertEqual(stats['invalid'], 1)
+        self.assertEqual(client.published, 2)
+
+    def test_replay_capture_times(self):
+        """Test that with a start time the messages are timed from the
+        capture rather than the replay."""
+        capture = CaptureWriter(self.path)
+        capture.write(PTU300_LINE, 100.0)
+        capture.write(PTU300_LINE, 160.5)
+        capture.close()
+        times = []
+        client = ReplayClient()
+        client.publish = lambda topic, payload, qos=0: times.append(
+            json.loads(payload)['time'])
+        driver = PTU300ascii(client, 'test', 0, self.path, None, start=False)
+        replay(driver, read_capture(self.path), speed=0,
+               start_time=1760000000.0)
+        self.assertEqual(len(times), 2)
+        self.assertAlmostEqual(times[0], 1760000000.0, 2)
+        self.assertAlmostEqual(times[1], 1760000060.5, 2)
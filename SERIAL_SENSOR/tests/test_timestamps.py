@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+import time
+from unittest import TestCase
+import timestamps
+from ptu300_ascii import PTU300ascii
+from replay import ReplayClient
+
+PTU300_LINE = b"P=  1003.8 hPa   T= 17.7 'C RH= 40.9 %RH TD=  4.3 'C  " \
+              b"trend=***** tend=*\r\n"
+
+
+class TestTimestamps(TestCase):
+    """Test the read times and stage timings added to readings."""
+
+    def test_read_time_published(self):
+        """Test that the wall clock time of the read, not of publishing,
+        is carried in the readings."""
+        driver = PTU300ascii(ReplayClient(), 'test', 0, 'test', None,
+                             start=False)
+        data = driver.process_line(PTU300_LINE, time.monotonic() - 2.0)
+        self.assertAlmostEqual(data['time'], time.time() - 2.0, delta=0.1)
+        self.assertEqual(data['pressure'], 1003.8)
+
+    def test_stage_timings(self):
+        """Test that stage timings are only added when enabled."""
+        now = time.monotonic()
+        self.assertNotIn('timing', timestamps.stamp({}, now, now, now))
+        timestamps.STAGE_TIMINGS = True
+        try:
+            data = timestamps.stamp({}, now - 0.5, now - 0.25, now)
+        finally:
+            timestamps.STAGE_TIMINGS = False
+        self.assertEqual(data['timing']['wait_ms'], 250.0)
+        self.assertEqual(data['timing']['decode_ms'], 250.0)
+        self.assertGreaterEqual(data['timing']['read_to_stamp_ms'], 500.0)
@@ -0,0 +1,80 @@
+import json
+import time
+import unittest
+from replay import ReplayClient
+from sensor_sim import SensorSimulator
+from windsonic_framed import WINDSONICframed, split_frames
+
+
+class RecordingClient(ReplayClient):
+
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def publish(self, topic, payload, qos=0):
+        super().publish(topic, payload, qos)
+        self.messages.append((topic, json.loads(payload)))
+
+
+class WINDSONICframedTest(unittest.TestCase):
+
+    def driver(self, client, port='test', start=False):
+        driver = WINDSONICframed(client, 'metpod/windsonic', 0, port, 19200,
+                                 start=start)
+        driver.wind_processor.cancel_timers()
+        return driver
+
+    def test_frames_split_from_stream(self):
+        """Test that Gill and NMEA frames are split from a byte stream read
+        in arbitrary pieces, and that corrupted frames and noise are
+        counted and not published."""
+        stream = (b'\x02Q,194,005.04,M,00,\x0313\r\n'
+                  b'\x02Q,19\r\n'
+                  b'$IIMWV,090,R,012.00,M,A*1A\r\n'
+                  b'\x02Q,194,009.04,M,00,\x0313\r\n'
+                  b'$IIMWV,180,R,,M,V*10\r\n'
+                  b'$IIMWV,270,R,001.60,M,A*12\r\n')
+        client = RecordingClient()
+        driver = self.driver(client, 'split')
+        for index in range(0, len(stream), 5):
+            driver.process_line(stream[index:index + 5])
+        readings = [(data['winddir'], data['windspd'])
+                    for topic, data in client.messages]
+        self.assertEqual(readings, [(194, 5), (90, 12), (270, 2)])
+        self.assertEqual(driver.frames.value, 5)
+        self.assertEqual(driver.checksum_failures.value, 1)
+        # The frame cut short, and the NMEA status V (invalid) reading.
+        self.assertEqual(driver.skipped_bytes.value, 5)
+        self.assertEqual(driver.metrics.qc_failures.value, 1)
+        self.assertEqual(driver.buffer, b'')
+
+        frames, skipped, remainder = split_frames(b'\x02Q,194,0')
+        self.assertEqual((frames, skipped, remainder),
+                         ([], 0, b'\x02Q,194,0'))
+
+    def test_high_rate_stream(self):
+        """Test that a sensor output at 10 Hz with malformed frames is read
+        without falling behind and only valid frames are published."""
+        for sensor in ('windsonic', 'windsonic_nmea'):
+            simulator = SensorSimulator(sensor, rate=10, baud=19200,
+                                        malformed=0.2, seed=2)
+            client = RecordingClient()
+            driver = self.driver(client, simulator.port, start=True)
+            simulator.start()
+            time.sleep(2)
+            simulator.stop()
+            time.sleep(0.2)
+            driver.stop()
+            driver.serial_port.close()
+            simulator.close()
+
+            valid = simulator.sent - simulator.sent_malformed
+            self.assertGreaterEqual(simulator.sent, 18)
+            self.assertEqual(client.published, valid)
+            self.assertGreater(driver.checksum_failures.value, 0)
+            self.assertGreater(driver.frame_rate, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
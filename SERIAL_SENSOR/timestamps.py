@@ -0,0 +1,40 @@
+"""Timestamps carried in every published message.
+
+Lines are timed with time.monotonic() when they are read from the serial
+port. The wall clock time of the read is added to the readings as 'time'
+(UNIX seconds) so that broker and network delays do not distort the time
+series. With STAGE_TIMINGS=true the time spent in each stage, in
+milliseconds, is added as 'timing'.
+"""
+import os
+import time
+
+STAGE_TIMINGS = os.getenv('STAGE_TIMINGS', 'false') == 'true'
+
+
+def wall_time(monotonic_time):
+    """Convert a time.monotonic() time to a UNIX time.
+    :param monotonic_time: The time.monotonic() time.
+    :return: Seconds since the epoch.
+    """
+    return time.time() - (time.monotonic() - monotonic_time)
+
+
+def stamp(data, read_time, decode_start, decode_end):
+    """Add the read time, and optionally the stage timings, to readings.
+    :param data: The readings dict to be published.
+    :param read_time: time.monotonic() time the line was read.
+    :param decode_start: time.monotonic() time decoding started.
+    :param decode_end: time.monotonic() time decoding finished.
+    :return: The readings dict.
+    """
+    data['time'] = round(wall_time(read_time), 3)
+    if STAGE_TIMINGS:
+        data['timing'] = {
+            'wait_ms': round((decode_start - read_time) * 1000, 3),
+            'decode_ms': round((decode_end - decode_start) * 1000, 3),
+            # Any wait in the publish queue comes after this.
+            'read_to_stamp_ms': round(
+                (time.monotonic() - read_time) * 1000, 3),
+        }
+    return data
@@ -1,6 +1,6 @@
 #!/usr/bin/python3
 import math
-from threading import Timer
+import time
 
 
 class WindProcessor:
@@ -46,8 +46,25 @@ class WindProcessor:
         #     self.set_2min_flag, IntervalTrigger(minutes=2))
         # scheduler.start()
 
-        Timer(180, self.set_2min_flag).start()
-        Timer(600, self.set_10min_flag).start()
+        # The startup flags are set by the thread processing the readings
+        # once these monotonic times have passed, rather than by timer
+        # threads, so that thread is the only one changing the state.
+        start = time.monotonic()
+        self.flag_deadlines = [(start + 180, self.set_2min_flag),
+                               (start + 600, self.set_10min_flag)]
+
+    def cancel_timers(self):
+        """Cancel the startup flag deadlines, e.g. when replaying captured
+        data where the flags are set from the capture timestamps instead."""
+        self.flag_deadlines = []
+
+    def check_flag_deadlines(self):
+        """Set each startup flag, once only, when its deadline has passed.
+        """
+        if self.flag_deadlines and \
+                time.monotonic() >= self.flag_deadlines[0][0]:
+            deadline, set_flag = self.flag_deadlines.pop(0)
+            set_flag()
 
     def set_10min_flag(self):
         """Set the 10 min flag to True when 10 minutes have elapsed
@@ -68,6 +85,7 @@ class WindProcessor:
         speed and max gust. Values will be None if the 10 minutes have not
         elapsed since startup.
         """
+        self.check_flag_deadlines()
         if winddir is None or windspeed is None:
             self.flag10min = False
             self.wind_gust_10min = None
@@ -175,6 +193,7 @@ class WindProcessor:
         :return: A list containing the 2 minute mean wind direction,
         speed and max gust. Values will be None if the 2 minutes have not
         elapsed since startup."""
+        self.check_flag_deadlines()
         if winddir is None or windspeed is None:
             self.flag2min = False
             self.wind_gust_2min = None
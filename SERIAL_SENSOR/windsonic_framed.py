@@ -0,0 +1,209 @@
+"""Gill WindSonic read as a framed byte stream, for high output rates.
+
+The serial port is read continuously on its own thread rather than a line a
+second, and the bytes read are split into frames on their delimiters rather
+than on line ends:
+
+Gill ASCII  <STX>Q,194,005.04,M,00,<ETX>13  (checksum after ETX)
+NMEA        $IIMWV,194,R,005.04,M,A*1D      (checksum after '*')
+
+Each checksum, the XOR of the bytes between the delimiters as two hex
+digits, is verified before the fields are decoded from the bytes, so
+corrupted frames are counted and dropped instead of published. Bytes outside
+any complete frame (noise, frames cut short) are counted and skipped. Both
+formats are accepted on the same port, so the sensor's output format may be
+changed without reconfiguring the driver.
+"""
+import os
+import re
+import time
+import logging
+import threading
+import serial
+import metrics
+from windsonic_ascii import WINDSONICascii
+
+FRAME_PATTERN = re.compile(
+    rb'\x02([^\x02\x03$\r\n]*)\x03([0-9A-Fa-f]{2})'
+    rb'|\$([^\x02$*\r\n]*)\*([0-9A-Fa-f]{2})')
+# Possible start of a frame not yet complete at the end of the buffer.
+FRAME_START = re.compile(rb'[\x02$][^\x02$\r\n]*\Z')
+MAX_FRAME = 128
+
+
+def checksum(body):
+    """XOR of the bytes of a frame body."""
+    value = 0
+    for byte in body:
+        value ^= byte
+    return value
+
+
+def split_frames(buffer):
+    """Split complete frames from the start of a buffer.
+    :param buffer: Bytes read from the port, following any earlier
+    remainder.
+    :return: A list of (body, checksum, nmea) tuples, the number of bytes
+    skipped outside frames and the remainder to keep for the next read.
+    """
+    frames = []
+    skipped = 0
+    position = 0
+    for match in FRAME_PATTERN.finditer(buffer):
+        skipped += match.start() - position
+        position = match.end()
+        if match.group(1) is not None:
+            frames.append((match.group(1), match.group(2), False))
+        else:
+            frames.append((match.group(3), match.group(4), True))
+    partial = FRAME_START.search(buffer, position)
+    end = partial.start() if partial is not None and \
+        len(buffer) - partial.start() < MAX_FRAME else len(buffer)
+    # Line ends after frames are expected, not skipped data.
+    skipped += len(buffer[position:end].strip(b'\r\n'))
+    return frames, skipped, buffer[end:]
+
+
+def decode_fields(body, nmea):
+    """Decode the wind direction and speed from a frame body.
+    :param body: The bytes between the frame delimiters.
+    :param nmea: True for an NMEA MWV sentence, False for Gill ASCII.
+    :return: direction (degrees), speed (in the configured units).
+    :raise: ValueError if the frame is not a valid wind reading.
+    """
+    fields = body.split(b',')
+    if nmea:
+        # IIMWV,<direction>,R,<speed>,<units>,<A valid|V invalid>
+        if len(fields) != 6 or not fields[0].endswith(b'MWV'):
+            raise ValueError('Unexpected NMEA sentence ' + str(body))
+        if fields[5] != b'A':
+            raise ValueError('WindSonic NMEA status ' + str(fields[5]))
+        direction, speed = fields[1], fields[3]
+    else:
+        # <node>,<direction>,<speed>,<units>,<status>,
+        if len(fields) != 6:
+            raise ValueError('Unexpected WindSonic frame ' + str(body))
+        if fields[4] != b'00':
+            raise ValueError('WindSonic status ' + str(fields[4]))
+        direction, speed = fields[1], fields[2]
+    # The direction is left empty when it is too calm to measure.
+    return float(direction or 0), float(speed)
+
+
+class WINDSONICframed(WINDSONICascii):
+
+    def __init__(self, client, mqtt_topic, qos, port, baud, start=True,
+                 capture=None):
+        self.buffer = b''
+        self.thread = None
+        labels = dict(sensor='windsonic', port=os.path.basename(str(port)))
+        self.frames = metrics.REGISTRY.counter(
+            'serial_frames_total', 'Complete frames read', **labels)
+        self.checksum_failures = metrics.REGISTRY.counter(
+            'serial_checksum_failures_total',
+            'Frames with a checksum mismatch', **labels)
+        self.skipped_bytes = metrics.REGISTRY.counter(
+            'serial_skipped_bytes_total',
+            'Bytes read outside any complete frame', **labels)
+        # Frames per second, exponentially weighted over about 10 seconds.
+        self.frame_rate = 0.0
+        self.rate_time = None
+        metrics.REGISTRY.gauge(
+            'serial_frames_per_second', 'Frame throughput',
+            function=lambda: round(self.frame_rate, 2), **labels)
+        super().__init__(client, mqtt_topic, qos, port, baud, start, capture)
+
+    def start_reader(self, port, baud, start):
+        """Open the serial port and start the reader thread. With
+        start=False the caller owns the port and feeds the bytes read in
+        through process_line instead."""
+        self.serial_port = None
+        if start:
+            self.serial_port = serial.Serial(port, baud, timeout=1.0)
+            logging.info('Serial port: ' + str(self.serial_port))
+            self.stopped = False
+            self.thread = threading.Thread(target=self.serial_port_reader,
+                                           daemon=True)
+            self.thread.start()
+
+    def read(self):
+        """Read whatever has arrived on the serial port, waiting up to the
+        port timeout for the first byte, and process it.
+        :return: A list of the readings published from the valid frames.
+        """
+        read_start = time.monotonic()
+        data_bytes = self.serial_port.read(self.serial_port.in_waiting or 1)
+        read_time = time.monotonic()
+        self.metrics.read_seconds.observe(read_time - read_start)
+        if self.capture is not None:
+            self.capture.write(data_bytes, read_time)
+        return self.process_line(data_bytes, read_time)
+
+    def serial_port_reader(self):
+        """Read the serial port continuously until stopped."""
+        while not self.stopped:
+            if not self.read_once():
+                time.sleep(1)
+
+    def reader_running(self):
+        return not self.stopped and self.thread is not None and \
+            self.thread.is_alive()
+
+    def stop(self):
+        super().stop()
+        if self.thread is not None:
+            self.thread.join()
+
+    def process_line(self, data_bytes, read_time=None):
+        """Split raw sensor output into frames and publish the readings of
+        each valid one. Any bytes may be passed, whole lines or not; an
+        incomplete frame is kept until the rest is read.
+        :param data_bytes: Data as read from the serial port.
+        :param read_time: time.monotonic() time the data was read, by
+        default now.
+        :return: A list of the readings published from the valid frames.
+        """
+        if read_time is None:
+            read_time = time.monotonic()
+        if not data_bytes:
+            self.metrics.read_timeouts.inc()
+            return []
+        self.metrics.bytes_read.inc(len(data_bytes))
+        frames, skipped, self.buffer = split_frames(self.buffer + data_bytes)
+        if skipped:
+            self.skipped_bytes.inc(skipped)
+        published = []
+        for body, frame_checksum, nmea in frames:
+            self.frames.inc()
+            self.metrics.lines_read.inc()
+            if checksum(body) != int(frame_checksum, 16):
+                self.checksum_failures.inc()
+                logging.warning('WindSonic checksum error: %s', body)
+                continue
+            try:
+                published.append(self.publish_frame(body, nmea, read_time))
+            except ValueError as error:
+                logging.warning('Invalid data: %s', error)
+        self.update_rate(len(frames), read_time)
+        return published
+
+    def publish_frame(self, body, nmea, read_time):
+        return self.publish_decoded(body, read_time, nmea)
+
+    def data_decoder(self, body, nmea=False):
+        """
+        Decode a frame whose checksum has been verified and check that the
+        data falls within sensible boundaries.
+        :param body: The bytes between the frame delimiters.
+        :param nmea: True for an NMEA MWV sentence, False for Gill ASCII.
+        :return: winddir, windspeed, windgust, winddir_avg10m,
+        windspeed_avg10m
+        """
+        return self.wind_readings(*decode_fields(body, nmea))
+
+    def update_rate(self, frames, now):
+        if self.rate_time is not None and now > self.rate_time:
+            weight = min(1.0, (now - self.rate_time) / 10)
+            self.frame_rate += weight * (
+                frames / (now - self.rate_time) - self.frame_rate)
+        self.rate_time = now
@@ -0,0 +1,196 @@
+"""Micro benchmarks for the hot paths of the serial sensor and rain gauge
+code: numeric extraction and decoding of each sensor's output, the rolling
+wind statistics at several window sizes, the rain rate calculation and JSON
+encoding of the published readings.
+
+Results (seconds per call, best of several repeats) are compared against a
+stored baseline and the run fails if any benchmark is slower than the
+baseline by more than the threshold, e.g.
+python benchmarks/run_benchmarks.py --threshold 0.25 --save results.json
+Baselines are machine specific; record one on the reference device with
+--update-baseline before relying on the comparison.
+"""
+import argparse
+import json
+import os
+import platform
+import struct
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'SERIAL_SENSOR'))
+sys.path.insert(0, os.path.join(ROOT, 'RAINGAUGE'))
+sys.path.insert(0, os.path.join(ROOT, 'common'))
+
+import ptb220_ascii  # noqa: E402
+import ptu300_ascii  # noqa: E402
+import ptu300_modbus  # noqa: E402
+import windsonic_ascii  # noqa: E402
+import windsonic_framed  # noqa: E402
+from rain_rate_calc import BucketTipHandler  # noqa: E402
+from wind_processor import WindProcessor  # noqa: E402
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'baseline.json')
+
+PTU300_LINE = str(b"P=  1003.8 hPa   T= 17.7 'C RH= 40.9 %RH TD=  4.3 'C  "
+                  b"trend=***** tend=*\r\n")
+PTB220_LINE = str(b'.P.1  1005.75 ***.* * 1005.8 1005.7 1005.7 000.F9\r\n')
+WINDSONIC_LINE = str(b'\x02Q,194,005.04,M,00,\x0315\r\n')
+WINDSONIC_FRAME = b'\x02Q,194,005.04,M,00,\x0313\r\n'
+PTU300_MODBUS_RESPONSE = ptu300_modbus.frame(
+    bytes((240, ptu300_modbus.READ_HOLDING_REGISTERS, 16)) +
+    struct.pack('>4f', 1003.8, 17.7, 4.3, 40.9))
+
+WIND_WINDOWS = (120, 600, 2400)
+
+
+def wind_processor(window, window_10min=None):
+    """Return a WindProcessor with full 2 and 10 minute windows of the
+    given numbers of samples (the same for both if only one is given), so
+    that each call does the same work however often it is timed."""
+    processor = WindProcessor()
+    processor.cancel_timers()
+    for sample in range(window):
+        processor.process_wind_2min(sample % 360, 10 + sample % 7)
+    for sample in range(window_10min or window):
+        processor.process_wind_10min(sample % 360, 10 + sample % 7)
+    processor.set_2min_flag()
+    processor.set_10min_flag()
+    return processor
+
+
+def benchmarks():
+    """Return a dict of benchmark name to a zero argument callable."""
+    ptu300 = ptu300_ascii.PTU300ascii(None, '', 0, None, None, start=False)
+    ptb220 = ptb220_ascii.PTB220ascii(None, '', 0, None, None, start=False)
+    windsonic = windsonic_ascii.WINDSONICascii(None, '', 0, None, None,
+                                               start=False)
+    # Running at 1 Hz, with the startup windows filled.
+    windsonic.wind_processor = wind_processor(120, 600)
+    framed = windsonic_framed.WINDSONICframed(None, '', 0, None, None,
+                                               start=False)
+    framed.wind_processor = wind_processor(120, 600)
+    modbus = ptu300_modbus.PTU300modbus(None, '', 0, None, None,
+                                        start=False)
+
+    cases = {
+        'find_numeric_data.ptu300': lambda: ptu300_ascii.find_numeric_data(
+            PTU300_LINE),
+        'find_numeric_data.windsonic':
+            lambda: windsonic_ascii.find_numeric_data(WINDSONIC_LINE),
+        'data_decoder.ptu300': lambda: ptu300.data_decoder(PTU300_LINE),
+        'data_decoder.ptu300_modbus':
+            lambda: modbus.data_decoder(PTU300_MODBUS_RESPONSE),
+        'data_decoder.ptb220': lambda: ptb220.data_decoder(PTB220_LINE),
+        'data_decoder.windsonic':
+            lambda: windsonic.data_decoder(WINDSONIC_LINE),
+        'split_frames.windsonic':
+            lambda: windsonic_framed.split_frames(WINDSONIC_FRAME),
+        'checksum.windsonic':
+            lambda: windsonic_framed.checksum(WINDSONIC_FRAME[1:19]),
+        'data_decoder.windsonic_framed':
+            lambda: framed.data_decoder(WINDSONIC_FRAME[1:19]),
+        'rain_rate_calc.first_tip':
+            lambda: BucketTipHandler.rain_rate_calc(1, 0.2),
+        'rain_rate_calc.slowing':
+            lambda: BucketTipHandler.rain_rate_calc(5, 0.2, 60.0, 120.0,
+                                                    30.0),
+        'json.ptu300': lambda: json.dumps(ptu300_ascii.get_readings(
+            (1003.8, 17.7, 4.3, 41))[0]),
+        'json.ptb220': lambda: json.dumps(ptb220_ascii.get_readings(
+            [1005.8])[0]),
+        'json.windsonic': lambda: json.dumps(windsonic_ascii.get_readings(
+            (194, 5, 9, 190, 6))[0]),
+    }
+    for window in WIND_WINDOWS:
+        processor = wind_processor(window)
+        cases['process_wind_2min.' + str(window)] = \
+            lambda p=processor: p.process_wind_2min(194, 12)
+        cases['process_wind_10min.' + str(window)] = \
+            lambda p=processor: p.process_wind_10min(194, 12)
+    return cases
+
+
+def run(number=None, repeat=7, selected=None):
+    """Time every benchmark.
+    :param number: Calls per timing, by default enough for 0.2 seconds.
+    :param repeat: Number of timings, the best is kept.
+    :param selected: Optional benchmark name prefix to run only some.
+    :return: A dict of benchmark name to seconds per call.
+    """
+    results = {}
+    for name, function in benchmarks().items():
+        if selected and not name.startswith(selected):
+            continue
+        timer = timeit.Timer(function)
+        calls = number or timer.autorange()[0]
+        results[name] = min(timer.repeat(repeat, calls)) / calls
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Compare results against a baseline.
+    :return: A list of (name, baseline, result, change) for regressions.
+    """
+    regressions = []
+    for name, seconds in sorted(results.items()):
+        reference = baseline.get(name)
+        if reference:
+            change = seconds / reference - 1
+            if change > threshold:
+                regressions.append((name, reference, seconds, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='allowed slow down as a fraction e.g. 0.25')
+    parser.add_argument('--save', help='file to save the results to')
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--number', type=int,
+                        help='calls per timing, default automatic')
+    parser.add_argument('--select', help='only run names with this prefix')
+    args = parser.parse_args()
+
+    results = run(args.number, selected=args.select)
+    machine = platform.machine() + ' ' + platform.python_version()
+    for name, seconds in sorted(results.items()):
+        print('%-32s %10.2f us' % (name, seconds * 1e6))
+
+    if args.save:
+        with open(args.save, 'w') as results_file:
+            json.dump({'machine': machine, 'results': results}, results_file,
+                      indent=2, sort_keys=True)
+            results_file.write('\n')
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump({'machine': machine, 'results': results},
+                      baseline_file, indent=2, sort_keys=True)
+            baseline_file.write('\n')
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print('No baseline at ' + args.baseline)
+        return 0
+    with open(args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+    if baseline.get('machine') != machine:
+        print('Warning: baseline recorded on ' + str(baseline.get('machine')))
+
+    for name in sorted(set(results) - set(baseline['results'])):
+        # Not gated until the baseline is recorded again.
+        print('No baseline for ' + name)
+    regressions = compare(results, baseline['results'], args.threshold)
+    for name, reference, seconds, change in regressions:
+        print('REGRESSION %s %.2f us -> %.2f us (+%.0f%%)' % (
+            name, reference * 1e6, seconds * 1e6, change * 100))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
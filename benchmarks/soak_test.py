@@ -0,0 +1,412 @@
+"""Accelerated time soak test for thread, timer, memory and file descriptor
+leaks in the serial sensor drivers and the rain gauge.
+
+The real PTU300, PTB220 and WindSonic drivers (with their self scheduling
+serial_port_reader loops and WindProcessor startup timers) and the real
+RainGaugeSetup (with its tx_message loop and BucketTipHandler rate update
+job) run against simulated sensor output and a simulated GPIO pin, on a
+virtual clock. threading.Timer and the APScheduler scheduler are replaced by
+virtual timers on that clock, so days of operation pass in seconds while
+every timer the components create is still counted.
+
+Every virtual hour the live threads, pending timers, scheduler jobs, RSS and
+open file descriptors are sampled. After a warm up day the run fails if
+threads, timers, jobs or file descriptors rise above their warm up levels
+or RSS grows by more than --max-rss-growth MiB. The samples are written to a
+CSV file, and plotted to a PNG when matplotlib is installed, e.g.
+python benchmarks/soak_test.py --days 30 --csv soak.csv --plot soak.png
+"""
+import argparse
+import csv
+import heapq
+import itertools
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'SERIAL_SENSOR'))
+sys.path.insert(0, os.path.join(ROOT, 'RAINGAUGE'))
+sys.path.insert(0, os.path.join(ROOT, 'common'))
+
+import sensor_sim  # noqa: E402
+
+SENSORS = ('ptu300', 'ptb220', 'windsonic')
+COLUMNS = ('day', 'threads', 'timers', 'jobs', 'rss_kib', 'fds',
+           'published')
+
+
+class VirtualClock:
+    """A monotonic clock that only moves when events are run, with a queue
+    of events due at virtual times."""
+
+    def __init__(self, wall_start=1760000000.0):
+        self.wall_start = wall_start
+        self.now = 0.0
+        self.events = []
+        self.sequence = itertools.count()
+
+    def time(self):
+        return self.wall_start + self.now
+
+    def monotonic(self):
+        return self.now
+
+    perf_counter = monotonic
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+    def schedule(self, delay, callback):
+        heapq.heappush(self.events,
+                       (self.now + delay, next(self.sequence), callback))
+
+    def run_until(self, end):
+        """Run the events due up to a virtual time, in time order."""
+        while self.events and self.events[0][0] <= end:
+            due, _, callback = heapq.heappop(self.events)
+            self.now = max(self.now, due)
+            callback()
+        self.now = max(self.now, end)
+
+
+class VirtualTime(types.SimpleNamespace):
+    """Stands in for the time module of the components under test."""
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+def virtual_timer_class(clock):
+    """Return a threading.Timer replacement scheduling on a virtual clock.
+    The class counts its instances that are started and not yet run or
+    cancelled, i.e. the threads threading.Timer would have running."""
+
+    class VirtualTimer:
+        pending = 0
+
+        def __init__(self, interval, function, args=None, kwargs=None):
+            self.interval = interval
+            self.function = function
+            self.args = args or ()
+            self.kwargs = kwargs or {}
+            self.daemon = False
+            self.state = None
+
+        def start(self):
+            self.state = 'pending'
+            VirtualTimer.pending += 1
+            clock.schedule(self.interval, self.run)
+
+        def cancel(self):
+            if self.state == 'pending':
+                VirtualTimer.pending -= 1
+            self.state = 'cancelled'
+
+        def run(self):
+            if self.state != 'pending':
+                return
+            VirtualTimer.pending -= 1
+            self.state = 'finished'
+            self.function(*self.args, **self.kwargs)
+
+    return VirtualTimer
+
+
+class VirtualScheduler:
+    """Stands in for APScheduler's BackgroundScheduler as used by
+    BucketTipHandler, running interval jobs on a virtual clock."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.jobs = []
+        self.state = 'stopped'
+
+    @property
+    def running(self):
+        # As in APScheduler, a paused scheduler is still running.
+        return self.state != 'stopped'
+
+    def add_job(self, function, trigger):
+        job = {'function': function,
+               'interval': trigger.interval.total_seconds()}
+        self.jobs.append(job)
+        self.clock.schedule(job['interval'], lambda: self.run_job(job))
+        return job
+
+    def run_job(self, job):
+        if job not in self.jobs:
+            return
+        if self.state == 'running':
+            job['function']()
+        if job in self.jobs:
+            self.clock.schedule(job['interval'], lambda: self.run_job(job))
+
+    def remove_all_jobs(self):
+        self.jobs = []
+
+    def get_jobs(self):
+        return list(self.jobs)
+
+    def start(self):
+        self.state = 'running'
+
+    def pause(self):
+        self.state = 'paused'
+
+    def resume(self):
+        self.state = 'running'
+
+
+class SimulatedGPIO(types.ModuleType):
+    """Stands in for RPi.GPIO: one input pin, pulled up, whose falling
+    edge callback is triggered by tip()."""
+
+    BCM = 11
+    IN = 1
+    PUD_UP = 22
+    FALLING = 32
+
+    def __init__(self):
+        super().__init__('RPi.GPIO')
+        self.callbacks = {}
+        self.levels = {}
+
+    def setmode(self, mode):
+        pass
+
+    def setup(self, pin, direction, pull_up_down=None):
+        self.levels[pin] = 1
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        self.callbacks[pin] = callback
+
+    def input(self, pin):
+        return self.levels[pin]
+
+    def tip(self, pin, noise=False):
+        """A falling edge, held low for a bucket tip or released at once
+        for contact noise."""
+        self.levels[pin] = 1 if noise else 0
+        self.callbacks[pin](pin)
+        self.levels[pin] = 1
+
+
+class SimulatedSerial:
+    """Stands in for a serial.Serial port of a free running sensor, with
+    the next frame always waiting to be read."""
+
+    def __init__(self, frame, rng, malformed=0.01):
+        self.frame = frame
+        self.rng = rng
+        self.malformed = malformed
+
+    def readline(self):
+        frame = self.frame(self.rng)
+        if self.rng.random() < self.malformed:
+            frame = sensor_sim.malformed_frame(frame, self.rng)
+        return frame
+
+
+class CountingClient:
+    """Stands in for the MQTT client, counting the messages published."""
+
+    def __init__(self):
+        self.published = 0
+
+    def publish(self, topic, payload, qos=0):
+        self.published += 1
+
+
+def install(clock):
+    """Import the components with threading.Timer, the time module and
+    RPi.GPIO replaced by their virtual counterparts.
+    :return: The VirtualTimer class and the simulated GPIO module.
+    """
+    gpio = SimulatedGPIO()
+    rpi = types.ModuleType('RPi')
+    rpi.GPIO = gpio
+    sys.modules['RPi'] = rpi
+    sys.modules['RPi.GPIO'] = gpio
+    timer_class = virtual_timer_class(clock)
+    virtual_time = VirtualTime(time=clock.time, monotonic=clock.monotonic,
+                               perf_counter=clock.perf_counter,
+                               sleep=clock.sleep)
+    import metrics
+    import rain_gauge
+    import serial_driver
+    import timestamps
+    import wind_processor
+    for module in (metrics, rain_gauge, serial_driver, timestamps,
+                   wind_processor):
+        if hasattr(module, 'time'):
+            module.time = virtual_time
+        if hasattr(module, 'Timer'):
+            module.Timer = timer_class
+    return timer_class, gpio
+
+
+def rss_kib():
+    """Return the resident set size of this process in KiB."""
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+def schedule_rain(clock, gpio, pin, rng):
+    """Schedule the next day's rain: a few showers of bucket tips at a
+    steady rate, with the odd noise edge, then schedule the day after."""
+    for _ in range(rng.randrange(0, 4)):
+        start = rng.uniform(0, 86400)
+        interval = rng.uniform(20, 600)
+        for tip in range(rng.randrange(1, 60)):
+            clock.schedule(start + tip * interval, lambda: gpio.tip(pin))
+        clock.schedule(start + rng.uniform(0, 600),
+                       lambda: gpio.tip(pin, noise=True))
+    clock.schedule(86400, lambda: schedule_rain(clock, gpio, pin, rng))
+
+
+def soak(days, seed=1, sample_interval=3600, progress=None):
+    """Run the components for a number of virtual days.
+    :param days: Virtual days to run.
+    :param seed: Seed for the simulated sensor output and rain.
+    :param sample_interval: Virtual seconds between samples.
+    :param progress: Optional callable given each sample.
+    :return: A list of sample dicts with the COLUMNS keys.
+    """
+    clock = VirtualClock()
+    timer_class, gpio = install(clock)
+    import metrics
+    from drivers import load_driver
+    from rain_gauge import RainGaugeSetup
+    rng = random.Random(seed)
+    client = CountingClient()
+
+    for sensor in SENSORS:
+        driver = load_driver(sensor)(client, 'soak/' + sensor, 0, sensor,
+                                     9600, start=False)
+        driver.serial_port = SimulatedSerial(sensor_sim.FRAMES[sensor], rng)
+        driver.serial_port_reader()
+    # Everything runs on this thread, so without the rain state's owner.
+    rain = RainGaugeSetup(client, 'soak/raingauge', 0, owner_thread=False)
+    handler = rain.bucket_tip_handler
+    handler.rain_event_scheduler = VirtualScheduler(clock)
+    handler.tips_timer._func = clock.perf_counter
+    handler.time_since_1_5_threshold_timer._func = clock.perf_counter
+    schedule_rain(clock, gpio, rain.gpio_pin, rng)
+    metrics.publish_stats(client, 'soak/metrics', 60)
+
+    samples = []
+    for step in range(1, int(days * 86400 / sample_interval) + 1):
+        clock.run_until(step * sample_interval)
+        sample = {'day': round(clock.now / 86400, 3),
+                  'threads': threading.active_count(),
+                  'timers': timer_class.pending,
+                  'jobs': len(handler.rain_event_scheduler.get_jobs()),
+                  'rss_kib': rss_kib(),
+                  'fds': len(os.listdir('/proc/self/fd')),
+                  'published': client.published}
+        samples.append(sample)
+        if progress is not None:
+            progress(sample)
+    return samples
+
+
+def check(samples, warm_up=1.0, max_rss_growth=16.0):
+    """Check the samples after the warm up stay within bounds.
+    :param samples: Samples from soak().
+    :param warm_up: Virtual days before the bounds are set.
+    :param max_rss_growth: Allowed RSS growth after warm up in MiB.
+    :return: A list of failure descriptions, empty if all is well.
+    """
+    baseline = [sample for sample in samples if sample['day'] <= warm_up]
+    after = [sample for sample in samples if sample['day'] > warm_up]
+    if not baseline or not after:
+        return ['Run too short for a ' + str(warm_up) + ' day warm up']
+    failures = []
+    for column in ('threads', 'timers', 'jobs', 'fds'):
+        limit = max(sample[column] for sample in baseline)
+        peak = max(sample[column] for sample in after)
+        if peak > limit:
+            failures.append('%s rose to %d from %d' % (column, peak, limit))
+    growth = (after[-1]['rss_kib'] - baseline[-1]['rss_kib']) / 1024
+    if growth > max_rss_growth:
+        failures.append('RSS grew by %.1f MiB' % growth)
+    if after[-1]['published'] <= baseline[-1]['published']:
+        failures.append('Nothing published after the warm up')
+    return failures
+
+
+def write_csv(samples, path):
+    with open(path, 'w', newline='') as csv_file:
+        writer = csv.DictWriter(csv_file, COLUMNS)
+        writer.writeheader()
+        writer.writerows(samples)
+
+
+def plot(samples, path):
+    """Plot the trend of each sampled value to a PNG, if matplotlib is
+    installed.
+    :return: True if the plot was written.
+    """
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as pyplot
+    except ImportError:
+        return False
+    days = [sample['day'] for sample in samples]
+    figure, axes = pyplot.subplots(len(COLUMNS) - 1, 1, sharex=True,
+                                   figsize=(8, 12))
+    for axis, column in zip(axes, COLUMNS[1:]):
+        axis.plot(days, [sample[column] for sample in samples])
+        axis.set_ylabel(column)
+    axes[-1].set_xlabel('virtual day')
+    figure.savefig(path)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--days', type=float, default=30)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--warm-up', type=float, default=1.0,
+                        help='virtual days before the bounds are set')
+    parser.add_argument('--max-rss-growth', type=float, default=16.0,
+                        help='allowed RSS growth after warm up in MiB')
+    parser.add_argument('--csv', default='soak.csv')
+    parser.add_argument('--plot', help='PNG file for the trend plots')
+    parser.add_argument('--log-level', default='ERROR',
+                        help='log level of the components under test')
+    args = parser.parse_args()
+    # The simulated output includes malformed frames, each logged.
+    logging.basicConfig(level=args.log_level)
+
+    start = time.monotonic()
+
+    def progress(sample):
+        if sample['day'] == int(sample['day']):
+            print('day %3d  threads %d  timers %d  jobs %d  rss %d KiB  '
+                  'fds %d  published %d' % tuple(
+                      sample[column] for column in COLUMNS), flush=True)
+
+    samples = soak(args.days, args.seed, progress=progress)
+    print('%.1f virtual days in %.0f s' % (args.days,
+                                           time.monotonic() - start))
+    write_csv(samples, args.csv)
+    if args.plot and not plot(samples, args.plot):
+        print('matplotlib is not installed, no plot written')
+    failures = check(samples, args.warm_up, args.max_rss_growth)
+    for failure in failures:
+        print('FAIL ' + failure)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,160 @@
+"""Asynchronous, rate limited logging.
+
+Log records are put onto a bounded queue by the calling thread without
+being formatted, and written out by a single background listener thread,
+so the serial read and publish path never waits on stdout or the SD card.
+Records from the same logging call (e.g. the 'RAW data: %s %s' logged for
+every line) are rate limited, with the number suppressed reported on
+the next record let through.
+
+LOG_LEVEL          Level name, default INFO.
+LOG_FORMAT         'json' for one JSON object per line, default plain text.
+LOG_RATE_LIMIT     Records per call per LOG_RATE_PERIOD, 0 for no limit.
+LOG_RATE_PERIOD    Rate limit period in seconds, default 60.
+LOG_QUEUE_SIZE     Maximum records waiting to be written, default 1000.
+LOG_LEVEL_FILE     File read on SIGHUP to change the level of a running
+                   process, default /data/log_level.
+
+Shared by the SERIAL_SENSOR and RAINGAUGE containers, whose Dockerfiles copy
+common/ in beside their own modules.
+"""
+import json
+import logging
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+
+class LazyQueueHandler(QueueHandler):
+    """Queue handler that leaves formatting to the listener thread and drops
+    records rather than blocking when the queue is full."""
+
+    def __init__(self, record_queue):
+        super().__init__(record_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RateLimitFilter(logging.Filter):
+    """Let through at most `limit` records per logging call site in each
+    `period` seconds. Warnings and errors are limited in the same way, as
+    a failed sensor can produce one for every line. The call site stands
+    for the message template, which may be any object, even unhashable."""
+
+    def __init__(self, limit, period):
+        super().__init__()
+        self.limit = limit
+        self.period = period
+        # (logger name, path, line) -> [period start, count, suppressed]
+        self.templates = {}
+        # Records are filtered on every logging thread.
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if not self.limit:
+            return True
+        now = time.monotonic()
+        key = (record.name, record.pathname, record.lineno)
+        with self.lock:
+            state = self.templates.get(key)
+            if state is None or now - state[0] >= self.period:
+                suppressed = state[2] if state is not None else 0
+                self.templates[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+            if state[1] < self.limit:
+                state[1] += 1
+                return True
+            state[2] += 1
+            return False
+
+
+class JsonFormatter(logging.Formatter):
+    """Format a record as a single line JSON object."""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        if getattr(record, 'suppressed', 0):
+            entry['suppressed'] = record.suppressed
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+    def formatTime(self, record, datefmt=None):
+        return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(
+            record.created)) + '.%03dZ' % record.msecs
+
+
+class TextFormatter(logging.Formatter):
+    """The basicConfig style format, noting any suppressed records."""
+
+    def __init__(self):
+        super().__init__('%(levelname)s:%(name)s:%(message)s')
+
+    def format(self, record):
+        text = super().format(record)
+        if getattr(record, 'suppressed', 0):
+            text += ' (%d similar suppressed)' % record.suppressed
+        return text
+
+
+def set_level(level):
+    """Change the root logger level, e.g. set_level('DEBUG')."""
+    logging.getLogger().setLevel(str(level).strip().upper())
+
+
+def reload_level(signum=None, frame=None):
+    """Set the level from LOG_LEVEL_FILE, if the file exists."""
+    path = os.getenv('LOG_LEVEL_FILE', '/data/log_level')
+    try:
+        with open(path) as level_file:
+            set_level(level_file.read())
+    except (OSError, ValueError) as error:
+        logging.warning('Log level not changed: %s', error)
+
+
+def configure():
+    """Route all logging through the queue and start the listener thread.
+    Must be called from the main thread (for the SIGHUP handler).
+    :return: The QueueListener, to allow stopping it.
+    """
+    record_queue = queue.Queue(int(os.getenv('LOG_QUEUE_SIZE', 1000)))
+    handler = LazyQueueHandler(record_queue)
+    handler.addFilter(RateLimitFilter(int(os.getenv('LOG_RATE_LIMIT', 10)),
+                                      float(os.getenv('LOG_RATE_PERIOD', 60))))
+    output = logging.StreamHandler(sys.stdout)
+    if os.getenv('LOG_FORMAT', 'text') == 'json':
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(TextFormatter())
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    set_level(os.getenv('LOG_LEVEL', 'INFO'))
+    logging.captureWarnings(True)
+
+    listener = QueueListener(record_queue, output)
+    listener.start()
+    signal.signal(signal.SIGHUP, reload_level)
+    return listener
@@ -0,0 +1,233 @@
+"""Lightweight in-process metrics: counters, gauges and fixed bucket
+histograms, exposed in Prometheus text format over HTTP and periodically
+published as a JSON stats message over MQTT.
+
+Recording a sample is a plain attribute update (plus a bisect for
+histograms) with no locking, keeping the cost well under a microsecond on
+the read/publish path. Concurrent updates from different threads may very
+occasionally lose an increment, which is acceptable for monitoring.
+
+Shared by the SERIAL_SENSOR and RAINGAUGE containers, whose Dockerfiles copy
+common/ in beside their own modules.
+"""
+import json
+import logging
+import os
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Timer
+
+# Seconds, from 10 us to 5 s, suited to both decode and publish times.
+LATENCY_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01,
+                   0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+class Counter:
+    """A value that only increases e.g. lines read."""
+    kind = 'counter'
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def sample(self):
+        return self.value
+
+
+class Gauge:
+    """A value that can go up and down e.g. a queue depth. If a function is
+    given it is called to read the value when the metrics are collected."""
+    kind = 'gauge'
+
+    def __init__(self, function=None):
+        self.value = 0
+        self.function = function
+
+    def set(self, value):
+        self.value = value
+
+    def sample(self):
+        if self.function is not None:
+            return self.function()
+        return self.value
+
+
+class Histogram:
+    """Counts of observed values falling into fixed buckets."""
+    kind = 'histogram'
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def sample(self):
+        return {'count': self.count, 'sum': self.sum,
+                'buckets': dict(zip([str(bucket) for bucket in self.buckets]
+                                    + ['+Inf'], self.counts))}
+
+
+class Registry:
+    """A named collection of metrics. Each metric is identified by its name
+    and labels; asking for an existing metric returns the same object."""
+
+    def __init__(self):
+        self.metrics = {}
+        self.help = {}
+        self.lock = threading.Lock()
+
+    def get(self, metric_class, name, help_text, labels, **kwargs):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            if key not in self.metrics:
+                self.metrics[key] = metric_class(**kwargs)
+                self.help[name] = help_text
+            return self.metrics[key]
+
+    def counter(self, name, help_text, **labels):
+        return self.get(Counter, name, help_text, labels)
+
+    def gauge(self, name, help_text, function=None, **labels):
+        gauge = self.get(Gauge, name, help_text, labels)
+        if function is not None:
+            gauge.function = function
+        return gauge
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS, **labels):
+        return self.get(Histogram, name, help_text, labels, buckets=buckets)
+
+    def snapshot(self):
+        """Return the current value of every metric as a dict keyed on the
+        metric name with labels e.g. 'published_total{port="ttyUSB0"}'."""
+        with self.lock:
+            items = list(self.metrics.items())
+        return {format_name(name, labels): metric.sample()
+                for (name, labels), metric in sorted(items)}
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        with self.lock:
+            items = sorted(self.metrics.items())
+        lines = []
+        described = set()
+        for (name, labels), metric in items:
+            if name not in described:
+                described.add(name)
+                lines.append('# HELP ' + name + ' ' + self.help[name])
+                lines.append('# TYPE ' + name + ' ' + metric.kind)
+            if metric.kind == 'histogram':
+                cumulative = 0
+                bounds = [str(bucket) for bucket in metric.buckets] + ['+Inf']
+                for bound, count in zip(bounds, metric.counts):
+                    cumulative += count
+                    lines.append(format_name(
+                        name + '_bucket', labels + (('le', bound),)) + ' ' +
+                        str(cumulative))
+                lines.append(format_name(name + '_sum', labels) + ' ' +
+                             repr(metric.sum))
+                lines.append(format_name(name + '_count', labels) + ' ' +
+                             str(metric.count))
+            else:
+                lines.append(format_name(name, labels) + ' ' +
+                             str(metric.sample()))
+        return '\n'.join(lines) + '\n'
+
+
+def format_name(name, labels):
+    if not labels:
+        return name
+    return name + '{' + ','.join(
+        key + '="' + str(value) + '"' for key, value in labels) + '}'
+
+
+REGISTRY = Registry()
+
+
+class SensorMetrics:
+    """The metrics recorded by a serial sensor driver for one port."""
+
+    def __init__(self, sensor, port, registry=REGISTRY):
+        labels = dict(sensor=sensor, port=os.path.basename(str(port)))
+        self.lines_read = registry.counter(
+            'serial_lines_read_total', 'Lines read from the serial port',
+            **labels)
+        self.bytes_read = registry.counter(
+            'serial_bytes_read_total', 'Bytes read from the serial port',
+            **labels)
+        self.read_timeouts = registry.counter(
+            'serial_read_timeouts_total', 'Serial reads returning no data',
+            **labels)
+        self.read_errors = registry.counter(
+            'serial_read_errors_total', 'Serial port errors', **labels)
+        self.read_seconds = registry.histogram(
+            'serial_read_seconds', 'Time waiting for a line', **labels)
+        self.decode_seconds = registry.histogram(
+            'decode_seconds', 'Time to decode a line', **labels)
+        self.qc_failures = registry.counter(
+            'qc_failures_total', 'Lines failing the value checks',
+            **labels)
+        self.processing_errors = registry.counter(
+            'processing_errors_total',
+            'Unexpected errors processing the data read', **labels)
+        self.publish_seconds = registry.histogram(
+            'publish_seconds', 'Time to hand a message to the MQTT client',
+            **labels)
+        self.published = registry.counter(
+            'published_total', 'Messages published', **labels)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port, registry=REGISTRY):
+    """Serve the metrics at http://<host>:<port>/metrics from a daemon
+    thread."""
+    handler = type('Handler', (MetricsHandler,), {'registry': registry})
+    server = ThreadingHTTPServer(('', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logging.info('Metrics endpoint on port ' + str(port))
+    return server
+
+
+def publish_stats(client, topic, interval, qos=0, registry=REGISTRY):
+    """Publish a JSON snapshot of the metrics and schedule the next one."""
+    client.publish(topic, json.dumps(registry.snapshot()), qos)
+    timer = Timer(interval, publish_stats,
+                  (client, topic, interval, qos, registry))
+    timer.daemon = True
+    timer.start()
+
+
+def start_from_env(client):
+    """Start the metrics endpoint and stats messages configured with the
+    METRICS_PORT, METRICS_TOPIC and METRICS_INTERVAL variables."""
+    port = os.getenv('METRICS_PORT')
+    if port:
+        start_http_server(int(port))
+    topic = os.getenv('METRICS_TOPIC')
+    if topic:
+        publish_stats(client, topic, int(os.getenv('METRICS_INTERVAL', 60)))
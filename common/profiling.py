@@ -0,0 +1,194 @@
+"""On demand profiling of a running sensor process, without rebuilding the
+container. Nothing is hooked into the process until profiling is requested,
+so there is no cost while it is inactive.
+
+SIGUSR1 starts a capture lasting PROFILE_SECONDS (default 60), which samples
+the stack of every running thread each PROFILE_INTERVAL (default 0.005)
+seconds: the main thread and asyncio loop, the readers, publish and MQTT
+client threads, and the short lived Timer threads alike. Nothing is
+installed in the profiled threads, so they run unchanged and nothing is
+left behind when the capture ends. Functions shorter than the interval are
+only seen in proportion to their time, as with any sampling profiler. The
+stacks are written in collapsed format, for flamegraph.pl or speedscope,
+with a text report of the functions with the most samples.
+SIGUSR2 starts tracemalloc on first use, then on each later signal writes
+the allocation differences since the previous snapshot.
+Each dump also includes a census of the running threads. Dumps are written
+to PROFILE_DIR (default /data/profiles) e.g. kill -USR1 <pid>.
+
+Setting PROFILE_ON_START=true starts a capture, and
+TRACEMALLOC=true starts tracemalloc, as soon as the process starts.
+
+Shared by the SERIAL_SENSOR and RAINGAUGE containers, whose Dockerfiles copy
+common/ in beside their own modules.
+"""
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+profile_dir = os.getenv('PROFILE_DIR', '/data/profiles')
+capturing = False
+last_snapshot = None
+
+
+def dump_path(kind, extension):
+    os.makedirs(profile_dir, exist_ok=True)
+    return os.path.join(profile_dir, '%s-%d-%s.%s' % (
+        kind, os.getpid(), time.strftime('%Y%m%dT%H%M%S'), extension))
+
+
+def thread_census():
+    """Return a report of the running threads, grouped by name with the
+    thread names' trailing numbers removed so that e.g. a build up of
+    Timer threads stands out, followed by the stack of every thread."""
+    threads = threading.enumerate()
+    groups = Counter(thread.name.split(' (')[0].rstrip('0123456789-')
+                     for thread in threads)
+    lines = ['%d threads' % len(threads)]
+    lines += ['%6d %s' % (count, name) for name, count in
+              groups.most_common()]
+    frames = sys._current_frames()
+    for thread in threads:
+        lines.append('')
+        lines.append('%s daemon=%s' % (thread.name, thread.daemon))
+        frame = frames.get(thread.ident)
+        while frame is not None:
+            lines.append('  %s:%d %s' % (frame.f_code.co_filename,
+                                         frame.f_lineno, frame.f_code.co_name))
+            frame = frame.f_back
+    return '\n'.join(lines) + '\n'
+
+
+def write_census():
+    path = dump_path('threads', 'txt')
+    with open(path, 'w') as census_file:
+        census_file.write(thread_census())
+    return path
+
+
+def frame_name(code):
+    return '%s:%d(%s)' % (os.path.basename(code.co_filename),
+                          code.co_firstlineno, code.co_name)
+
+
+def sample_stacks(interval, deadline, stacks):
+    """Count the stack of every other thread each interval until the
+    deadline, keyed by (thread name, stack from the outermost frame)."""
+    me = threading.get_ident()
+    while time.monotonic() < deadline:
+        names = {thread.ident: thread.name.split(' (')[0].rstrip(
+            '0123456789-') for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frame_name(frame.f_code))
+                frame = frame.f_back
+            stacks[(names.get(ident, str(ident)), tuple(reversed(stack)))] \
+                += 1
+        time.sleep(interval)
+
+
+def profile_report(stacks, seconds, interval):
+    """Return a text report of the functions with the most samples on
+    the stack (total) and at the top of it (self)."""
+    total = Counter()
+    own = Counter()
+    samples = 0
+    for (thread, stack), count in stacks.items():
+        samples += count
+        for name in set(stack):
+            total[name] += count
+        if stack:
+            own[stack[-1]] += count
+    lines = ['%d stack samples over %d s every %g s' % (samples, seconds,
+                                                         interval), '',
+             '   total     self  function']
+    for name, count in total.most_common(50):
+        lines.append('%8d %8d  %s' % (count, own[name], name))
+    lines += ['', '    self  function']
+    for name, count in own.most_common(50):
+        lines.append('%8d  %s' % (count, name))
+    return '\n'.join(lines) + '\n'
+
+
+def cpu_profile(seconds, interval):
+    """Sample every thread for a number of seconds, then write the stacks
+    in collapsed (flame graph) format, a text report and a thread census.
+    """
+    global capturing
+    stacks = Counter()
+    try:
+        sample_stacks(interval, time.monotonic() + seconds, stacks)
+        path = dump_path('profile', 'folded')
+        with open(path, 'w') as folded_file:
+            for (thread, stack), count in sorted(stacks.items()):
+                folded_file.write('%s;%s %d\n' % (thread, ';'.join(stack),
+                                                  count))
+        with open(path[:-len('folded')] + 'txt', 'w') as report_file:
+            report_file.write(profile_report(stacks, seconds, interval))
+        write_census()
+        logging.info('Profile written to ' + path)
+        return path
+    finally:
+        capturing = False
+
+
+def start_cpu_profile(seconds=None, interval=None):
+    """Start sampling the stacks of every thread for a number of seconds,
+    on a thread of its own."""
+    global capturing
+    if capturing:
+        return
+    capturing = True
+    if seconds is None:
+        seconds = int(os.getenv('PROFILE_SECONDS', 60))
+    if interval is None:
+        interval = float(os.getenv('PROFILE_INTERVAL', 0.005))
+    logging.info('Profile capture started for ' + str(seconds) + ' s')
+    thread = threading.Thread(target=cpu_profile, args=(seconds, interval),
+                              name='profiler', daemon=True)
+    thread.start()
+    return thread
+
+
+def memory_snapshot():
+    """Start tracemalloc, or if already started, write the top allocation
+    differences since the previous snapshot and a thread census."""
+    global last_snapshot
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(int(os.getenv('TRACEMALLOC_FRAMES', 10)))
+        last_snapshot = tracemalloc.take_snapshot()
+        logging.info('tracemalloc started')
+        return None
+    snapshot = tracemalloc.take_snapshot()
+    path = dump_path('tracemalloc', 'txt')
+    current, peak = tracemalloc.get_traced_memory()
+    with open(path, 'w') as report_file:
+        report_file.write('traced current=%d peak=%d\n\n' % (current, peak))
+        for stat in snapshot.compare_to(last_snapshot, 'traceback')[:50]:
+            report_file.write(str(stat) + '\n')
+            for line in stat.traceback.format():
+                report_file.write(line + '\n')
+    snapshot.dump(path[:-len('txt')] + 'snapshot')
+    last_snapshot = snapshot
+    write_census()
+    logging.info('tracemalloc differences written to ' + path)
+    return path
+
+
+def install():
+    """Install the signal handlers, and start any profiling requested in
+    the environment. Must be called from the main thread."""
+    signal.signal(signal.SIGUSR1, lambda signum, frame: start_cpu_profile())
+    signal.signal(signal.SIGUSR2, lambda signum, frame: memory_snapshot())
+    if os.getenv('TRACEMALLOC', 'false') == 'true':
+        memory_snapshot()
+    if os.getenv('PROFILE_ON_START', 'false') == 'true':
+        start_cpu_profile()
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import queue
+from unittest import TestCase
+from log_setup import JsonFormatter, LazyQueueHandler, RateLimitFilter
+
+
+def make_record(msg, *args, lineno=1):
+    return logging.LogRecord('test', logging.INFO, __file__, lineno, msg,
+                             args, None)
+
+
+class TestLogSetup(TestCase):
+    """Test the rate limiting, queueing and JSON output of log records."""
+
+    def test_rate_limit_per_call_site(self):
+        """Test that each logging call site is limited separately and the
+        suppressed count is reported once the period has passed."""
+        rate_filter = RateLimitFilter(limit=2, period=60)
+        allowed = [rate_filter.filter(make_record('RAW data: %s', line))
+                   for line in range(5)]
+        self.assertEqual(allowed, [True, True, False, False, False])
+        self.assertTrue(rate_filter.filter(make_record('Other %s', 1,
+                                                       lineno=2)))
+        # Messages need not be hashable.
+        self.assertTrue(rate_filter.filter(make_record({'P': 1003.8},
+                                                       lineno=3)))
+
+        rate_filter.templates[('test', __file__, 1)][0] -= 60
+        record = make_record('RAW data: %s', 5)
+        self.assertTrue(rate_filter.filter(record))
+        self.assertEqual(record.suppressed, 3)
+
+    def test_no_limit(self):
+        """Test that a limit of zero lets every record through."""
+        rate_filter = RateLimitFilter(limit=0, period=60)
+        self.assertTrue(all(rate_filter.filter(make_record('RAW %s', line))
+                            for line in range(100)))
+
+    def test_queue_is_lazy_and_bounded(self):
+        """Test that records are queued unformatted and dropped, not
+        blocked on, when the queue is full."""
+        handler = LazyQueueHandler(queue.Queue(1))
+        handler.handle(make_record('RAW data: %s', 1))
+        handler.handle(make_record('RAW data: %s', 2))
+        record = handler.queue.get_nowait()
+        self.assertEqual((record.msg, record.args), ('RAW data: %s', (1,)))
+        self.assertEqual(handler.dropped, 1)
+
+    def test_json_format(self):
+        """Test the structured output fields."""
+        entry = json.loads(JsonFormatter().format(make_record('P=%s', 1003)))
+        self.assertEqual(entry['message'], 'P=1003')
+        self.assertEqual(entry['level'], 'INFO')
+        self.assertTrue(entry['time'].endswith('Z'))
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import timeit
+from unittest import TestCase
+from metrics import Registry
+
+
+class TestMetrics(TestCase):
+    """Test the metrics registry and its Prometheus text output."""
+
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_same_metric_returned(self):
+        """Test that a metric is shared by name and labels."""
+        counter = self.registry.counter('lines_total', 'Lines', port='a')
+        self.assertIs(
+            self.registry.counter('lines_total', 'Lines', port='a'), counter)
+        self.assertIsNot(
+            self.registry.counter('lines_total', 'Lines', port='b'), counter)
+
+    def test_render(self):
+        """Test counter, gauge and cumulative histogram bucket output."""
+        self.registry.counter('lines_total', 'Lines', port='a').inc(3)
+        self.registry.gauge('depth', 'Queue depth', function=lambda: 7)
+        histogram = self.registry.histogram('decode_seconds', 'Decode',
+                                            buckets=(0.001, 0.01))
+        histogram.observe(0.0005)
+        histogram.observe(0.005)
+        histogram.observe(1.0)
+        text = self.registry.render()
+        self.assertIn('# TYPE lines_total counter', text)
+        self.assertIn('lines_total{port="a"} 3', text)
+        self.assertIn('depth 7', text)
+        self.assertIn('decode_seconds_bucket{le="0.001"} 1', text)
+        self.assertIn('decode_seconds_bucket{le="0.01"} 2', text)
+        self.assertIn('decode_seconds_bucket{le="+Inf"} 3', text)
+        self.assertIn('decode_seconds_count 3', text)
+
+    def test_snapshot(self):
+        """Test the JSON stats snapshot keys and values."""
+        self.registry.counter('lines_total', 'Lines', port='a').inc()
+        self.assertEqual(self.registry.snapshot(),
+                         {'lines_total{port="a"}': 1})
+
+    def test_sample_overhead(self):
+        """Test that recording a sample stays in the region of a
+        microsecond (loosely bounded to allow for slow test machines)."""
+        histogram = self.registry.histogram('decode_seconds', 'Decode')
+        counter = self.registry.counter('lines_total', 'Lines')
+        calls = 100000
+        seconds = min(timeit.repeat(lambda: histogram.observe(0.002),
+                                    number=calls, repeat=3)) / calls
+        self.assertLess(seconds, 5e-6)
+        seconds = min(timeit.repeat(counter.inc, number=calls,
+                                    repeat=3)) / calls
+        self.assertLess(seconds, 5e-6)
@@ -0,0 +1,45 @@
+import os
+import shutil
+import tempfile
+import threading
+from unittest import TestCase
+import profiling
+
+
+def busy_loop(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+class TestProfiling(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.addCleanup(setattr, profiling, 'profile_dir',
+                        profiling.profile_dir)
+        profiling.profile_dir = self.directory
+
+    def test_profile_running_threads(self):
+        """Test that a capture samples threads started before it, and
+        leaves nothing installed in them afterwards."""
+        stop = threading.Event()
+        worker = threading.Thread(target=busy_loop, args=(stop,),
+                                  name='worker', daemon=True)
+        worker.start()
+        self.addCleanup(stop.set)
+        capture = profiling.start_cpu_profile(seconds=0.3, interval=0.002)
+        self.assertIsNone(profiling.start_cpu_profile(seconds=0.3))
+        capture.join()
+        self.assertFalse(profiling.capturing)
+        names = os.listdir(self.directory)
+        folded = [name for name in names if name.endswith('.folded')]
+        self.assertEqual(len(folded), 1)
+        with open(os.path.join(self.directory, folded[0])) as folded_file:
+            stacks = folded_file.read().splitlines()
+        self.assertTrue(any(line.startswith('worker;') and
+                            'busy_loop' in line for line in stacks))
+        with open(os.path.join(self.directory,
+                               folded[0][:-len('folded')] + 'txt')) as report:
+            self.assertIn('busy_loop', report.read())
+        self.assertIsNone(threading.getprofile())
@@ -7,6 +7,14 @@ if [[ ! -z $CHECK_CONN_FREQ ]]
         freq=120
 fi
 
+# link state shared with the other containers on the sensor-data volume
+if [[ ! -z $LINK_STATE_FILE ]]
+    then
+        state_file=$LINK_STATE_FILE
+    else
+        state_file=/data/link_state
+fi
+
 # allow time for existing wifi networking (if any) to be established
 # required on e.g. Balena Fin which starts up before enough time to
 # connect to existing WiFi.
@@ -17,9 +25,13 @@ while [[ true ]]; do
     wget --spider --no-check-certificate 1.1.1.1 > /dev/null 2>&1
 
     if [ $? -eq 0 ]; then
+        echo "{\"time\": $(date +%s), \"online\": true}" > $state_file.tmp
+        mv $state_file.tmp $state_file
         echo "Your device is already connected to the internet."
         echo "Skipping setting up Wifi-Connect Access Point. Will check again in $freq seconds"
     else
+        echo "{\"time\": $(date +%s), \"online\": false}" > $state_file.tmp
+        mv $state_file.tmp $state_file
         echo "Your device is already connected to the internet."
         echo "Starting up Wifi-Connect.\n Connect to the Access Point and configure the SSID and Passphrase for the network to connect to."
         DBUS_SYSTEM_BUS_ADDRESS=unix:path=/host/run/dbus/system_bus_socket /usr/src/app/wifi-connect -u /usr/src/app/ui